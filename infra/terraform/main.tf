@@ -35,6 +35,17 @@ variable "environment" {
   default     = "prod"
 }
 
+variable "embedding_dimension" {
+  description = "Titan v2 embedding size shared by the embed and search Lambdas (256, 512 or 1024)"
+  type        = number
+  default     = 1024
+
+  validation {
+    condition     = contains([256, 512, 1024], var.embedding_dimension)
+    error_message = "embedding_dimension must be 256, 512 or 1024."
+  }
+}
+
 # Data sources
 data "aws_caller_identity" "current" {}
 data "aws_region" "current" {}
@@ -193,6 +204,28 @@ resource "aws_dynamodb_table" "metadata" {
   }
 }
 
+# Shared search cache (query embeddings, search results); items expire via DynamoDB TTL
+resource "aws_dynamodb_table" "search_cache" {
+  name         = "${var.project_name}-search-cache"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "cache_key"
+
+  attribute {
+    name = "cache_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-search-cache"
+    Environment = var.environment
+  }
+}
+
 # IAM Role for Lambda
 resource "aws_iam_role" "lambda_role" {
   name                  = "${var.project_name}-lambda-role"
@@ -238,6 +271,7 @@ resource "aws_iam_role_policy" "lambda_policy" {
         Action = [
           "s3:GetObject",
           "s3:PutObject",
+          "s3:DeleteObject",
           "s3:ListBucket"
         ]
         Resource = [
@@ -252,15 +286,23 @@ resource "aws_iam_role_policy" "lambda_policy" {
         Action = [
           "dynamodb:GetItem",
           "dynamodb:PutItem",
+          "dynamodb:BatchWriteItem",
           "dynamodb:UpdateItem",
           "dynamodb:Scan",
           "dynamodb:Query"
         ]
         Resource = [
           aws_dynamodb_table.metadata.arn,
-          "${aws_dynamodb_table.metadata.arn}/index/*"
+          "${aws_dynamodb_table.metadata.arn}/index/*",
+          aws_dynamodb_table.search_cache.arn
         ]
       },
+      {
+        # Search result enrichment batch-gets metadata items the corpus cache doesn't hold
+        Effect   = "Allow"
+        Action   = ["dynamodb:BatchGetItem"]
+        Resource = aws_dynamodb_table.metadata.arn
+      },
       {
         Effect = "Allow"
         Action = [
@@ -292,8 +334,9 @@ resource "aws_lambda_function" "ingest" {
 
   environment {
     variables = {
-      RAW_BUCKET     = aws_s3_bucket.raw.id
-      METADATA_TABLE = aws_dynamodb_table.metadata.name
+      RAW_BUCKET          = aws_s3_bucket.raw.id
+      METADATA_TABLE      = aws_dynamodb_table.metadata.name
+      INGEST_PART_RECORDS = "500"
     }
   }
 
@@ -313,8 +356,11 @@ resource "aws_lambda_function" "embed" {
 
   environment {
     variables = {
-      METADATA_TABLE    = aws_dynamodb_table.metadata.name
-      EMBEDDINGS_BUCKET = aws_s3_bucket.embeddings.id
+      METADATA_TABLE        = aws_dynamodb_table.metadata.name
+      EMBEDDINGS_BUCKET     = aws_s3_bucket.embeddings.id
+      EMBED_CONCURRENCY     = "8"
+      EMBED_RATE_PER_SECOND = "50"
+      EMBEDDING_DIMENSION   = tostring(var.embedding_dimension)
     }
   }
 
@@ -334,8 +380,16 @@ resource "aws_lambda_function" "search" {
 
   environment {
     variables = {
-      METADATA_TABLE    = aws_dynamodb_table.metadata.name
-      EMBEDDINGS_BUCKET = aws_s3_bucket.embeddings.bucket
+      METADATA_TABLE           = aws_dynamodb_table.metadata.name
+      EMBEDDINGS_BUCKET        = aws_s3_bucket.embeddings.bucket
+      INDEX_CACHE_TTL_SECONDS  = "60"
+      INDEX_MODE               = "float32"
+      IVF_NPROBE               = "8"
+      CHUNK_FUSION             = "max"
+      SEARCH_MODE              = "vector"
+      SEARCH_CACHE_TABLE       = aws_dynamodb_table.search_cache.name
+      RESULT_CACHE_TTL_SECONDS = "300"
+      EMBEDDING_DIMENSION      = tostring(var.embedding_dimension)
     }
   }
 
@@ -570,6 +624,226 @@ resource "aws_lambda_permission" "eventbridge" {
   source_arn    = aws_cloudwatch_event_rule.daily_ingest.arn
 }
 
+# Scheduled compaction of the vector index's delta segments into a new base
+resource "aws_cloudwatch_event_rule" "index_compaction" {
+  name                = "${var.project_name}-index-compaction"
+  description         = "Fold vector index delta segments into a new base"
+  schedule_expression = "cron(0 4 * * ? *)" # 4 AM UTC daily, after ingest + embed
+
+  tags = {
+    Name = "${var.project_name}-index-compaction"
+  }
+}
+
+resource "aws_cloudwatch_event_target" "index_compaction" {
+  rule      = aws_cloudwatch_event_rule.index_compaction.name
+  target_id = "EmbedLambdaCompaction"
+  arn       = aws_lambda_function.embed.arn
+
+  input = jsonencode({
+    action = "compact_index"
+  })
+}
+
+resource "aws_lambda_permission" "index_compaction" {
+  statement_id  = "AllowEventBridgeCompaction"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.embed.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.index_compaction.arn
+}
+
+# Sharded embedding backfill: plan shards -> embed them in parallel (each shard
+# re-invoked until its checkpoint is complete) -> aggregate + rebuild the index.
+# Start with {"run_id": "<name>"}; starting again with the same run_id resumes.
+resource "aws_iam_role" "backfill_role" {
+  name = "${var.project_name}-backfill-role"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Action = "sts:AssumeRole"
+        Effect = "Allow"
+        Principal = {
+          Service = "states.amazonaws.com"
+        }
+      }
+    ]
+  })
+
+  tags = {
+    Name = "${var.project_name}-backfill-role"
+  }
+}
+
+resource "aws_iam_role_policy" "backfill_policy" {
+  name = "${var.project_name}-backfill-policy"
+  role = aws_iam_role.backfill_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = "lambda:InvokeFunction"
+        Resource = aws_lambda_function.embed.arn
+      }
+    ]
+  })
+}
+
+resource "aws_sfn_state_machine" "embed_backfill" {
+  name     = "${var.project_name}-embed-backfill"
+  role_arn = aws_iam_role.backfill_role.arn
+
+  definition = jsonencode({
+    StartAt = "Defaults"
+    States = {
+      # Execution input: {run_id?, cocktail_ids?, all?}; missing fields take these values
+      Defaults = {
+        Type = "Pass"
+        Parameters = {
+          "run_id.$"   = "$$.Execution.Name"
+          cocktail_ids = []
+          all          = false
+        }
+        ResultPath = "$.defaults"
+        Next       = "ApplyDefaults"
+      }
+      ApplyDefaults = {
+        Type = "Pass"
+        Parameters = {
+          "input.$" = "States.JsonMerge($.defaults, $, false)"
+        }
+        OutputPath = "$.input"
+        Next       = "PlanShards"
+      }
+      PlanShards = {
+        Type     = "Task"
+        Resource = "arn:aws:states:::lambda:invoke"
+        Parameters = {
+          FunctionName = aws_lambda_function.embed.arn
+          Payload = {
+            action           = "plan_backfill"
+            "run_id.$"       = "$.run_id"
+            "cocktail_ids.$" = "$.cocktail_ids"
+            "all.$"          = "$.all"
+          }
+        }
+        OutputPath = "$.Payload"
+        Next       = "EmbedShards"
+      }
+      EmbedShards = {
+        Type           = "Map"
+        ItemsPath      = "$.shards"
+        MaxConcurrency = 10
+        ResultPath     = "$.shard_results"
+        Iterator = {
+          StartAt = "EmbedShard"
+          States = {
+            EmbedShard = {
+              Type     = "Task"
+              Resource = "arn:aws:states:::lambda:invoke"
+              Parameters = {
+                FunctionName = aws_lambda_function.embed.arn
+                Payload = {
+                  action       = "embed_shard"
+                  "run_id.$"   = "$.run_id"
+                  "shard_id.$" = "$.shard_id"
+                }
+              }
+              ResultSelector = {
+                "shard_id.$"  = "$.Payload.shard_id"
+                "cocktails.$" = "$.Payload.cocktails"
+                "done.$"      = "$.Payload.done"
+                "skipped.$"   = "$.Payload.skipped"
+                "complete.$"  = "$.Payload.complete"
+              }
+              ResultPath = "$.summary"
+              Retry = [
+                {
+                  ErrorEquals     = ["States.ALL"]
+                  IntervalSeconds = 5
+                  MaxAttempts     = 3
+                  BackoffRate     = 2
+                }
+              ]
+              Next = "ShardComplete"
+            }
+            # Re-run an incomplete shard (out of time) while it makes progress, like run_local
+            ShardComplete = {
+              Type = "Choice"
+              Choices = [
+                {
+                  Variable      = "$.summary.complete"
+                  BooleanEquals = true
+                  Next          = "ShardDone"
+                },
+                {
+                  Variable  = "$.previous"
+                  IsPresent = false
+                  Next      = "RememberProgress"
+                },
+                {
+                  And = [
+                    {
+                      Variable          = "$.summary.done"
+                      NumericEqualsPath = "$.previous.done"
+                    },
+                    {
+                      Variable          = "$.summary.skipped"
+                      NumericEqualsPath = "$.previous.skipped"
+                    }
+                  ]
+                  Next = "ShardStalled"
+                }
+              ]
+              Default = "RememberProgress"
+            }
+            RememberProgress = {
+              Type = "Pass"
+              Parameters = {
+                "run_id.$"   = "$.run_id"
+                "shard_id.$" = "$.shard_id"
+                "previous.$" = "$.summary"
+              }
+              Next = "EmbedShard"
+            }
+            ShardStalled = {
+              Type  = "Fail"
+              Error = "BackfillShardStalled"
+              Cause = "A shard run made no progress; start again with the same run_id to resume"
+            }
+            ShardDone = {
+              Type       = "Succeed"
+              OutputPath = "$.summary"
+            }
+          }
+        }
+        Next = "FinishBackfill"
+      }
+      FinishBackfill = {
+        Type     = "Task"
+        Resource = "arn:aws:states:::lambda:invoke"
+        Parameters = {
+          FunctionName = aws_lambda_function.embed.arn
+          Payload = {
+            action     = "finish_backfill"
+            "run_id.$" = "$.run_id"
+          }
+        }
+        OutputPath = "$.Payload"
+        End        = true
+      }
+    }
+  })
+
+  tags = {
+    Name = "${var.project_name}-embed-backfill"
+  }
+}
+
 # Outputs
 output "api_endpoint" {
   description = "API Gateway endpoint"
@@ -581,6 +855,11 @@ output "cloudfront_url" {
   value       = "https://${aws_cloudfront_distribution.frontend.domain_name}"
 }
 
+output "embed_backfill_state_machine" {
+  description = "Step Functions state machine for sharded embedding backfills"
+  value       = aws_sfn_state_machine.embed_backfill.arn
+}
+
 output "raw_bucket" {
   description = "S3 raw data bucket"
   value       = aws_s3_bucket.raw.id
@@ -10,6 +10,8 @@ import os
 from typing import Dict, Any, List
 from decimal import Decimal
 
+from dynamo_scan import parallel_scan
+
 # AWS clients
 bedrock = boto3.client('bedrock-runtime', region_name='us-west-2')
 bedrock_agent = boto3.client('bedrock-agent-runtime', region_name='us-west-2')
@@ -17,6 +19,7 @@ dynamodb = boto3.resource('dynamodb')
 
 # Environment variables
 METADATA_TABLE = os.environ.get('METADATA_TABLE', 'mocktailverse-metadata')
+KEYWORD_SCAN_ATTRIBUTES = ['cocktail_id', 'name', 'category', 'enhanced_metadata', 'alcoholic', 'glass']
 # AGENT_ID = os.environ.get('AGENT_ID', 'ZG2Z7ULNLF')  # ✅ Created Bedrock Agent (disabled for testing)
 AGENT_ID = None  # Temporarily use fallback mode
 AGENT_ALIAS_ID = os.environ.get('AGENT_ALIAS_ID', 'ML3UGWXALB')  # ✅ Prod alias
@@ -262,12 +265,8 @@ def search_cocktails_tool(query: str, limit: int = 5) -> List[Dict[str, Any]]:
     """
     table = dynamodb.Table(METADATA_TABLE)
     
-    # Simple scan with filter (in production, use GSI or better search)
-    response = table.scan(
-        Limit=limit * 2  # Get more to filter
-    )
-    
-    items = response.get('Items', [])
+    # Full scan (every page, parallel segments) of just the fields matched and returned
+    items, _ = parallel_scan(table, projection=KEYWORD_SCAN_ATTRIBUTES)
     
     # Filter by query keywords
     query_lower = query.lower()
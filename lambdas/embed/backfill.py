@@ -0,0 +1,170 @@
+"""
+backfill.py — Sharded, checkpointed embedding backfill
+
+A large (re-)embed is split into shards of cocktail ids and fanned out to
+parallel workers: in AWS a Step Functions Map state invoking the embed Lambda
+once per shard, locally a thread pool (run_local). State lives in the
+embeddings bucket so any worker can stop (timeout, crash) and the next attempt
+resumes where it stopped:
+
+    backfill/<run_id>/manifest.json         shard_id -> cocktail ids (written once)
+    backfill/<run_id>/shards/<shard_id>.json
+        done        ids embedded so far, in order
+        results     per-cocktail results for those ids
+        skipped     id -> reason for ids that can never be embedded (no such cocktail)
+        complete    every id in the shard is done or skipped
+
+A worker processes its pending ids in small batches and rewrites its checkpoint
+after each one, so a retry repeats at most one batch (and with the embedding
+cache that batch costs no Bedrock calls). aggregate() folds all checkpoints into
+one summary for the coordinator.
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+BACKFILL_PREFIX = 'backfill'
+
+
+def manifest_key(run_id: str) -> str:
+    return f"{BACKFILL_PREFIX}/{run_id}/manifest.json"
+
+
+def checkpoint_key(run_id: str, shard_id: str) -> str:
+    return f"{BACKFILL_PREFIX}/{run_id}/shards/{shard_id}.json"
+
+
+def _read_json(s3, bucket: str, key: str) -> Optional[Dict[str, Any]]:
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=key)
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(obj['Body'].read())
+
+
+def _write_json(s3, bucket: str, key: str, data: Dict[str, Any]) -> None:
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(data), ContentType='application/json')
+
+
+def plan_shards(s3, bucket: str, run_id: str, cocktail_ids: List[str], shard_size: int) -> Dict[str, Any]:
+    """
+    Write the run's manifest (unless it already exists, in which case the original
+    plan is kept so a restarted run resumes the same shards). Returns the manifest.
+    """
+    existing = _read_json(s3, bucket, manifest_key(run_id))
+    if existing:
+        return existing
+    shard_size = max(1, shard_size)
+    shards = {
+        f"{index:05d}": cocktail_ids[start:start + shard_size]
+        for index, start in enumerate(range(0, len(cocktail_ids), shard_size))
+    }
+    manifest = {
+        'run_id': run_id,
+        'created_at': int(time.time()),
+        'shard_size': shard_size,
+        'cocktails': len(cocktail_ids),
+        'shards': shards
+    }
+    _write_json(s3, bucket, manifest_key(run_id), manifest)
+    return manifest
+
+
+def run_shard(
+    s3,
+    bucket: str,
+    run_id: str,
+    shard_id: str,
+    process_batch: Callable[[List[str]], Tuple[List[Dict[str, Any]], Dict[str, str]]],
+    batch_size: int = 25,
+    time_left: Callable[[], float] = None,
+    reserve_seconds: float = 30.0
+) -> Dict[str, Any]:
+    """
+    Embed the shard's pending ids with process_batch, checkpointing after each
+    batch. process_batch returns (results, skipped); skipped ids (id -> reason) are
+    recorded and never retried. Stops early once time_left() (seconds) drops under
+    reserve_seconds; the returned summary then has complete=False and the caller
+    runs it again.
+    """
+    manifest = _read_json(s3, bucket, manifest_key(run_id))
+    if manifest is None or shard_id not in manifest['shards']:
+        raise ValueError(f"Unknown backfill shard {run_id}/{shard_id}")
+    shard_ids = manifest['shards'][shard_id]
+
+    checkpoint = _read_json(s3, bucket, checkpoint_key(run_id, shard_id)) or {
+        'run_id': run_id, 'shard_id': shard_id, 'done': [], 'results': [], 'skipped': {}, 'complete': False
+    }
+    checkpoint.setdefault('skipped', {})
+    finished = set(checkpoint['done']) | set(checkpoint['skipped'])
+    pending = [cocktail_id for cocktail_id in shard_ids if cocktail_id not in finished]
+
+    for start in range(0, len(pending), max(1, batch_size)):
+        if time_left is not None and time_left() < reserve_seconds:
+            print(f"Backfill {run_id}/{shard_id}: stopping with {len(pending) - start} ids left")
+            break
+        results, skipped = process_batch(pending[start:start + batch_size])
+        checkpoint['done'].extend(result['cocktail_id'] for result in results)
+        checkpoint['results'].extend(results)
+        checkpoint['skipped'].update(skipped)
+        checkpoint['updated_at'] = int(time.time())
+        _write_json(s3, bucket, checkpoint_key(run_id, shard_id), checkpoint)
+
+    checkpoint['complete'] = len(set(checkpoint['done']) | set(checkpoint['skipped'])) >= len(shard_ids)
+    _write_json(s3, bucket, checkpoint_key(run_id, shard_id), checkpoint)
+    return {
+        'run_id': run_id,
+        'shard_id': shard_id,
+        'cocktails': len(shard_ids),
+        'done': len(checkpoint['done']),
+        'skipped': len(checkpoint['skipped']),
+        'complete': checkpoint['complete']
+    }
+
+
+def aggregate(s3, bucket: str, run_id: str) -> Dict[str, Any]:
+    """Combine every shard checkpoint of a run into one summary."""
+    manifest = _read_json(s3, bucket, manifest_key(run_id))
+    if manifest is None:
+        raise ValueError(f"Unknown backfill run {run_id}")
+    results, skipped = [], {}
+    complete_shards = 0
+    for shard_id in manifest['shards']:
+        checkpoint = _read_json(s3, bucket, checkpoint_key(run_id, shard_id)) or {}
+        results.extend(checkpoint.get('results', []))
+        skipped.update(checkpoint.get('skipped', {}))
+        complete_shards += bool(checkpoint.get('complete'))
+    return {
+        'run_id': run_id,
+        'shards': len(manifest['shards']),
+        'complete_shards': complete_shards,
+        'complete': complete_shards == len(manifest['shards']),
+        'cocktails': manifest['cocktails'],
+        'embedded': len(results),
+        'duplicates': sum(1 for result in results if result.get('is_duplicate')),
+        'skipped_ids': sorted(skipped),
+        'results': results
+    }
+
+
+def run_local(shard_ids: List[str], worker: Callable[[str], Dict[str, Any]], max_workers: int = 4) -> List[Dict[str, Any]]:
+    """
+    Local stand-in for the Step Functions Map state: run worker(shard_id) for every
+    shard on a thread pool, re-running a shard while it makes progress. Shards left
+    incomplete (out of time) come back with complete=False for a later run.
+    """
+    def until_complete(shard_id: str) -> Dict[str, Any]:
+        summary = worker(shard_id)
+        while not summary['complete']:
+            previous = summary['done'] + summary['skipped']
+            summary = worker(shard_id)
+            if summary['done'] + summary['skipped'] == previous:
+                break
+        return summary
+
+    if not shard_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(shard_ids)))) as pool:
+        return list(pool.map(until_complete, shard_ids))
@@ -0,0 +1,89 @@
+"""
+dynamo_scan.py — Complete, parallel DynamoDB scans
+
+A single table.scan() call stops at 1 MB and silently drops everything after it.
+parallel_scan() splits the table into Segment/TotalSegments parallel scan segments,
+runs them on a thread pool, follows LastEvaluatedKey in every segment, and moves
+only the projected attributes. Throughput and consumed read capacity are logged
+and returned with the items.
+
+Workers share the table's low-level client (thread-safe, unlike boto3 resources)
+and deserialize items back to the resource format (numbers as Decimal).
+
+Each Lambda is packaged on its own, so identical copies live in lambdas/search,
+lambdas/embed, lambdas/agent and lambdas/search_tool. Keep them in sync.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from boto3.dynamodb.types import TypeDeserializer
+
+SCAN_SEGMENTS = int(os.environ.get('SCAN_SEGMENTS', '4'))
+
+_deserializer = TypeDeserializer()
+
+
+def _scan_segment(client, request: Dict[str, Any], segment: int, total_segments: int) -> Dict[str, Any]:
+    """Every page of one segment: items plus scanned count, pages and capacity units."""
+    request = dict(request, Segment=segment, TotalSegments=total_segments, ReturnConsumedCapacity='TOTAL')
+    result = {'items': [], 'scanned': 0, 'pages': 0, 'capacity': 0.0}
+    while True:
+        response = client.scan(**request)
+        result['items'].extend(
+            {key: _deserializer.deserialize(value) for key, value in item.items()}
+            for item in response.get('Items', [])
+        )
+        result['scanned'] += response.get('ScannedCount', 0)
+        result['pages'] += 1
+        result['capacity'] += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0.0)
+        if 'LastEvaluatedKey' not in response:
+            return result
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def parallel_scan(
+    table,
+    projection: Optional[List[str]] = None,
+    filter_expression: Optional[str] = None,
+    segments: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Scan the whole table across `segments` parallel segments (default SCAN_SEGMENTS).
+    projection is a list of attribute names (aliased, so reserved words such as
+    'name' are fine); filter_expression is a condition string such as
+    'attribute_exists(embedding_id)'. Returns (items, stats).
+    """
+    segments = max(1, segments or SCAN_SEGMENTS)
+    request = {'TableName': table.name}
+    if projection:
+        names = {f"#p{i}": attribute for i, attribute in enumerate(projection)}
+        request['ProjectionExpression'] = ', '.join(names)
+        request['ExpressionAttributeNames'] = names
+    if filter_expression:
+        request['FilterExpression'] = filter_expression
+
+    client = table.meta.client
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        results = list(pool.map(lambda segment: _scan_segment(client, request, segment, segments), range(segments)))
+    elapsed = time.time() - start
+
+    items = [item for result in results for item in result['items']]
+    stats = {
+        'items': len(items),
+        'scanned': sum(result['scanned'] for result in results),
+        'pages': sum(result['pages'] for result in results),
+        'segments': segments,
+        'seconds': round(elapsed, 3),
+        'items_per_second': round(len(items) / elapsed, 1) if elapsed > 0 else None,
+        'consumed_capacity': round(sum(result['capacity'] for result in results), 2)
+    }
+    print(
+        f"Scanned {table.name}: {stats['items']} items ({stats['scanned']} read) in {stats['pages']} pages "
+        f"over {segments} segments, {stats['seconds']}s, {stats['items_per_second']} items/s, "
+        f"{stats['consumed_capacity']} RCU"
+    )
+    return items, stats
@@ -0,0 +1,96 @@
+"""
+embedding_cache.py — Content-addressed cache of chunk embeddings
+
+Every embedding the embed Lambda gets from Bedrock is also stored in the
+embeddings bucket under a key derived from sha256(model id, dimension,
+normalize flag, chunk text):
+
+    embedding-cache/<model id>/<dimension>/<hash[:2]>/<hash>.json
+        {"model_id", "dimension", "normalize", "embedding"}
+
+Before calling Bedrock the handler looks every chunk text up here, so re-running
+ingest + embed over unchanged recipes costs S3 GETs instead of Bedrock calls.
+A different model, dimension or normalization hashes to different keys, so
+stale vectors are never served.
+"""
+
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+CACHE_PREFIX = 'embedding-cache'
+
+
+def content_hash(model_id: str, dimension: int, text: str, normalize: bool = True) -> str:
+    """sha256 over model id, dimension, normalize flag and the exact chunk text."""
+    payload = json.dumps([model_id, dimension, normalize, text], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class EmbeddingContentCache:
+    """
+    S3-backed cache for one (model, dimension, normalize). Lookups and writes fan
+    out over max_workers threads; any read error is treated as a miss and write
+    errors are logged, so the cache can only save Bedrock calls, never fail an
+    embed run.
+    """
+
+    def __init__(self, s3, bucket: str, model_id: str, dimension: int, normalize: bool = True, max_workers: int = 16):
+        self.s3 = s3
+        self.bucket = bucket
+        self.model_id = model_id
+        self.dimension = dimension
+        self.normalize = normalize
+        self.max_workers = max(1, max_workers)
+
+    def key(self, text: str) -> str:
+        digest = content_hash(self.model_id, self.dimension, text, self.normalize)
+        return f"{CACHE_PREFIX}/{self.model_id}/{self.dimension}/{digest[:2]}/{digest}.json"
+
+    def _get(self, text: str) -> Optional[List[float]]:
+        try:
+            obj = self.s3.get_object(Bucket=self.bucket, Key=self.key(text))
+            record = json.loads(obj['Body'].read())
+        except Exception:
+            return None
+        if (record.get('model_id'), record.get('dimension'), record.get('normalize', True)) != (
+            self.model_id, self.dimension, self.normalize
+        ):
+            return None
+        return record.get('embedding')
+
+    def _put(self, item) -> bool:
+        text, embedding = item
+        try:
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=self.key(text),
+                Body=json.dumps({
+                    'model_id': self.model_id,
+                    'dimension': self.dimension,
+                    'normalize': self.normalize,
+                    'embedding': embedding
+                }),
+                ContentType='application/json'
+            )
+            return True
+        except Exception as e:
+            print(f"Error writing embedding cache entry: {str(e)}")
+            return False
+
+    def get_many(self, texts: List[str]) -> Dict[str, List[float]]:
+        """Cached embeddings for the given texts (misses are simply absent)."""
+        unique = list(dict.fromkeys(texts))
+        if not unique:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unique))) as pool:
+            found = list(pool.map(self._get, unique))
+        return {text: embedding for text, embedding in zip(unique, found) if embedding is not None}
+
+    def put_many(self, embeddings: Dict[str, List[float]]) -> int:
+        """Store new embeddings; returns how many were written."""
+        if not embeddings:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(embeddings))) as pool:
+            return sum(pool.map(self._put, embeddings.items()))
@@ -0,0 +1,188 @@
+"""
+embedding_executor.py — Concurrent Bedrock embedding under an adaptive rate limit
+
+Embeds many texts on a thread pool. Every call first takes a token from a shared
+token bucket whose refill rate adapts AIMD-style: it creeps up additively while
+calls succeed and is cut multiplicatively on ThrottlingException. Throttled calls,
+transient service errors (5xx, ServiceUnavailableException) and network failures
+(dropped connections, read timeouts) are retried with full-jitter exponential
+backoff. A text that still fails is reported per text, so
+one bad call doesn't discard the rest of the batch. The limiter is meant to live
+at module level so a warm container keeps the rate it has learned.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Optional
+
+import botocore.exceptions
+
+THROTTLE_CODES = ('ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException')
+TRANSIENT_CODES = ('ServiceUnavailableException', 'InternalServerException', 'ModelNotReadyException')
+# Network failures (no HTTP response): ConnectionError covers EndpointConnectionError and
+# ConnectTimeoutError; a connection dropped mid-request or a slow read raises the other two
+TRANSIENT_EXCEPTIONS = (
+    botocore.exceptions.ConnectionError,
+    botocore.exceptions.ConnectionClosedError,
+    botocore.exceptions.ReadTimeoutError
+)
+
+
+def is_throttle(error: Exception) -> bool:
+    """True for Bedrock/botocore throttling errors."""
+    # requests-derived botocore errors (ReadTimeoutError) carry response=None
+    code = (getattr(error, 'response', None) or {}).get('Error', {}).get('Code')
+    return code in THROTTLE_CODES
+
+
+def is_transient(error: Exception) -> bool:
+    """True for errors worth retrying as-is: throttles, 5xx and network failures."""
+    if isinstance(error, TRANSIENT_EXCEPTIONS):
+        return True
+    response = getattr(error, 'response', None) or {}
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+    return is_throttle(error) or response.get('Error', {}).get('Code') in TRANSIENT_CODES or status >= 500
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket (burst capacity, `rate` tokens per second) with AIMD rate control:
+    each success adds additive_increase / rate (about +additive_increase per second
+    at full speed); a throttle multiplies the rate by decrease_factor, at most once
+    per cooldown so one burst of concurrent throttles counts as one signal.
+    """
+
+    def __init__(
+        self,
+        rate: float = 20.0,
+        min_rate: float = 1.0,
+        max_rate: float = 100.0,
+        burst: int = 8,
+        additive_increase: float = 1.0,
+        decrease_factor: float = 0.5,
+        cooldown_seconds: float = 1.0
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = max(1, burst)
+        self.additive_increase = additive_increase
+        self.decrease_factor = decrease_factor
+        self.cooldown_seconds = cooldown_seconds
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.decreased_at = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available, then take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self) -> None:
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.additive_increase / self.rate)
+
+    def on_throttle(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if now - self.decreased_at >= self.cooldown_seconds:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self.decreased_at = now
+
+
+class EmbeddingExecutor:
+    """
+    Runs embed_fn(text) for many texts on max_workers threads, paced by the limiter.
+    Throttles and transient errors are retried (up to max_retries, full-jitter
+    backoff from backoff_base_seconds); only throttles slow the limiter down. Texts
+    that still fail get None in embed_all's result and their error in `errors`.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[str], List[float]],
+        limiter: AdaptiveRateLimiter,
+        max_workers: int = 8,
+        max_retries: int = 6,
+        backoff_base_seconds: float = 0.25,
+        backoff_max_seconds: float = 8.0
+    ):
+        self.embed_fn = embed_fn
+        self.limiter = limiter
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.lock = threading.Lock()
+        self.throttles = 0
+        self.retries = 0
+        self.errors: Dict[str, str] = {}
+        self.stats: Dict[str, Any] = {}
+
+    def _embed_one(self, text: str) -> List[float]:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                embedding = self.embed_fn(text)
+            except Exception as e:
+                if not is_transient(e) or attempt == self.max_retries:
+                    raise
+                with self.lock:
+                    if is_throttle(e):
+                        self.limiter.on_throttle()
+                        self.throttles += 1
+                    else:
+                        self.retries += 1
+                cap = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt))
+                time.sleep(random.uniform(0, cap))
+                continue
+            self.limiter.on_success()
+            return embedding
+
+    def _embed_or_record(self, text: str) -> Optional[List[float]]:
+        try:
+            return self._embed_one(text)
+        except Exception as e:
+            with self.lock:
+                self.errors[text] = str(e)
+            return None
+
+    def embed_all(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Embeddings in the same order as texts; None where a text failed (see errors)."""
+        self.throttles = self.retries = 0
+        self.errors = {}
+        if not texts:
+            self.stats = {'embeddings': 0, 'failed': 0, 'seconds': 0.0, 'embeddings_per_second': None,
+                          'throttles': 0, 'retries': 0, 'rate_limit': round(self.limiter.rate, 2)}
+            return []
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(texts))) as pool:
+            embeddings = list(pool.map(self._embed_or_record, texts))
+        elapsed = time.time() - start
+        succeeded = len(embeddings) - len(self.errors)
+        self.stats = {
+            'embeddings': succeeded,
+            'failed': len(self.errors),
+            'seconds': round(elapsed, 3),
+            'embeddings_per_second': round(succeeded / elapsed, 1) if elapsed > 0 else None,
+            'throttles': self.throttles,
+            'retries': self.retries,
+            'rate_limit': round(self.limiter.rate, 2)
+        }
+        print(
+            f"Embedded {succeeded} chunks in {self.stats['seconds']}s "
+            f"({self.stats['embeddings_per_second']}/s, {len(self.errors)} failed, {self.throttles} throttles, "
+            f"{self.retries} retried errors, rate limit now {self.stats['rate_limit']}/s)"
+        )
+        return embeddings
@@ -0,0 +1,136 @@
+"""
+fragment_builder.py — Precomputed per-cocktail response fragments
+
+The embed Lambda keeps index/fragments.json.gz in the embeddings bucket next to
+the vector and lexical indexes. For every embedded cocktail it holds:
+
+    result   the enriched search-result fields, already JSON-native (no Decimals),
+             so the search Lambda only adds relevance_score per request
+    context  the RAG prompt block body (everything after the "Cocktail N: name"
+             line), so the RAG Lambda only numbers and joins blocks
+
+Layout (gzipped JSON):
+    format_version, generation, fragments={cocktail_id: {result, context}}
+
+Keep result in sync with enriched_result() in lambdas/search/handler.py and
+context with build_context() in lambdas/rag/handler.py.
+"""
+
+import gzip
+import json
+from decimal import Decimal
+from typing import Dict, Any, List, Optional
+
+FRAGMENTS_KEY = 'index/fragments.json.gz'
+FRAGMENTS_FORMAT_VERSION = 1
+
+
+def _plain(obj: Any) -> Any:
+    """DynamoDB Decimals -> float, recursively (matches search's convert_decimal)."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, dict):
+        return {key: _plain(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_plain(value) for value in obj]
+    return obj
+
+
+def result_fragment(cocktail: Dict[str, Any]) -> Dict[str, Any]:
+    """Search-result fields for a cocktail (relevance_score is added per request)."""
+    metadata = _plain(cocktail.get('enhanced_metadata', {}))
+    if not isinstance(metadata, dict):
+        metadata = {}
+    return {
+        'cocktail_id': cocktail['cocktail_id'],
+        'name': cocktail.get('name'),
+        'category': cocktail.get('category'),
+        'alcoholic': cocktail.get('alcoholic'),
+        'glass': cocktail.get('glass'),
+        'image_url': cocktail.get('image_url'),
+        'description': metadata.get('description', ''),
+        'flavor_profile': metadata.get('flavor_profile', []),
+        'occasions': metadata.get('occasions', []),
+        'difficulty': metadata.get('difficulty', ''),
+        'prep_time_minutes': metadata.get('prep_time_minutes'),
+        'ingredients': _plain(cocktail.get('ingredients', [])),
+        'instructions': cocktail.get('instructions', '')
+    }
+
+
+def context_block(result: Dict[str, Any]) -> str:
+    """RAG context lines for one cocktail, below its "Cocktail N: name" heading."""
+    ingredients_text = ', '.join([
+        f"{ing.get('measure', '')} {ing['name']}".strip()
+        for ing in result.get('ingredients', [])
+    ])
+    return f"""Category: {result.get('category', 'Unknown')}
+Type: {result.get('alcoholic', 'Unknown')}
+Description: {result.get('description', 'No description available')}
+Ingredients: {ingredients_text}
+Instructions: {result.get('instructions', 'No instructions available')}
+Flavor Profile: {', '.join(result.get('flavor_profile', []))}
+Best for: {', '.join(result.get('occasions', []))}
+Difficulty: {result.get('difficulty', 'Unknown')}
+Preparation Time: {result.get('prep_time_minutes', 'Unknown')} minutes"""
+
+
+def cocktail_fragments(cocktail: Dict[str, Any]) -> Dict[str, Any]:
+    """Both fragments for one cocktail item."""
+    result = result_fragment(cocktail)
+    return {'result': result, 'context': context_block(result)}
+
+
+def load_fragments(s3, bucket: str) -> Optional[Dict[str, Any]]:
+    """Fetch and parse the current artifact. Returns None if it has not been built yet."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=FRAGMENTS_KEY)
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(gzip.decompress(obj['Body'].read()))
+
+
+def write_fragments(s3, bucket: str, fragments: Dict[str, Dict[str, Any]], generation: int) -> Dict[str, Any]:
+    """Upload the artifact; returns a small summary for logging/responses."""
+    body = gzip.compress(json.dumps({
+        'format_version': FRAGMENTS_FORMAT_VERSION,
+        'generation': generation,
+        'fragments': fragments
+    }, separators=(',', ':')).encode('utf-8'))
+    s3.put_object(
+        Bucket=bucket,
+        Key=FRAGMENTS_KEY,
+        Body=body,
+        ContentType='application/json',
+        ContentEncoding='gzip',
+        Metadata={'generation': str(generation), 'count': str(len(fragments))}
+    )
+    return {'fragments_key': FRAGMENTS_KEY, 'cocktails': len(fragments), 'bytes': len(body)}
+
+
+def update_fragments(
+    s3,
+    bucket: str,
+    fragments: Dict[str, Dict[str, Any]],
+    deleted_ids: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Upsert per-cocktail fragments into the existing artifact (or create it), dropping deleted_ids."""
+    existing = load_fragments(s3, bucket)
+    merged = dict(existing['fragments']) if existing else {}
+    merged.update(fragments)
+    for cocktail_id in deleted_ids or ():
+        merged.pop(cocktail_id, None)
+    generation = existing.get('generation', 0) + 1 if existing else 1
+    return write_fragments(s3, bucket, merged, generation)
+
+
+def rebuild_fragments(s3, bucket: str, cocktails: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Full rebuild from metadata items (used with rebuild_index)."""
+    existing = None
+    try:
+        existing = s3.head_object(Bucket=bucket, Key=FRAGMENTS_KEY)
+    except Exception:
+        pass
+    generation = int(existing.get('Metadata', {}).get('generation', 0)) + 1 if existing else 1
+    fragments = {cocktail['cocktail_id']: cocktail_fragments(cocktail) for cocktail in cocktails}
+    return write_fragments(s3, bucket, fragments, generation)
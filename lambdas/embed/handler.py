@@ -7,24 +7,73 @@ Trigger: Step Functions workflow after ingestion
 import json
 import boto3
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 import hashlib
+import time
 
-# AWS clients
+from botocore.config import Config
+
+from backfill import plan_shards, run_shard, aggregate, run_local
+from dynamo_scan import parallel_scan
+from embedding_cache import EmbeddingContentCache
+from embedding_executor import AdaptiveRateLimiter, EmbeddingExecutor
+from fragment_builder import cocktail_fragments, update_fragments, rebuild_fragments
+from index_builder import DuplicateIndex, append_delta, compact_index, rebuild_index
+from lexical_builder import document_terms, update_lexical_index, rebuild_lexical_index
+
+# Concurrent Bedrock calls and the adaptive rate limit (calls/second) they share
+EMBED_CONCURRENCY = int(os.environ.get('EMBED_CONCURRENCY', '8'))
+EMBED_RATE_PER_SECOND = float(os.environ.get('EMBED_RATE_PER_SECOND', '50'))
+EMBED_MAX_RATE_PER_SECOND = float(os.environ.get('EMBED_MAX_RATE_PER_SECOND', '200'))
+
+# AWS clients (Bedrock throttles, 5xx, connection and read-timeout errors are retried by
+# the embedding executor, not botocore: one attempt per call, so the limiter sees every
+# ThrottlingException)
 dynamodb = boto3.resource('dynamodb')
-bedrock = boto3.client('bedrock-runtime', region_name='us-west-2')
+bedrock = boto3.client(
+    'bedrock-runtime',
+    region_name='us-west-2',
+    config=Config(retries={'total_max_attempts': 1, 'mode': 'standard'}, max_pool_connections=EMBED_CONCURRENCY)
+)
 s3 = boto3.client('s3')
 
+# Module level so a warm container keeps the rate it has learned
+embed_rate_limiter = AdaptiveRateLimiter(
+    rate=EMBED_RATE_PER_SECOND,
+    max_rate=EMBED_MAX_RATE_PER_SECOND,
+    burst=EMBED_CONCURRENCY
+)
+
 # Environment variables
 METADATA_TABLE = os.environ.get('METADATA_TABLE', 'mocktailverse-metadata')
 EMBEDDINGS_BUCKET = os.environ.get('EMBEDDINGS_BUCKET', 'mocktailverse-embeddings')
 BEDROCK_EMBEDDING_MODEL = 'amazon.titan-embed-text-v2:0'
+# Titan v2 output size (256, 512 or 1024) and whether Bedrock unit-normalizes it.
+# Must match the search Lambda's settings; changing it re-keys the embedding cache
+# and rebuilds the packed index in the new embedding space.
+EMBEDDING_DIMENSION = int(os.environ.get('EMBEDDING_DIMENSION', '1024'))
+EMBEDDING_NORMALIZE = os.environ.get('EMBEDDING_NORMALIZE', 'true').lower() == 'true'
+if EMBEDDING_DIMENSION not in (256, 512, 1024):
+    raise ValueError(f"EMBEDDING_DIMENSION must be 256, 512 or 1024, got {EMBEDDING_DIMENSION}")
+# Primary-chunk cosine similarity above which a cocktail is flagged as a near-duplicate
+DUPLICATE_THRESHOLD = float(os.environ.get('DUPLICATE_THRESHOLD', '0.95'))
+# Backfill: cocktails per shard (one worker invocation each) and per checkpoint
+BACKFILL_SHARD_SIZE = int(os.environ.get('BACKFILL_SHARD_SIZE', '200'))
+BACKFILL_BATCH_SIZE = int(os.environ.get('BACKFILL_BATCH_SIZE', '25'))
+BACKFILL_LOCAL_WORKERS = int(os.environ.get('BACKFILL_LOCAL_WORKERS', '4'))
 
 
 def lambda_handler(event, context):
     """
     Generate embeddings for cocktails
     """
+    if event.get('action') == 'compact_index':
+        # Scheduled: fold delta segments into a new base index
+        return compact_index(s3, EMBEDDINGS_BUCKET, BEDROCK_EMBEDDING_MODEL, EMBEDDING_DIMENSION)
+    if event.get('action'):
+        # Sharded backfill steps raise on failure so Step Functions can retry them
+        return backfill_handler(event, context)
+    
     try:
         # Get cocktail IDs to process
         cocktail_ids = event.get('cocktail_ids', [])
@@ -33,17 +82,28 @@ def lambda_handler(event, context):
             # Process all cocktails without embeddings
             cocktail_ids = get_unembedded_cocktails()
         
-        results = []
-        for cocktail_id in cocktail_ids:
-            result = process_cocktail_embedding(cocktail_id)
-            results.append(result)
+        # Whole indexed corpus + this batch, loaded once for every duplicate check
+        duplicates = DuplicateIndex.load(s3, EMBEDDINGS_BUCKET, DUPLICATE_THRESHOLD)
+        cocktails, missing = load_cocktails(cocktail_ids)
+        results, failed, embedding_stats = process_cocktail_embeddings(cocktails, duplicates)
+        index_records = [result.pop('index_record') for result in results]
+        
+        # Fold the new vectors into the packed index the search Lambda reads
+        index_summary = refresh_vector_index(
+            index_records, rebuild=event.get('rebuild_index', False), deleted_ids=missing
+        )
         
         return {
             'statusCode': 200,
             'body': json.dumps({
-                'message': f'Generated embeddings for {len(results)} cocktails',
+                'message': f'Generated embeddings for {len(results)} cocktails, {len(failed)} failed, '
+                           f'{len(missing)} not found',
                 'count': len(results),
-                'results': results
+                'results': results,
+                'failed': failed,
+                'missing': missing,
+                'embedding': embedding_stats,
+                'index': index_summary
             })
         }
     
@@ -55,50 +115,220 @@ def lambda_handler(event, context):
         }
 
 
+def backfill_handler(event, context) -> Dict[str, Any]:
+    """
+    Sharded backfill, one step per action (Step Functions: plan -> Map over shards
+    -> finish; the plain 'backfill' action runs all three in-process on a thread
+    pool). Re-running with the same run_id resumes from the shard checkpoints.
+    Workers leave the packed index alone (concurrent read-modify-writes would race);
+    finish_backfill rebuilds it once every shard is complete.
+    """
+    action = event['action']
+    run_id = event.get('run_id') or f"backfill-{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}"
+    
+    if action in ('plan_backfill', 'backfill'):
+        # all: re-embed the whole corpus (e.g. a model change); default: only the unembedded
+        if event.get('all'):
+            cocktail_ids = get_cocktail_ids()
+        else:
+            cocktail_ids = event.get('cocktail_ids') or get_unembedded_cocktails()
+        manifest = plan_shards(
+            s3, EMBEDDINGS_BUCKET, run_id, cocktail_ids, event.get('shard_size', BACKFILL_SHARD_SIZE)
+        )
+        print(f"Backfill {run_id}: {manifest['cocktails']} cocktails in {len(manifest['shards'])} shards")
+        if action == 'plan_backfill':
+            return {
+                'run_id': run_id,
+                'cocktails': manifest['cocktails'],
+                'shards': [{'run_id': run_id, 'shard_id': shard_id} for shard_id in manifest['shards']]
+            }
+        run_local(
+            list(manifest['shards']),
+            lambda shard_id: embed_shard(run_id, shard_id, context),
+            event.get('workers', BACKFILL_LOCAL_WORKERS)
+        )
+        return finish_backfill(run_id)
+    
+    if action == 'embed_shard':
+        return embed_shard(run_id, event['shard_id'], context)
+    
+    if action == 'finish_backfill':
+        return finish_backfill(run_id)
+    
+    raise ValueError(f"Unknown action: {action}")
+
+
+def embed_shard(run_id: str, shard_id: str, context=None) -> Dict[str, Any]:
+    """
+    Backfill worker: embed one shard's pending cocktails, checkpointing per batch and
+    stopping while there is still time to write the checkpoint
+    """
+    duplicates = DuplicateIndex.load(s3, EMBEDDINGS_BUCKET, DUPLICATE_THRESHOLD)
+    failed = {}
+    
+    def process_batch(cocktail_ids: List[str]) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        cocktails, missing = load_cocktails(cocktail_ids)
+        results, batch_failed, _ = process_cocktail_embeddings(cocktails, duplicates)
+        failed.update(batch_failed)
+        for result in results:
+            result.pop('index_record')
+        return results, {cocktail_id: 'not found' for cocktail_id in missing}
+    
+    time_left = (lambda: context.get_remaining_time_in_millis() / 1000) if context else None
+    summary = run_shard(
+        s3, EMBEDDINGS_BUCKET, run_id, shard_id, process_batch,
+        batch_size=BACKFILL_BATCH_SIZE, time_left=time_left
+    )
+    print(f"Backfill {run_id}/{shard_id}: {summary['done']}/{summary['cocktails']} done, {summary['skipped']} skipped")
+    if failed:
+        # Successes are checkpointed and their embeddings cached; the retry redoes only these
+        raise RuntimeError(f"Backfill {run_id}/{shard_id}: embedding failed for {len(failed)} cocktails")
+    return summary
+
+
+def finish_backfill(run_id: str) -> Dict[str, Any]:
+    """
+    Aggregate shard checkpoints; once all are complete, rebuild the packed index,
+    lexical index and fragments from the stored embeddings
+    """
+    summary = aggregate(s3, EMBEDDINGS_BUCKET, run_id)
+    # Per-cocktail results stay in the checkpoints (Step Functions payloads are capped)
+    duplicates = [result['cocktail_id'] for result in summary.pop('results') if result.get('is_duplicate')]
+    summary['duplicate_ids'] = duplicates
+    summary['index'] = refresh_vector_index([], rebuild=True) if summary['complete'] else {'updated': False}
+    print(f"Backfill {run_id}: {summary['embedded']}/{summary['cocktails']} embedded, "
+          f"{len(summary['skipped_ids'])} skipped, {summary['complete_shards']}/{summary['shards']} shards complete")
+    return summary
+
+
+def get_cocktail_ids() -> List[str]:
+    """
+    Every cocktail id in the metadata table (ids only); anything else in the
+    embeddings bucket belongs to a deleted cocktail
+    """
+    items, _ = parallel_scan(dynamodb.Table(METADATA_TABLE), projection=['cocktail_id'])
+    return [item['cocktail_id'] for item in items]
+
+
 def get_unembedded_cocktails() -> List[str]:
     """
     Get cocktails that don't have embeddings yet
     """
     table = dynamodb.Table(METADATA_TABLE)
     
-    # Scan for items without embedding_id
-    response = table.scan(
-        FilterExpression='attribute_not_exists(embedding_id)'
+    # Scan for items without embedding_id (every page, ids only)
+    items, _ = parallel_scan(
+        table,
+        projection=['cocktail_id'],
+        filter_expression='attribute_not_exists(embedding_id)'
     )
     
-    return [item['cocktail_id'] for item in response.get('Items', [])]
+    return [item['cocktail_id'] for item in items]
 
 
-def process_cocktail_embedding(cocktail_id: str) -> Dict[str, Any]:
+def get_embedded_cocktails() -> List[Dict[str, Any]]:
     """
-    Generate and store embedding for a cocktail
+    All cocktails that already have embeddings, with the fields the lexical index and
+    response fragments read
     """
-    # Get cocktail metadata
     table = dynamodb.Table(METADATA_TABLE)
-    response = table.get_item(Key={'cocktail_id': cocktail_id})
+    items, _ = parallel_scan(
+        table,
+        projection=[
+            'cocktail_id', 'name', 'category', 'alcoholic', 'glass', 'image_url',
+            'ingredients', 'instructions', 'enhanced_metadata'
+        ],
+        filter_expression='attribute_exists(embedding_id)'
+    )
+    return items
+
+
+def load_cocktails(cocktail_ids: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Metadata items for cocktail_ids in order, plus the ids with no item (deleted or
+    never ingested), which are left out rather than failing the whole batch
+    """
+    table = dynamodb.Table(METADATA_TABLE)
+    cocktails, missing = [], []
+    for cocktail_id in cocktail_ids:
+        response = table.get_item(Key={'cocktail_id': cocktail_id})
+        if 'Item' in response:
+            cocktails.append(response['Item'])
+        else:
+            missing.append(cocktail_id)
+    if missing:
+        print(f"Cocktails not found, skipping: {', '.join(missing)}")
+    return cocktails, missing
+
+
+def process_cocktail_embeddings(cocktails: List[Dict[str, Any]], duplicates: DuplicateIndex = None):
+    """
+    Embed every chunk of every cocktail concurrently, then store them cocktail by
+    cocktail in input order (so within-batch duplicate checks see earlier cocktails).
+    Chunk texts already in the content-addressed embedding cache skip Bedrock, and
+    every newly generated embedding is cached even if other texts fail, so a retry
+    only re-embeds the failures. A cocktail with a failed chunk is not stored.
+    Returns (results, failed, embedding_stats); failed maps cocktail_id -> error.
+    """
+    # Create text chunks for embedding
+    chunk_lists = [create_text_chunks(cocktail) for cocktail in cocktails]
+    texts = [chunk['text'] for chunks in chunk_lists for chunk in chunks]
     
-    if 'Item' not in response:
-        raise ValueError(f"Cocktail {cocktail_id} not found")
+    # Reuse embeddings of unchanged chunk text, generate the rest at once under the
+    # shared rate limit
+    cache = EmbeddingContentCache(
+        s3, EMBEDDINGS_BUCKET, BEDROCK_EMBEDDING_MODEL, EMBEDDING_DIMENSION, normalize=EMBEDDING_NORMALIZE
+    )
+    by_text = cache.get_many(texts)
+    missing = [text for text in dict.fromkeys(texts) if text not in by_text]
+    executor = EmbeddingExecutor(generate_embedding, embed_rate_limiter, max_workers=EMBED_CONCURRENCY)
+    generated = {
+        text: embedding for text, embedding in zip(missing, executor.embed_all(missing)) if embedding is not None
+    }
+    cache.put_many(generated)
+    by_text.update(generated)
+    print(f"Embedding cache: {len(texts) - len(missing)} of {len(texts)} chunks reused")
+    embedding_stats = {**executor.stats, 'chunks': len(texts), 'cache_hits': len(texts) - len(missing)}
     
-    cocktail = response['Item']
+    if duplicates is None:
+        duplicates = DuplicateIndex.load(s3, EMBEDDINGS_BUCKET, DUPLICATE_THRESHOLD)
+    results, failed = [], {}
+    for cocktail, chunks in zip(cocktails, chunk_lists):
+        errors = [executor.errors[chunk['text']] for chunk in chunks if chunk['text'] not in by_text]
+        if errors:
+            failed[cocktail['cocktail_id']] = errors[0]
+            continue
+        embeddings = []
+        for chunk in chunks:
+            embedding = by_text[chunk['text']]
+            embeddings.append({
+                'chunk_id': chunk['id'],
+                'chunk_type': chunk['type'],
+                'text': chunk['text'],
+                'embedding': embedding,
+                'dimension': len(embedding)
+            })
+        results.append(store_cocktail_embedding(cocktail, embeddings, duplicates))
+    if failed:
+        print(f"Embedding failed for {len(failed)} cocktails: {', '.join(failed)}")
+    return results, failed, embedding_stats
+
+
+def store_cocktail_embedding(
+    cocktail: Dict[str, Any],
+    embeddings: List[Dict[str, Any]],
+    duplicates: DuplicateIndex
+) -> Dict[str, Any]:
+    """
+    Duplicate-check one embedded cocktail, then write embeddings/<id>.json and the
+    metadata reference
+    """
+    table = dynamodb.Table(METADATA_TABLE)
+    cocktail_id = cocktail['cocktail_id']
     
-    # Create text chunks for embedding
-    chunks = create_text_chunks(cocktail)
-    
-    # Generate embeddings for each chunk
-    embeddings = []
-    for chunk in chunks:
-        embedding = generate_embedding(chunk['text'])
-        embeddings.append({
-            'chunk_id': chunk['id'],
-            'chunk_type': chunk['type'],
-            'text': chunk['text'],
-            'embedding': embedding,
-            'dimension': len(embedding)
-        })
-    
-    # Check for duplicates using cosine similarity
-    is_duplicate, similar_to = check_duplicate(embeddings[0]['embedding'])
+    # Check for duplicates against the packed index and earlier cocktails in this batch
+    is_duplicate, similar_to = duplicates.check(cocktail_id, embeddings[0]['embedding'])
+    duplicates.add(cocktail_id, embeddings[0]['embedding'])
     
     # Store embeddings
     embedding_id = f"EMB_{cocktail_id}_{hashlib.md5(cocktail['name'].encode()).hexdigest()[:8]}"
@@ -107,6 +337,9 @@ def process_cocktail_embedding(cocktail_id: str) -> Dict[str, Any]:
         'embedding_id': embedding_id,
         'cocktail_id': cocktail_id,
         'cocktail_name': cocktail['name'],
+        'model_id': BEDROCK_EMBEDDING_MODEL,
+        'dimension': EMBEDDING_DIMENSION,
+        'normalized': EMBEDDING_NORMALIZE,
         'chunks': embeddings,
         'is_duplicate': is_duplicate,
         'similar_to': similar_to,
@@ -137,10 +370,67 @@ def process_cocktail_embedding(cocktail_id: str) -> Dict[str, Any]:
         'cocktail_id': cocktail_id,
         'embedding_id': embedding_id,
         'chunks_count': len(embeddings),
-        'is_duplicate': is_duplicate
+        'is_duplicate': is_duplicate,
+        'index_record': {
+            'cocktail_id': cocktail_id,
+            'embedding_id': embedding_id,
+            'chunks': [{'chunk_id': e['chunk_id'], 'embedding': e['embedding']} for e in embeddings],
+            'terms': document_terms(cocktail),
+            'fragments': cocktail_fragments(cocktail)
+        }
     }
 
 
+def refresh_vector_index(
+    index_records: List[Dict[str, Any]],
+    rebuild: bool = False,
+    deleted_ids: List[str] = None
+) -> Dict[str, Any]:
+    """
+    Append new embeddings to the packed index as a delta segment (or rebuild it from
+    S3), together with the BM25 lexical index used by hybrid search and the
+    precomputed response fragments. Those are written first: search reloads when the
+    index manifest's ETag changes, so it then sees all three. deleted_ids (cocktails
+    gone from the metadata table) are tombstoned in the delta and dropped from the
+    lexical index and fragments; a rebuild leaves out every cocktail not in the
+    table. Failures are logged, not raised: embeddings/<id>.json stays the source of
+    truth and search falls back to per-item reads for anything missing.
+    """
+    if not index_records and not deleted_ids and not rebuild:
+        return {'updated': False}
+    try:
+        if rebuild:
+            cocktails = get_embedded_cocktails()
+            lexical = rebuild_lexical_index(s3, EMBEDDINGS_BUCKET, cocktails)
+            fragments = rebuild_fragments(s3, EMBEDDINGS_BUCKET, cocktails)
+            summary = rebuild_index(
+                s3, EMBEDDINGS_BUCKET, BEDROCK_EMBEDDING_MODEL, EMBEDDING_DIMENSION, live_ids=get_cocktail_ids
+            )
+        else:
+            lexical = update_lexical_index(
+                s3, EMBEDDINGS_BUCKET, {record['cocktail_id']: record['terms'] for record in index_records},
+                deleted_ids
+            )
+            fragments = update_fragments(
+                s3, EMBEDDINGS_BUCKET, {record['cocktail_id']: record['fragments'] for record in index_records},
+                deleted_ids
+            )
+            summary = append_delta(
+                s3, EMBEDDINGS_BUCKET, index_records, BEDROCK_EMBEDDING_MODEL, EMBEDDING_DIMENSION, deleted_ids
+            )
+        if 'delta_key' in summary:
+            print(f"Vector index delta {summary['seq']}: {summary['count']} vectors, {summary['bytes']} bytes, "
+                  f"{summary['deltas']} deltas live")
+        else:
+            print(f"Vector index generation {summary['generation']}: {summary['count']} vectors, {summary['bytes']} bytes")
+        print(f"Lexical index: {lexical['documents']} documents, {lexical['terms']} terms, {lexical['bytes']} bytes")
+        print(f"Response fragments: {fragments['cocktails']} cocktails, {fragments['bytes']} bytes")
+        return {'updated': True, **summary, 'lexical': lexical, 'fragments': fragments}
+    except Exception as e:
+        print(f"Error updating vector index: {str(e)}")
+        return {'updated': False, 'error': str(e)}
+
+
 def create_text_chunks(cocktail: Dict[str, Any]) -> List[Dict[str, str]]:
     """
     Create text chunks from cocktail data for embedding
@@ -183,13 +473,15 @@ def create_text_chunks(cocktail: Dict[str, Any]) -> List[Dict[str, str]]:
 
 def generate_embedding(text: str) -> List[float]:
     """
-    Generate embedding using Bedrock Titan
+    Generate embedding using Bedrock Titan, at EMBEDDING_DIMENSION
     """
     try:
         response = bedrock.invoke_model(
             modelId=BEDROCK_EMBEDDING_MODEL,
             body=json.dumps({
-                "inputText": text
+                "inputText": text,
+                "dimensions": EMBEDDING_DIMENSION,
+                "normalize": EMBEDDING_NORMALIZE
             })
         )
         
@@ -201,52 +493,3 @@ def generate_embedding(text: str) -> List[float]:
     except Exception as e:
         print(f"Error generating embedding: {str(e)}")
         raise
-
-
-def check_duplicate(embedding: List[float], threshold: float = 0.95) -> tuple:
-    """
-    Check if this embedding is a duplicate using cosine similarity
-    """
-    try:
-        # Get all existing embeddings from S3
-        response = s3.list_objects_v2(
-            Bucket=EMBEDDINGS_BUCKET,
-            Prefix='embeddings/'
-        )
-        
-        if 'Contents' not in response:
-            return False, None
-        
-        # Check similarity with existing embeddings
-        for obj in response['Contents'][:100]:  # Limit to 100 for performance
-            existing_data = s3.get_object(Bucket=EMBEDDINGS_BUCKET, Key=obj['Key'])
-            existing_embedding_data = json.loads(existing_data['Body'].read())
-            
-            # Compare with primary chunk
-            existing_embedding = existing_embedding_data['chunks'][0]['embedding']
-            similarity = cosine_similarity(embedding, existing_embedding)
-            
-            if similarity > threshold:
-                return True, existing_embedding_data['cocktail_id']
-        
-        return False, None
-    
-    except Exception as e:
-        print(f"Error checking duplicates: {str(e)}")
-        return False, None
-
-
-def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
-    """
-    Calculate cosine similarity between two vectors
-    """
-    import math
-    
-    dot_product = sum(a * b for a, b in zip(vec1, vec2))
-    magnitude1 = math.sqrt(sum(a * a for a in vec1))
-    magnitude2 = math.sqrt(sum(b * b for b in vec2))
-    
-    if magnitude1 == 0 or magnitude2 == 0:
-        return 0.0
-    
-    return dot_product / (magnitude1 * magnitude2)
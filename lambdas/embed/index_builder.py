@@ -0,0 +1,743 @@
+"""
+index_builder.py — Packed vector index artifact for the search Lambda
+
+The embed Lambda keeps one binary object in the embeddings bucket that holds every
+chunk embedding (name_desc, recipe, flavor) as a contiguous float32 matrix, plus an
+id/offset table mapping each row to its chunk and cocktail. The search Lambda loads
+that single object instead of one embeddings/<id>.json GET per item.
+
+Layout of index/vectors.bin (little-endian):
+    magic      4 bytes   b'MVIX'
+    header_len uint32    length of the JSON header in bytes
+    header     JSON      format_version, generation, model_id, dimension,
+                         embedding_version, count, normalized, built_at,
+                         entries=[{cocktail_id, embedding_id, chunk_id, row, offset}]
+    padding    0-3 bytes so the matrix starts on a 4-byte boundary
+    matrix     float32   count x dimension, row-major, unit-normalized rows
+                         (normalized=true; older artifacts hold raw vectors)
+    int8 section (quantization="int8", format v3):
+      offset   float32   dimension
+      scale    float32   dimension
+      codes    int8      count x dimension, row-major; row ~= offset + scale * codes
+
+The int8 codes are computed here, once per segment, so the search Lambda's int8
+mode scans them straight off the memory-mapped artifact and only reads float32
+rows to rescore its shortlist.
+
+embedding_version ("<model_id>#<dimension>") names the embedding space. One
+artifact never mixes spaces: when the configured model or dimension changes, the
+next update rebuilds from the embeddings/<id>.json files in the new space only,
+and the search Lambda refuses an index whose version differs from its own.
+
+Embed runs don't rewrite that base artifact. Each run appends a small delta
+segment (same layout, header segment="delta", seq, tombstones) under
+index/deltas/, and index/manifest.json lists the live segments:
+
+    format_version, embedding_version, next_seq,
+    base={key, etag, generation, count}, deltas=[{key, seq, count, etag}]
+
+A delta's tombstones (the cocktail_ids it re-embeds, plus deletions) hide those
+cocktails' rows in the base and in earlier deltas. Compaction folds the base and
+the live deltas into a new base, drops them from the manifest and deletes the
+folded segments; it runs when deltas pile up (COMPACT_MAX_DELTAS, or delta rows
+above COMPACT_DELTA_RATIO of the base) and on the scheduled compact_index action.
+The manifest's ETag is the corpus version readers key on.
+
+Writers can run concurrently (embed runs, backfill shards, compaction), so every
+write is conditional: a delta is created only under an unused seq (If-None-Match),
+the base is replaced only if it is still the one that was read, and the manifest
+is rewritten with If-Match on the ETag it was read with, re-reading and re-applying
+the change when another writer committed first.
+
+Alongside it, index/ivf.npz holds IVF coarse-quantizer centroids (spherical k-means
+over the same vectors), tagged with the index generation they were trained on. The
+search Lambda assigns rows to their nearest centroid at load and probes only the
+closest lists per query.
+
+Keep in sync with lambdas/search/vector_index.py (reader side).
+"""
+
+import io
+import json
+import os
+import random
+import struct
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, Callable, Iterable
+
+import numpy as np
+
+INDEX_KEY = 'index/vectors.bin'
+INDEX_MAGIC = b'MVIX'
+INDEX_FORMAT_VERSION = 3  # v3: int8 section; v2: one row per chunk (v1 held only the primary chunk)
+READABLE_FORMAT_VERSIONS = (1, 2, 3)
+
+IVF_KEY = 'index/ivf.npz'
+# Below this many cocktails (not chunk rows) brute force is exact and already fast; skip the IVF
+IVF_MIN_ITEMS = int(os.environ.get('IVF_MIN_ITEMS', '1000'))
+
+MANIFEST_KEY = 'index/manifest.json'
+MANIFEST_FORMAT_VERSION = 1
+DELTA_PREFIX = 'index/deltas/'
+# Compact once this many deltas are live, or their rows exceed this fraction of the base
+COMPACT_MAX_DELTAS = int(os.environ.get('COMPACT_MAX_DELTAS', '8'))
+COMPACT_DELTA_RATIO = float(os.environ.get('COMPACT_DELTA_RATIO', '0.2'))
+# Manifest, delta and base writes are conditional (If-Match / If-None-Match); S3 answers
+# a lost race with 412 PreconditionFailed, or 409 while another conditional write is in flight
+CONFLICT_CODES = ('PreconditionFailed', 'ConditionalRequestConflict')
+MANIFEST_COMMIT_ATTEMPTS = 8
+
+
+def embedding_version(model_id: str, dimension: int) -> str:
+    """Tag for an embedding space; vectors with different tags are not comparable."""
+    return f"{model_id}#{dimension}"
+
+
+def quantize_int8(
+    matrix: np.ndarray,
+    block_rows: int = 4096
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-dimension int8 scalar quantization of a normalized float32 matrix:
+    (offset, scale, codes) with x[:, d] ~= offset[d] + scale[d] * code[:, d], codes in
+    [-127, 127]. Keep in sync with QuantizedMatrix in lambdas/search/vector_index.py.
+    """
+    dimension = matrix.shape[1]
+    if not len(matrix):
+        return (
+            np.zeros(dimension, dtype=np.float32),
+            np.ones(dimension, dtype=np.float32),
+            np.zeros((0, dimension), dtype=np.int8)
+        )
+    lo = matrix.min(axis=0)
+    hi = matrix.max(axis=0)
+    offset = ((hi + lo) / 2).astype(np.float32)
+    scale = ((hi - lo) / 254).astype(np.float32)
+    scale[scale == 0] = 1.0
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    for start in range(0, len(matrix), block_rows):
+        block = (matrix[start:start + block_rows] - offset) / scale
+        codes[start:start + block_rows] = np.clip(np.rint(block), -127, 127)
+    return offset, scale, codes
+
+
+def pack_index(
+    entries: List[Dict[str, Any]],
+    vectors: List[List[float]],
+    model_id: str,
+    generation: int,
+    dimension: Optional[int] = None,
+    extra: Optional[Dict[str, Any]] = None
+) -> bytes:
+    """
+    Serialize entries + vectors into the packed artifact. entries[i] describes vectors[i].
+    dimension is only needed to tag an empty artifact; extra adds header fields
+    (delta segments carry segment, seq and tombstones).
+    """
+    dimension = dimension or (len(vectors[0]) if vectors else 0)
+    table = []
+    for row, (entry, vector) in enumerate(zip(entries, vectors)):
+        if len(vector) != dimension:
+            raise ValueError(
+                f"Embedding {entry.get('embedding_id')} has dimension {len(vector)}, "
+                f"expected {dimension}"
+            )
+        table.append({
+            'cocktail_id': entry['cocktail_id'],
+            'embedding_id': entry['embedding_id'],
+            'chunk_id': entry['chunk_id'],
+            'row': row,
+            'offset': row * dimension * 4
+        })
+
+    # Rows are stored unit-normalized so readers can score straight off a memory map
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(table), dimension)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = (matrix / norms).astype('<f4')
+    offset, scale, codes = quantize_int8(matrix)
+
+    header = json.dumps({
+        'format_version': INDEX_FORMAT_VERSION,
+        'generation': generation,
+        'model_id': model_id,
+        'dimension': dimension,
+        'embedding_version': embedding_version(model_id, dimension),
+        'count': len(table),
+        'normalized': True,
+        'quantization': 'int8',
+        'built_at': datetime.utcnow().isoformat(),
+        **(extra or {}),
+        'entries': table
+    }).encode('utf-8')
+
+    prefix_len = len(INDEX_MAGIC) + 4 + len(header)
+    padding = b'\x00' * (-prefix_len % 4)
+    return b''.join([
+        INDEX_MAGIC, struct.pack('<I', len(header)), header, padding, matrix.tobytes(),
+        offset.astype('<f4').tobytes(), scale.astype('<f4').tobytes(), codes.tobytes()
+    ])
+
+
+def _parse_header(data: bytes) -> Tuple[Dict[str, Any], int]:
+    """Validated JSON header (v1 entries get chunk_id 'name_desc') and the matrix offset."""
+    if data[:4] != INDEX_MAGIC:
+        raise ValueError("Not a packed vector index (bad magic)")
+    (header_len,) = struct.unpack_from('<I', data, 4)
+    header_end = 8 + header_len
+    header = json.loads(data[8:header_end].decode('utf-8'))
+    if header.get('format_version') not in READABLE_FORMAT_VERSIONS:
+        raise ValueError(f"Unsupported index format version {header.get('format_version')}")
+    for entry in header['entries']:
+        entry.setdefault('chunk_id', 'name_desc')
+    return header, header_end + (-header_end % 4)
+
+
+class DuplicateIndex:
+    """
+    Near-duplicate lookup for the embed pipeline over the same packed index search
+    reads: the primary (name_desc) row of every indexed cocktail, plus cocktails
+    embedded earlier in the current batch. A check is one matrix-vector product over
+    the whole corpus; a cocktail never matches its own earlier rows (re-embeds).
+    """
+
+    def __init__(self, cocktail_ids: List[str], matrix: np.ndarray, threshold: float = 0.95):
+        self.threshold = threshold
+        self.cocktail_ids = list(cocktail_ids)
+        self.row_of = {cocktail_id: row for row, cocktail_id in enumerate(self.cocktail_ids)}
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True) if len(matrix) else None
+        if norms is not None:
+            norms[norms == 0] = 1.0
+        self.matrix = matrix / norms if norms is not None else matrix
+        self.batch_ids = []
+        self.batch_rows = []
+
+    @classmethod
+    def load(cls, s3, bucket: str, threshold: float = 0.95) -> 'DuplicateIndex':
+        """Primary rows from the live segments; empty (batch-only) if there are none."""
+        try:
+            segments = load_segments(s3, bucket)
+            if segments is None:
+                raise ValueError(f"no index at {INDEX_KEY}")
+            _, _, entries, matrix, _ = segments
+            primary = [row for row, entry in enumerate(entries) if entry['chunk_id'] == 'name_desc']
+            return cls([entries[row]['cocktail_id'] for row in primary], matrix[primary], threshold)
+        except Exception as e:
+            print(f"Duplicate check limited to this batch, index unavailable: {e}")
+            return cls([], np.zeros((0, 0), dtype=np.float32), threshold)
+
+    def check(self, cocktail_id: str, embedding: List[float]) -> Tuple[bool, Optional[str]]:
+        """(is_duplicate, cocktail_id it duplicates) for the most similar other cocktail."""
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return False, None
+        query = query / norm
+
+        best_id, best_score = None, -np.inf
+        candidates = [(self.cocktail_ids, self.matrix, [self.row_of.get(cocktail_id, -1)])]
+        own_batch_rows = [i for i, other in enumerate(self.batch_ids) if other == cocktail_id]
+        candidates.append((self.batch_ids, self.batch_rows, own_batch_rows))
+        for ids, rows, own_rows in candidates:
+            if not len(ids) or len(rows[0]) != len(query):
+                continue
+            scores = np.asarray(rows) @ query
+            scores[[row for row in own_rows if row >= 0]] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] > best_score:
+                best_id, best_score = ids[best], float(scores[best])
+        if best_score > self.threshold:
+            return True, best_id
+        return False, None
+
+    def add(self, cocktail_id: str, embedding: List[float]) -> None:
+        """Make a just-embedded cocktail visible to later checks in the same batch."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        self.batch_ids.append(cocktail_id)
+        self.batch_rows.append(vector / norm if norm else vector)
+
+
+def write_index(
+    s3,
+    bucket: str,
+    entries: List[Dict[str, Any]],
+    vectors: List[List[float]],
+    model_id: str,
+    generation: int,
+    dimension: Optional[int] = None,
+    previous_etag: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Pack and upload the artifact, replacing only the base with previous_etag (None:
+    only if there is no base yet); returns a small summary for logging/responses.
+    """
+    body = pack_index(entries, vectors, model_id, generation, dimension)
+    response = s3.put_object(
+        Bucket=bucket,
+        Key=INDEX_KEY,
+        Body=body,
+        ContentType='application/octet-stream',
+        Metadata={'generation': str(generation), 'count': str(len(entries))},
+        **_conditions(previous_etag)
+    )
+    summary = {
+        'index_key': INDEX_KEY,
+        'generation': generation,
+        'count': len(entries),
+        'bytes': len(body),
+        'etag': response.get('ETag')
+    }
+
+    if len({entry['cocktail_id'] for entry in entries}) >= IVF_MIN_ITEMS:
+        centroids = train_ivf(np.asarray(vectors, dtype=np.float32))
+        write_ivf(s3, bucket, centroids, generation)
+        summary['ivf_lists'] = len(centroids)
+    return summary
+
+
+def train_ivf(
+    vectors: np.ndarray,
+    nlist: Optional[int] = None,
+    iterations: int = 10,
+    seed: int = 0,
+    max_train_points: int = 64
+) -> np.ndarray:
+    """
+    Spherical k-means coarse quantizer: unit-normalized centroids, rows assigned by
+    max dot product. nlist defaults to ~sqrt(n); training uses at most
+    max_train_points * nlist sampled rows.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    data = vectors / norms
+
+    n = len(data)
+    nlist = nlist or max(1, int(round(np.sqrt(n))))
+    nlist = min(nlist, n)
+    rng = np.random.default_rng(seed)
+    if n > max_train_points * nlist:
+        data = data[rng.choice(n, max_train_points * nlist, replace=False)]
+
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+        counts = np.bincount(assignments, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists from random points so every list stays useful
+            sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+        lengths = np.linalg.norm(sums, axis=1, keepdims=True)
+        lengths[lengths == 0] = 1.0
+        centroids = sums / lengths
+    return centroids.astype(np.float32)
+
+
+def write_ivf(s3, bucket: str, centroids: np.ndarray, generation: int) -> None:
+    """Upload IVF centroids tagged with the index generation they belong to."""
+    buffer = io.BytesIO()
+    np.savez(buffer, centroids=centroids, generation=np.array([generation], dtype=np.int64))
+    s3.put_object(
+        Bucket=bucket,
+        Key=IVF_KEY,
+        Body=buffer.getvalue(),
+        ContentType='application/octet-stream',
+        Metadata={'generation': str(generation), 'nlist': str(len(centroids))}
+    )
+
+
+def _chunk_rows(cocktail_id: str, embedding_id: str, chunks: List[Dict[str, Any]]):
+    """(entry, vector) pairs for every chunk of one cocktail."""
+    entry = {'cocktail_id': cocktail_id, 'embedding_id': embedding_id}
+    return [({**entry, 'chunk_id': chunk['chunk_id']}, chunk['embedding']) for chunk in chunks]
+
+
+def is_write_conflict(error: Exception) -> bool:
+    """True when S3 refused a conditional write because another writer got there first."""
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+    return code in CONFLICT_CODES
+
+
+def _conditions(etag: Optional[str]) -> Dict[str, str]:
+    """put_object preconditions: replace exactly the object we read, or create it."""
+    return {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+
+
+def _read_manifest(s3, bucket: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """The segment manifest and its ETag; (None, None) before the first base is written under it."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=MANIFEST_KEY)
+    except s3.exceptions.NoSuchKey:
+        return None, None
+    return json.loads(obj['Body'].read()), obj.get('ETag')
+
+
+def load_manifest(s3, bucket: str) -> Optional[Dict[str, Any]]:
+    """The segment manifest, or None before the first base is written under it."""
+    return _read_manifest(s3, bucket)[0]
+
+
+def write_manifest(s3, bucket: str, manifest: Dict[str, Any], etag: Optional[str]) -> None:
+    """Replace the manifest read with `etag` (None: create it); fails on a lost race."""
+    s3.put_object(
+        Bucket=bucket,
+        Key=MANIFEST_KEY,
+        Body=json.dumps(manifest),
+        ContentType='application/json',
+        Metadata={'deltas': str(len(manifest['deltas']))},
+        **_conditions(etag)
+    )
+
+
+def commit_manifest(
+    s3,
+    bucket: str,
+    update: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Read-modify-write of the manifest guarded by its ETag: update(current) returns the
+    new manifest and is re-run on a fresh read whenever another writer committed in
+    between, so concurrent appends and compactions never drop each other's segments.
+    Returns the manifest that was written.
+    """
+    for attempt in range(MANIFEST_COMMIT_ATTEMPTS):
+        manifest, etag = _read_manifest(s3, bucket)
+        updated = update(manifest)
+        try:
+            write_manifest(s3, bucket, updated, etag)
+            return updated
+        except Exception as e:
+            if not is_write_conflict(e) or attempt == MANIFEST_COMMIT_ATTEMPTS - 1:
+                raise
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+
+def _base_manifest(summary: Dict[str, Any], version: str, next_seq: int) -> Dict[str, Any]:
+    """Manifest for a freshly written base with no deltas."""
+    return {
+        'format_version': MANIFEST_FORMAT_VERSION,
+        'embedding_version': version,
+        'next_seq': next_seq,
+        'base': {
+            'key': INDEX_KEY,
+            'etag': summary.get('etag'),
+            'generation': summary['generation'],
+            'count': summary['count']
+        },
+        'deltas': []
+    }
+
+
+def _delete_segments(s3, bucket: str, deltas: List[Dict[str, Any]]) -> None:
+    """Best-effort removal of folded delta segments (the manifest no longer lists them)."""
+    for delta in deltas:
+        try:
+            s3.delete_object(Bucket=bucket, Key=delta['key'])
+        except Exception as e:
+            print(f"Could not delete compacted segment {delta['key']}: {e}")
+
+
+def _segment_matrix(data: bytes) -> Tuple[Dict[str, Any], np.ndarray]:
+    """Header and (count x dimension) float32 view of one segment."""
+    header, matrix_start = _parse_header(data)
+    matrix = np.frombuffer(
+        data, dtype='<f4', count=header['count'] * header['dimension'], offset=matrix_start
+    ).reshape(header['count'], header['dimension'])
+    return header, matrix
+
+
+def load_segments(
+    s3,
+    bucket: str
+) -> Optional[Tuple[
+    Optional[Dict[str, Any]], Dict[str, Any], List[Dict[str, Any]], np.ndarray, Optional[str]
+]]:
+    """
+    Base + the current manifest's deltas merged in seq order with tombstones applied:
+    (manifest, base header, entries, matrix, base ETag) where entries[i] describes
+    matrix[i]. None if there is no base. The base is read If-Match the manifest's
+    base ETag; if a compaction or rebuild replaced it (412) or deleted a listed delta
+    in between, the manifest is re-read so the segments always belong together.
+    """
+    for attempt in range(MANIFEST_COMMIT_ATTEMPTS):
+        manifest = load_manifest(s3, bucket)
+        base_etag = (manifest or {}).get('base', {}).get('etag')
+        try:
+            conditions = {'IfMatch': base_etag} if base_etag else {}
+            obj = s3.get_object(Bucket=bucket, Key=INDEX_KEY, **conditions)
+        except s3.exceptions.NoSuchKey:
+            return None
+        except Exception as e:
+            if not is_write_conflict(e) or attempt == MANIFEST_COMMIT_ATTEMPTS - 1:
+                raise
+            continue
+        segments = [_segment_matrix(obj['Body'].read())]
+        try:
+            for delta in (manifest or {}).get('deltas', []):
+                delta_obj = s3.get_object(Bucket=bucket, Key=delta['key'])
+                segments.append(_segment_matrix(delta_obj['Body'].read()))
+        except s3.exceptions.NoSuchKey:
+            if attempt == MANIFEST_COMMIT_ATTEMPTS - 1:
+                raise
+            continue
+        break
+
+    live, offset = [], 0
+    for header, matrix in segments:
+        dead = set(header.get('tombstones', ()))
+        if dead:
+            live = [(entry, row) for entry, row in live if entry['cocktail_id'] not in dead]
+        live.extend((entry, offset + entry['row']) for entry in header['entries'])
+        offset += len(matrix)
+    matrices = [matrix for _, matrix in segments]
+    stacked = matrices[0] if len(matrices) == 1 else np.concatenate(matrices)
+    rows = np.asarray([row for _, row in live], dtype=np.intp)
+    return manifest, segments[0][0], [entry for entry, _ in live], stacked[rows], obj.get('ETag')
+
+
+def _write_delta(
+    s3,
+    bucket: str,
+    seq: int,
+    count: int,
+    build: Callable[[int], bytes]
+) -> Tuple[str, int, bytes, Dict[str, Any]]:
+    """
+    Create the next free delta object at or after seq (If-None-Match), so concurrent
+    appenders that read the same next_seq never overwrite each other's segment.
+    """
+    for _ in range(MANIFEST_COMMIT_ATTEMPTS):
+        key = f"{DELTA_PREFIX}{seq:08d}.bin"
+        body = build(seq)
+        try:
+            response = s3.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=body,
+                ContentType='application/octet-stream',
+                Metadata={'seq': str(seq), 'count': str(count)},
+                IfNoneMatch='*'
+            )
+            return key, seq, body, response
+        except Exception as e:
+            if not is_write_conflict(e):
+                raise
+            seq += 1
+    raise ValueError(f"No free delta segment key after {seq - MANIFEST_COMMIT_ATTEMPTS}")
+
+
+def append_delta(
+    s3,
+    bucket: str,
+    records: List[Dict[str, Any]],
+    model_id: str,
+    dimension: int,
+    deleted_ids: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Write freshly embedded items (records of cocktail_id, embedding_id and chunks
+    [{chunk_id, embedding}]) as a new delta segment and list it in the manifest.
+    The delta tombstones every cocktail it contains, so re-embeds replace their old
+    rows; deleted_ids are tombstoned without new rows. Falls back to a full rebuild
+    when there is no base yet or it is in another embedding space, and compacts
+    once the deltas cross the thresholds.
+    """
+    version = embedding_version(model_id, dimension)
+    manifest = load_manifest(s3, bucket)
+    adopted = None
+    if manifest is None:
+        try:
+            head = s3.head_object(Bucket=bucket, Key=INDEX_KEY)
+        except Exception:
+            head = None
+        if head is None:
+            try:
+                return rebuild_index(s3, bucket, model_id, dimension)
+            except Exception as e:
+                if not is_write_conflict(e):
+                    raise
+                # Another first build won; add these records on top of its base
+                return append_delta(s3, bucket, records, model_id, dimension, deleted_ids)
+        # Base written before the manifest existed: adopt it as-is
+        header, _ = _parse_header(s3.get_object(Bucket=bucket, Key=INDEX_KEY)['Body'].read())
+        existing_version = header.get('embedding_version') or embedding_version(
+            header.get('model_id'), header['dimension']
+        )
+        summary = {
+            'etag': head.get('ETag'),
+            'generation': header.get('generation', 0),
+            'count': header['count']
+        }
+        manifest = adopted = _base_manifest(summary, existing_version, 1)
+    if manifest['embedding_version'] != version:
+        print(f"Vector index is {manifest['embedding_version']}, not {version}; rebuilding")
+        return rebuild_index(s3, bucket, model_id, dimension)
+
+    rows = [
+        row for record in records
+        for row in _chunk_rows(record['cocktail_id'], record['embedding_id'], record['chunks'])
+    ]
+    tombstones = sorted({record['cocktail_id'] for record in records} | set(deleted_ids or ()))
+
+    def pack_delta(seq):
+        return pack_index(
+            [entry for entry, _ in rows], [vector for _, vector in rows], model_id,
+            manifest['base']['generation'], dimension,
+            extra={'segment': 'delta', 'seq': seq, 'tombstones': tombstones}
+        )
+
+    key, seq, body, response = _write_delta(s3, bucket, manifest['next_seq'], len(rows), pack_delta)
+    delta = {'key': key, 'seq': seq, 'count': len(rows), 'etag': response.get('ETag')}
+
+    def add_delta(current):
+        if current is None and adopted is not None:
+            current = dict(adopted)
+        if current is None or current['embedding_version'] != version:
+            raise ValueError(f"Vector index left {version} while delta {seq} was being appended")
+        current['deltas'] = sorted(current['deltas'] + [delta], key=lambda segment: segment['seq'])
+        current['next_seq'] = max(current['next_seq'], seq + 1)
+        return current
+
+    manifest = commit_manifest(s3, bucket, add_delta)
+    delta_rows = sum(delta['count'] for delta in manifest['deltas'])
+    summary = {
+        'delta_key': key,
+        'seq': seq,
+        'generation': manifest['base']['generation'],
+        'count': len(rows),
+        'bytes': len(body),
+        'deltas': len(manifest['deltas']),
+        'delta_rows': delta_rows
+    }
+    too_many = len(manifest['deltas']) >= COMPACT_MAX_DELTAS
+    if too_many or delta_rows > COMPACT_DELTA_RATIO * max(1, manifest['base']['count']):
+        summary['compaction'] = compact_index(s3, bucket, model_id, dimension)
+    return summary
+
+
+def compact_index(s3, bucket: str, model_id: str, dimension: int) -> Dict[str, Any]:
+    """
+    Fold the base and the deltas live at the start into a new base (next generation,
+    fresh IVF), point the manifest at it and delete the folded deltas. The base is
+    replaced only if it is still the one that was read (If-Match), so concurrent
+    compactions can't both win; deltas appended meanwhile stay listed on top of the
+    new base. Readers fetch the base If-Match the ETag in their manifest, so one that
+    still holds the old manifest gets a 412 and re-reads it instead of replaying the
+    folded deltas (and their tombstones) over the new base.
+    """
+    segments = load_segments(s3, bucket)
+    manifest = segments[0] if segments is not None else None
+    if manifest is None or manifest['embedding_version'] != embedding_version(model_id, dimension):
+        return rebuild_index(s3, bucket, model_id, dimension)
+
+    _, header, entries, matrix, base_etag = segments
+    try:
+        summary = write_index(
+            s3, bucket, entries, matrix, model_id, header.get('generation', 0) + 1, dimension,
+            previous_etag=base_etag
+        )
+    except Exception as e:
+        if not is_write_conflict(e):
+            raise
+        print("Index base changed during compaction; leaving it to the writer that replaced it")
+        return {'compacted': False, 'folded_deltas': 0}
+    folded = {delta['seq'] for delta in manifest['deltas']}
+
+    def point_at_new_base(current):
+        updated = _base_manifest(summary, current['embedding_version'], current['next_seq'])
+        updated['deltas'] = [delta for delta in current['deltas'] if delta['seq'] not in folded]
+        return updated
+
+    committed = commit_manifest(s3, bucket, point_at_new_base)
+    _delete_segments(s3, bucket, manifest['deltas'])
+    print(
+        f"Compacted {len(folded)} deltas into generation {summary['generation']} "
+        f"({summary['count']} vectors), {len(committed['deltas'])} appended meanwhile kept"
+    )
+    return {**summary, 'folded_deltas': len(folded)}
+
+
+def rebuild_index(
+    s3,
+    bucket: str,
+    model_id: str,
+    dimension: int,
+    live_ids: Optional[Callable[[], Iterable[str]]] = None
+) -> Dict[str, Any]:
+    """
+    Full rebuild from every embeddings/<id>.json in the bucket that is in the
+    (model_id, dimension) space; others are skipped until they are re-embedded.
+    Files from before model_id was recorded count as model_id. live_ids, if given,
+    returns the cocktail ids that still exist; embeddings of any other cocktail are
+    left out (and logged) so deleted cocktails don't come back. It is called after
+    the starting manifest is read, so it sees every cocktail of the deltas the
+    rebuild covers. Writes a new base (conditional on the base it replaces) and a
+    manifest that keeps only deltas appended after the rebuild started. Used for the
+    first build, space changes and as a repair path; normal embed runs go through
+    append_delta.
+    """
+    version = embedding_version(model_id, dimension)
+    started = load_manifest(s3, bucket)
+    previous = None
+    try:
+        previous = s3.head_object(Bucket=bucket, Key=INDEX_KEY)
+    except Exception:
+        pass
+    existing = set(live_ids()) if live_ids is not None else None
+
+    rows = {}
+    skipped = 0
+    orphaned = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix='embeddings/'):
+        for obj in page.get('Contents', []):
+            try:
+                data = json.loads(s3.get_object(Bucket=bucket, Key=obj['Key'])['Body'].read())
+                if data.get('model_id', model_id) != model_id or any(
+                    len(chunk['embedding']) != dimension for chunk in data['chunks']
+                ):
+                    skipped += 1
+                    continue
+                if existing is not None and data['cocktail_id'] not in existing:
+                    orphaned.append(obj['Key'])
+                    continue
+                cocktail_id = data['cocktail_id']
+                rows[cocktail_id] = _chunk_rows(cocktail_id, data['embedding_id'], data['chunks'])
+            except Exception as e:
+                print(f"Skipping {obj['Key']} during index rebuild: {e}")
+    if skipped:
+        print(f"Index rebuild skipped {skipped} embeddings outside {version}")
+    if orphaned:
+        print(
+            f"Index rebuild left out {len(orphaned)} embeddings of deleted cocktails: "
+            f"{', '.join(orphaned[:10])}"
+        )
+
+    generation = int(previous.get('Metadata', {}).get('generation', 0)) + 1 if previous else 1
+    entries = [entry for chunk_rows in rows.values() for entry, _ in chunk_rows]
+    vectors = [vector for chunk_rows in rows.values() for _, vector in chunk_rows]
+    summary = write_index(
+        s3, bucket, entries, vectors, model_id, generation, dimension,
+        previous_etag=previous.get('ETag') if previous else None
+    )
+
+    # Deltas listed when the rebuild started are covered by the embeddings it read;
+    # later ones (same space only) stay on top of the new base
+    covered = {delta['seq'] for delta in (started or {}).get('deltas', [])}
+    dropped = []
+
+    def point_at_new_base(current):
+        dropped.clear()
+        next_seq = current['next_seq'] if current else 1
+        updated = _base_manifest(summary, version, next_seq)
+        for delta in (current or {}).get('deltas', []):
+            keep = current['embedding_version'] == version and delta['seq'] not in covered
+            (updated['deltas'] if keep else dropped).append(delta)
+        return updated
+
+    commit_manifest(s3, bucket, point_at_new_base)
+    _delete_segments(s3, bucket, dropped)
+    return summary
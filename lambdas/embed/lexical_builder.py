@@ -0,0 +1,141 @@
+"""
+lexical_builder.py — BM25 inverted index artifact for hybrid search
+
+The embed Lambda keeps index/lexical.json.gz in the embeddings bucket: a compact
+inverted index over each cocktail's name, ingredients, instructions and enhanced
+metadata. The search Lambda loads it next to the vector index and scores keyword
+queries with BM25 in-process (no Bedrock call needed for strong lexical matches).
+
+Layout (gzipped JSON):
+    format_version, generation, doc_ids=[cocktail_id], doc_lengths=[int], avgdl,
+    postings={term: [[doc, ...], [tf, ...]]}
+
+Keep tokenize() in sync with lambdas/search/lexical_index.py (reader side).
+"""
+
+import gzip
+import json
+import re
+from typing import Dict, Any, List, Optional
+
+LEXICAL_KEY = 'index/lexical.json.gz'
+LEXICAL_FORMAT_VERSION = 1
+NAME_BOOST = 2  # name tokens count twice, a cheap stand-in for BM25F field weights
+
+STOPWORDS = frozenset(
+    'a an and are as at be but by for from has have in into is it its of on or that the '
+    'this to was were will with your you oz ml cl tsp tbsp cup cups part parts'.split()
+)
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens, stopwords dropped, trailing plural 's' stripped."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall((text or '').lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def document_terms(cocktail: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Term frequencies for one cocktail across name, ingredients, instructions and
+    enhanced metadata text fields.
+    """
+    metadata = cocktail.get('enhanced_metadata', {})
+    if not isinstance(metadata, dict):
+        metadata = {}
+
+    fields = [cocktail.get('name', '')] * NAME_BOOST
+    fields.append(' '.join(ing.get('name', '') for ing in cocktail.get('ingredients', []) if isinstance(ing, dict)))
+    fields.append(cocktail.get('instructions', '') or '')
+    fields.append(cocktail.get('category', '') or '')
+    fields.append(metadata.get('description', '') or '')
+    for key in ('flavor_profile', 'occasions', 'tasting_notes'):
+        values = metadata.get(key, [])
+        fields.append(' '.join(values) if isinstance(values, list) else str(values))
+
+    counts = {}
+    for token in tokenize(' '.join(str(field) for field in fields)):
+        counts[token] = counts.get(token, 0) + 1
+    return counts
+
+
+def _documents_from_index(data: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """Invert postings back into {cocktail_id: {term: tf}} for read-modify-write."""
+    documents = {doc_id: {} for doc_id in data['doc_ids']}
+    for term, (docs, tfs) in data['postings'].items():
+        for doc, tf in zip(docs, tfs):
+            documents[data['doc_ids'][doc]][term] = tf
+    return documents
+
+
+def load_lexical_index(s3, bucket: str) -> Optional[Dict[str, Any]]:
+    """Fetch and parse the current artifact. Returns None if it has not been built yet."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=LEXICAL_KEY)
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(gzip.decompress(obj['Body'].read()))
+
+
+def write_lexical_index(s3, bucket: str, documents: Dict[str, Dict[str, int]], generation: int) -> Dict[str, Any]:
+    """Build postings from per-document term counts and upload the artifact."""
+    doc_ids = sorted(documents)
+    doc_lengths = [sum(documents[doc_id].values()) for doc_id in doc_ids]
+    postings = {}
+    for doc, doc_id in enumerate(doc_ids):
+        for term, tf in documents[doc_id].items():
+            entry = postings.setdefault(term, [[], []])
+            entry[0].append(doc)
+            entry[1].append(tf)
+
+    body = gzip.compress(json.dumps({
+        'format_version': LEXICAL_FORMAT_VERSION,
+        'generation': generation,
+        'doc_ids': doc_ids,
+        'doc_lengths': doc_lengths,
+        'avgdl': (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0,
+        'postings': postings
+    }, separators=(',', ':')).encode('utf-8'))
+    s3.put_object(
+        Bucket=bucket,
+        Key=LEXICAL_KEY,
+        Body=body,
+        ContentType='application/json',
+        ContentEncoding='gzip',
+        Metadata={'generation': str(generation), 'count': str(len(doc_ids))}
+    )
+    return {'lexical_key': LEXICAL_KEY, 'documents': len(doc_ids), 'terms': len(postings), 'bytes': len(body)}
+
+
+def update_lexical_index(
+    s3,
+    bucket: str,
+    documents: Dict[str, Dict[str, int]],
+    deleted_ids: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Upsert per-cocktail term counts into the existing artifact (or create it), dropping deleted_ids."""
+    existing = load_lexical_index(s3, bucket)
+    merged = _documents_from_index(existing) if existing else {}
+    merged.update(documents)
+    for cocktail_id in deleted_ids or ():
+        merged.pop(cocktail_id, None)
+    generation = existing.get('generation', 0) + 1 if existing else 1
+    return write_lexical_index(s3, bucket, merged, generation)
+
+
+def rebuild_lexical_index(s3, bucket: str, cocktails: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Full rebuild from metadata items (used with rebuild_index)."""
+    existing = None
+    try:
+        existing = s3.head_object(Bucket=bucket, Key=LEXICAL_KEY)
+    except Exception:
+        pass
+    generation = int(existing.get('Metadata', {}).get('generation', 0)) + 1 if existing else 1
+    documents = {cocktail['cocktail_id']: document_terms(cocktail) for cocktail in cocktails}
+    return write_lexical_index(s3, bucket, documents, generation)
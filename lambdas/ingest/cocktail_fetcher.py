@@ -0,0 +1,131 @@
+"""
+cocktail_fetcher.py — Concurrent TheCocktailDB client over a pooled HTTP session
+
+One requests.Session with a keep-alive connection pool sized to the worker count,
+so lookups reuse TLS connections instead of handshaking per drink. Requests run
+on a bounded thread pool, each first taking a slot from a per-host rate cap
+(TheCocktailDB is a free public API). Connection errors, 429s and 5xx responses
+are retried with exponential backoff, honouring Retry-After.
+
+The base URL is configurable (COCKTAILDB_BASE_URL) so scripts/benchmark_ingest.py
+can point the same client at a local stand-in server.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_BASE_URL = 'https://www.thecocktaildb.com/api/json/v1/1'
+DEFAULT_MAX_WORKERS = 8
+# TheCocktailDB publishes no request limit for the v1 API; 429s and Retry-After are
+# the real backstop. The cap only keeps one run from hammering a free service: 50/s
+# is what 8 workers reach at 160 ms per request, so it binds only when the API is
+# fast. (The old 10/s cap made 8 workers slower than a sequential loop.)
+DEFAULT_RATE_PER_SECOND = 50.0
+
+
+class HostRateLimiter:
+    """
+    At most `rate` request starts per second per host: each caller reserves the
+    next free start time and sleeps until it, so concurrent workers are spaced
+    evenly instead of bursting.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_start = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host: str) -> None:
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start.get(host, now))
+            self.next_start[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class CocktailDBClient:
+    """
+    TheCocktailDB endpoints used by ingest. *_many methods fan out over max_workers
+    threads and return drinks in request order.
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        rate_per_second: float = DEFAULT_RATE_PER_SECOND,
+        max_retries: int = 4,
+        backoff_seconds: float = 0.5,
+        timeout_seconds: float = 10.0
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max(1, max_workers)
+        self.timeout_seconds = timeout_seconds
+        self.limiter = HostRateLimiter(rate_per_second)
+        self.host = urlsplit(self.base_url).netloc
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_seconds,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def get_json(self, endpoint: str, params: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        self.limiter.wait(self.host)
+        response = self.session.get(f"{self.base_url}/{endpoint}", params=params, timeout=self.timeout_seconds)
+        response.raise_for_status()
+        with self.lock:
+            self.requests += 1
+        return response.json()
+
+    def filter_drinks(self, **params: str) -> List[Dict[str, Any]]:
+        """filter.php summaries (idDrink, strDrink, strDrinkThumb)."""
+        return self.get_json('filter.php', params).get('drinks') or []
+
+    def lookup(self, drink_id: str) -> Optional[Dict[str, Any]]:
+        """Full record for one drink id, or None if TheCocktailDB doesn't know it."""
+        drinks = self.get_json('lookup.php', {'i': drink_id}).get('drinks')
+        return drinks[0] if drinks else None
+
+    def random(self) -> Dict[str, Any]:
+        return self.get_json('random.php')['drinks'][0]
+
+    def _map(self, fn, args: List[Any]) -> List[Any]:
+        if not args:
+            return []
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(args))) as pool:
+            results = list(pool.map(fn, args))
+        elapsed = time.time() - start
+        print(f"Fetched {len(args)} drinks in {elapsed:.2f}s ({len(args) / elapsed if elapsed else 0:.1f}/s)")
+        return results
+
+    def lookup_many(self, drink_ids: List[str]) -> List[Dict[str, Any]]:
+        """Full records for many ids, concurrently; unknown ids are dropped."""
+        drinks = self._map(self.lookup, drink_ids)
+        missing = [drink_id for drink_id, drink in zip(drink_ids, drinks) if drink is None]
+        if missing:
+            print(f"TheCocktailDB has no record for ids {missing}")
+        return [drink for drink in drinks if drink is not None]
+
+    def random_many(self, count: int) -> List[Dict[str, Any]]:
+        return self._map(lambda _: self.random(), list(range(count)))
@@ -10,7 +10,9 @@ import os
 import re
 from datetime import datetime
 from typing import Dict, Any, List
-import requests
+
+from cocktail_fetcher import CocktailDBClient, DEFAULT_BASE_URL, DEFAULT_MAX_WORKERS, DEFAULT_RATE_PER_SECOND
+from ingest_sink import IngestSink, read_raw_records
 
 # AWS clients
 s3 = boto3.client('s3')
@@ -22,6 +24,22 @@ RAW_BUCKET = os.environ.get('RAW_BUCKET', 'mocktailverse-raw')
 METADATA_TABLE = os.environ.get('METADATA_TABLE', 'mocktailverse-metadata')
 # Using Amazon Titan Text Lite - FREE, no form needed, perfect for demo
 BEDROCK_MODEL = 'amazon.titan-text-lite-v1'  # ✅ FREE, ON_DEMAND, ACTIVE
+# TheCocktailDB fetching: concurrent lookups, polite per-host request rate
+# (defaults and their rationale in cocktail_fetcher.py; 0 disables the rate cap)
+COCKTAILDB_BASE_URL = os.environ.get('COCKTAILDB_BASE_URL', DEFAULT_BASE_URL)
+FETCH_CONCURRENCY = int(os.environ.get('FETCH_CONCURRENCY', str(DEFAULT_MAX_WORKERS)))
+COCKTAILDB_RATE_PER_SECOND = float(os.environ.get('COCKTAILDB_RATE_PER_SECOND', str(DEFAULT_RATE_PER_SECOND)))
+# Cocktails per gzipped NDJSON part in RAW_BUCKET (DynamoDB items go out every 25)
+INGEST_PART_RECORDS = int(os.environ.get('INGEST_PART_RECORDS', '500'))
+# Seconds before the Lambda timeout at which buffered records are flushed early
+INGEST_FLUSH_RESERVE_SECONDS = float(os.environ.get('INGEST_FLUSH_RESERVE_SECONDS', '10'))
+
+# Module level so warm invocations reuse its keep-alive connections
+cocktaildb = CocktailDBClient(
+    base_url=COCKTAILDB_BASE_URL,
+    max_workers=FETCH_CONCURRENCY,
+    rate_per_second=COCKTAILDB_RATE_PER_SECOND
+)
 
 
 def lambda_handler(event, context):
@@ -32,10 +50,10 @@ def lambda_handler(event, context):
         # Determine source
         if 'Records' in event and event['Records'][0]['eventSource'] == 'aws:s3':
             # Triggered by S3 upload
-            return process_s3_upload(event)
+            return process_s3_upload(event, context)
         else:
             # Scheduled fetch from API
-            return fetch_from_api(event)
+            return fetch_from_api(event, context)
     
     except Exception as e:
         print(f"Error in ingestion: {str(e)}")
@@ -45,7 +63,7 @@ def lambda_handler(event, context):
         }
 
 
-def fetch_from_api(event: Dict[str, Any]) -> Dict[str, Any]:
+def fetch_from_api(event: Dict[str, Any], context=None) -> Dict[str, Any]:
     """
     Fetch cocktails from TheCocktailDB API
     """
@@ -56,39 +74,38 @@ def fetch_from_api(event: Dict[str, Any]) -> Dict[str, Any]:
     
     if fetch_type == 'mocktails':
         # Fetch non-alcoholic drinks
-        response = requests.get('https://www.thecocktaildb.com/api/json/v1/1/filter.php?a=Non_Alcoholic')
-        drinks = response.json().get('drinks', [])[:limit]
+        drinks = cocktaildb.filter_drinks(a='Non_Alcoholic')[:limit]
         
-        # Get full details for each
-        for drink in drinks:
-            detail_response = requests.get(
-                f"https://www.thecocktaildb.com/api/json/v1/1/lookup.php?i={drink['idDrink']}"
-            )
-            cocktails.append(detail_response.json()['drinks'][0])
+        # Get full details for each (concurrently, over pooled connections)
+        cocktails = cocktaildb.lookup_many([drink['idDrink'] for drink in drinks])
     
     elif fetch_type == 'random':
         # Fetch random cocktails
-        for _ in range(limit):
-            response = requests.get('https://www.thecocktaildb.com/api/json/v1/1/random.php')
-            cocktails.append(response.json()['drinks'][0])
+        cocktails = cocktaildb.random_many(limit)
     
-    # Process each cocktail
+    # Process each cocktail; writes are buffered and flushed in batches, and whatever
+    # was added is flushed even if a later cocktail fails
+    sink = new_sink('thecocktaildb_api', context)
     results = []
-    for cocktail in cocktails:
-        result = process_cocktail(cocktail)
-        results.append(result)
+    try:
+        for cocktail in cocktails:
+            result = process_cocktail(cocktail, sink)
+            results.append(result)
+    finally:
+        stored = sink.close()
     
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': f'Successfully processed {len(results)} cocktails',
             'count': len(results),
-            'cocktails': results
+            'cocktails': results,
+            'manifest_key': stored.get('manifest_key')
         })
     }
 
 
-def process_s3_upload(event: Dict[str, Any]) -> Dict[str, Any]:
+def process_s3_upload(event: Dict[str, Any], context=None) -> Dict[str, Any]:
     """
     Process cocktail data uploaded to S3
     """
@@ -96,30 +113,45 @@ def process_s3_upload(event: Dict[str, Any]) -> Dict[str, Any]:
     bucket = record['s3']['bucket']['name']
     key = record['s3']['object']['key']
     
-    # Get object from S3
-    response = s3.get_object(Bucket=bucket, Key=key)
-    data = json.loads(response['Body'].read())
-    
-    # Process cocktails
+    # Process cocktails (a JSON object/array, an NDJSON part or a run manifest)
+    sink = new_sink(f's3://{bucket}/{key}', context)
     results = []
-    cocktails = data if isinstance(data, list) else [data]
-    
-    for cocktail in cocktails:
-        result = process_cocktail(cocktail)
-        results.append(result)
+    try:
+        for cocktail in read_raw_records(s3, bucket, key):
+            result = process_cocktail(cocktail, sink)
+            results.append(result)
+    finally:
+        stored = sink.close()
     
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': f'Successfully processed {len(results)} cocktails from S3',
-            'count': len(results)
+            'count': len(results),
+            'manifest_key': stored.get('manifest_key')
         })
     }
 
 
-def process_cocktail(cocktail: Dict[str, Any]) -> Dict[str, Any]:
+def new_sink(source: str, context=None) -> IngestSink:
     """
-    Process a single cocktail: extract metadata with LLM and store
+    Buffered writer for one ingest run: metadata to DynamoDB, raw data to RAW_BUCKET,
+    flushed early when the invocation is about to time out
+    """
+    return IngestSink(
+        table=dynamodb.Table(METADATA_TABLE),
+        s3=s3,
+        bucket=RAW_BUCKET,
+        source=source,
+        part_records=INGEST_PART_RECORDS,
+        time_left=(lambda: context.get_remaining_time_in_millis() / 1000) if context else None,
+        reserve_seconds=INGEST_FLUSH_RESERVE_SECONDS
+    )
+
+
+def process_cocktail(cocktail: Dict[str, Any], sink: IngestSink) -> Dict[str, Any]:
+    """
+    Process a single cocktail: extract metadata with LLM and queue it on the sink
     """
     # Extract basic info
     cocktail_id = cocktail.get('idDrink')
@@ -164,18 +196,8 @@ def process_cocktail(cocktail: Dict[str, Any]) -> Dict[str, Any]:
         'data_source': 'thecocktaildb_api'
     }
     
-    # Store in DynamoDB
-    table = dynamodb.Table(METADATA_TABLE)
-    table.put_item(Item=metadata)
-    
-    # Store raw data in S3
-    s3_key = f"cocktails/{cocktail_id}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
-    s3.put_object(
-        Bucket=RAW_BUCKET,
-        Key=s3_key,
-        Body=json.dumps(cocktail),
-        ContentType='application/json'
-    )
+    # Queue for DynamoDB (batch_writer) and the raw NDJSON part in S3
+    s3_key = sink.add(metadata, cocktail)
     
     print(f"Processed cocktail: {name} (ID: {cocktail_id})")
     
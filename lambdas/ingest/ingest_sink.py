@@ -0,0 +1,163 @@
+"""
+ingest_sink.py — Buffered, batched writes for the ingest pipeline
+
+Cocktails are added to an IngestSink instead of being written one by one:
+
+    DynamoDB  metadata items go through one table.batch_writer() held open for the
+              run, which sends a 25-item BatchWriteItem as soon as 25 are queued
+              (unprocessed items are resent automatically)
+    S3        raw API records are buffered and written as one gzipped NDJSON part
+              file every part_records cocktails, or at once when time_left() drops
+              under reserve_seconds (the Lambda is about to time out)
+
+close() flushes both and writes a manifest listing the run's parts; callers run it
+in a finally block so a failed or interrupted run keeps what it already added:
+
+    cocktails/batches/<YYYYMMDD>/<run_id>/part-00000.ndjson.gz
+    cocktails/batches/<YYYYMMDD>/<run_id>/manifest.json
+        format_version, run_id, source, created_at, records,
+        parts=[{key, records, bytes, raw_bytes, sha256}]
+
+read_raw_records() reads a manifest, a part file or a legacy single-cocktail JSON
+object back, so reprocessing walks a handful of compressed parts instead of one
+object per cocktail.
+"""
+
+import gzip
+import hashlib
+import json
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Dict, Any, List, Iterator, Optional, Callable
+
+BATCH_PREFIX = 'cocktails/batches'
+MANIFEST_FORMAT_VERSION = 1
+
+
+class IngestSink:
+    """Collects (metadata item, raw record) pairs and writes them in batches."""
+
+    def __init__(
+        self,
+        table,
+        s3,
+        bucket: str,
+        source: str,
+        part_records: int = 500,
+        run_id: Optional[str] = None,
+        time_left: Callable[[], float] = None,
+        reserve_seconds: float = 10.0
+    ):
+        now = datetime.utcnow()
+        self.table = table
+        self.s3 = s3
+        self.bucket = bucket
+        self.source = source
+        self.part_records = max(1, part_records)
+        self.time_left = time_left
+        self.reserve_seconds = reserve_seconds
+        self.run_id = run_id or now.strftime('%Y%m%dT%H%M%S%f')
+        self.prefix = f"{BATCH_PREFIX}/{now.strftime('%Y%m%d')}/{self.run_id}"
+        self.created_at = now.isoformat()
+        self.raw: List[Dict[str, Any]] = []
+        self.parts: List[Dict[str, Any]] = []
+        self.records = 0
+        self.writers = ExitStack()
+        self.batch = self._open_batch()
+
+    def _open_batch(self):
+        # overwrite_by_pkeys: a repeated cocktail (random fetches) keeps its last
+        # version instead of failing a batch with duplicate keys
+        return self.writers.enter_context(self.table.batch_writer(overwrite_by_pkeys=['cocktail_id']))
+
+    def add(self, item: Dict[str, Any], raw: Dict[str, Any]) -> str:
+        """Queue one cocktail; returns the key of the part file its raw record goes to."""
+        self.batch.put_item(Item=item)
+        self.raw.append(raw)
+        key = self._part_key(len(self.parts))
+        if len(self.raw) >= self.part_records:
+            self.flush()
+        elif self.time_left is not None:
+            seconds_left = self.time_left()
+            if seconds_left < self.reserve_seconds:
+                print(f"Ingest sink: {seconds_left:.1f}s left, flushing {len(self.raw)} records early")
+                self.flush()
+        return key
+
+    def _part_key(self, index: int) -> str:
+        return f"{self.prefix}/part-{index:05d}.ndjson.gz"
+
+    def flush(self) -> None:
+        """Send the DynamoDB items still queued and write the buffered raw records as one part."""
+        self.writers.close()
+        self.batch = self._open_batch()
+        if not self.raw:
+            return
+
+        lines = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in self.raw).encode('utf-8')
+        body = gzip.compress(lines)
+        key = self._part_key(len(self.parts))
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=body,
+            ContentType='application/x-ndjson',
+            ContentEncoding='gzip',
+            Metadata={'records': str(len(self.raw))}
+        )
+        self.parts.append({
+            'key': key,
+            'records': len(self.raw),
+            'bytes': len(body),
+            'raw_bytes': len(lines),
+            'sha256': hashlib.sha256(body).hexdigest()
+        })
+        self.records += len(self.raw)
+        self.raw = []
+
+    def close(self) -> Dict[str, Any]:
+        """Flush what's left and write the run manifest; returns a summary."""
+        self.flush()
+        self.writers.close()
+        summary = {'records': self.records, 'parts': len(self.parts)}
+        if not self.parts:
+            return summary
+        manifest_key = f"{self.prefix}/manifest.json"
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=manifest_key,
+            Body=json.dumps({
+                'format_version': MANIFEST_FORMAT_VERSION,
+                'run_id': self.run_id,
+                'source': self.source,
+                'created_at': self.created_at,
+                'records': self.records,
+                'parts': self.parts
+            }),
+            ContentType='application/json'
+        )
+        summary.update({
+            'manifest_key': manifest_key,
+            'bytes': sum(part['bytes'] for part in self.parts),
+            'raw_bytes': sum(part['raw_bytes'] for part in self.parts)
+        })
+        print(
+            f"Ingest sink: {self.records} records in {len(self.parts)} parts, "
+            f"{summary['raw_bytes']} -> {summary['bytes']} bytes, manifest {manifest_key}"
+        )
+        return summary
+
+
+def read_raw_records(s3, bucket: str, key: str) -> Iterator[Dict[str, Any]]:
+    """Raw cocktail records from a run manifest, a part file or a plain JSON object."""
+    body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    if key.endswith('/manifest.json'):
+        for part in json.loads(body)['parts']:
+            yield from read_raw_records(s3, bucket, part['key'])
+    elif key.endswith('.ndjson.gz'):
+        for line in gzip.decompress(body).decode('utf-8').splitlines():
+            if line:
+                yield json.loads(line)
+    else:
+        data = json.loads(body)
+        yield from (data if isinstance(data, list) else [data])
@@ -97,7 +97,8 @@ def retrieve_context(question: str, k: int = 3) -> List[Dict[str, Any]]:
         Payload=json.dumps({
             'body': json.dumps({
                 'query': question,
-                'k': k
+                'k': k,
+                'include_context': True  # precomputed prompt blocks per cocktail
             })
         })
     )
@@ -110,11 +111,16 @@ def retrieve_context(question: str, k: int = 3) -> List[Dict[str, Any]]:
 
 def build_context(docs: List[Dict[str, Any]]) -> str:
     """
-    Build context string from retrieved documents
+    Build context string from retrieved documents. Blocks precomputed at embed time
+    (doc['context']) are just numbered and joined; others are formatted here.
     """
     context_parts = []
     
     for i, doc in enumerate(docs, 1):
+        if doc.get('context'):
+            context_parts.append(f"Cocktail {i}: {doc['name']}\n{doc['context']}")
+            continue
+        
         # Format each cocktail as a context block
         ingredients_text = ', '.join([
             f"{ing.get('measure', '')} {ing['name']}".strip()
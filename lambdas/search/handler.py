@@ -6,11 +6,24 @@ Purpose: Semantic search. Default path = real cosine similarity over Titan v2
 Trigger: API Gateway /v1/search endpoint
 """
 
+import base64
 import json
-import math
 import boto3
 import os
-from typing import Dict, Any, List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple
+
+from dynamo_scan import parallel_scan
+from lexical_index import load_lexical_index, reciprocal_rank_fusion, tokenize
+from query_cache import (
+    EmbeddingCache, LRUCache, ResultCache, SemanticCache, cache_key, normalize_query
+)
+from response_fragments import load_fragments
+from vector_index import (
+    CorpusCache, embedding_version, matches_filters, index_version, load_index_segments,
+    load_ivf_centroids
+)
 
 # AWS clients
 bedrock = boto3.client('bedrock-runtime', region_name='us-west-2')
@@ -23,6 +36,94 @@ OPENSEARCH_INDEX = os.environ.get('OPENSEARCH_INDEX', 'cocktails')
 METADATA_TABLE = os.environ.get('METADATA_TABLE', 'mocktailverse-metadata')
 EMBEDDINGS_BUCKET = os.environ.get('EMBEDDINGS_BUCKET', 'mocktailverse-embeddings')
 BEDROCK_EMBEDDING_MODEL = 'amazon.titan-embed-text-v2:0'
+# Query embedding size (256, 512 or 1024) and normalization; must match the embed
+# Lambda. An index built in any other embedding space is refused, never mixed.
+EMBEDDING_DIMENSION = int(os.environ.get('EMBEDDING_DIMENSION', '1024'))
+EMBEDDING_NORMALIZE = os.environ.get('EMBEDDING_NORMALIZE', 'true').lower() == 'true'
+EMBEDDING_VERSION = embedding_version(BEDROCK_EMBEDDING_MODEL, EMBEDDING_DIMENSION)
+# How long a warm container trusts its cached corpus before re-checking the index version
+INDEX_CACHE_TTL_SECONDS = float(os.environ.get('INDEX_CACHE_TTL_SECONDS', '60'))
+# Where the packed index is cached and memory-mapped (empty = read it into memory instead)
+INDEX_CACHE_DIR = os.environ.get('INDEX_CACHE_DIR', '/tmp/mocktailverse-index')
+# 'float32' = exact scan; 'int8' = quantized first pass + exact rerank of top k * RERANK_FACTOR
+INDEX_MODE = os.environ.get('INDEX_MODE', 'float32')
+RERANK_FACTOR = int(os.environ.get('RERANK_FACTOR', '4'))
+# IVF lists probed per query when an ANN artifact exists (more = higher recall, slower)
+IVF_NPROBE = int(os.environ.get('IVF_NPROBE', '8'))
+# How chunk scores (name_desc, recipe, flavor) combine into one score per cocktail
+CHUNK_FUSION = os.environ.get('CHUNK_FUSION', 'max')
+CHUNK_WEIGHTS = {
+    chunk_id: float(weight)
+    for chunk_id, weight in (
+        pair.split(':')
+        for pair in os.environ.get('CHUNK_WEIGHTS', 'name_desc:1.0,recipe:0.7,flavor:0.7').split(',')
+        if pair
+    )
+}
+# 'vector' (default) or 'hybrid' (BM25 + vector, reciprocal rank fusion);
+# a per-request 'mode' overrides it
+SEARCH_MODE = os.environ.get('SEARCH_MODE', 'vector')
+# Hybrid: candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = int(os.environ.get('HYBRID_CANDIDATES', '50'))
+# Hybrid: queries of at most this many terms that k+ documents match in full skip the embedding call
+LEXICAL_SHORTCUT_MAX_TERMS = int(os.environ.get('LEXICAL_SHORTCUT_MAX_TERMS', '2'))
+# Optional shared cache table (DynamoDB, TTL attribute expires_at); unset = in-process only
+SEARCH_CACHE_TABLE = os.environ.get('SEARCH_CACHE_TABLE')
+QUERY_EMBEDDING_TTL_SECONDS = float(os.environ.get('QUERY_EMBEDDING_TTL_SECONDS', '86400'))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', '1024'))
+# Attributes the corpus scan moves: search, filters and enrichment all read from these
+CORPUS_ATTRIBUTES = [
+    'cocktail_id', 'embedding_id', 'name', 'category', 'alcoholic', 'glass', 'image_url',
+    'enhanced_metadata', 'ingredients', 'instructions'
+]
+# Final-response cache for first pages (per container, plus SEARCH_CACHE_TABLE when set)
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '512'))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL_SECONDS', '300'))
+# Semantic cache (vector mode): reuse a recent response when the query embedding is this similar
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+SEMANTIC_CACHE_SIZE = int(os.environ.get('SEMANTIC_CACHE_SIZE', '256'))  # 0 disables it
+# Cursor pagination: ranked lists are computed this deep (at least k) and kept per container
+SEARCH_RANKING_DEPTH = int(os.environ.get('SEARCH_RANKING_DEPTH', '50'))
+RANKING_CACHE_SIZE = int(os.environ.get('RANKING_CACHE_SIZE', '256'))
+RANKING_TTL_SECONDS = float(os.environ.get('RANKING_TTL_SECONDS', '600'))
+# Batch search: max queries per request, and concurrent Bedrock calls for their embeddings
+SEARCH_BATCH_MAX_QUERIES = int(os.environ.get('SEARCH_BATCH_MAX_QUERIES', '32'))
+EMBED_CONCURRENCY = int(os.environ.get('EMBED_CONCURRENCY', '8'))
+# Enrichment fallback: BatchGetItem limits and the attributes it needs
+BATCH_GET_MAX_KEYS = 100
+BATCH_GET_MAX_RETRIES = 5
+ENRICH_PROJECTION = (
+    'cocktail_id, #name, category, alcoholic, glass, image_url, enhanced_metadata, '
+    'ingredients, instructions'
+)
+
+# Warm-container corpus cache (module level so it survives across invocations)
+_corpus_cache = None
+
+# Query embeddings: in-process LRU, backed by the shared table when configured
+query_embedding_cache = EmbeddingCache(
+    table=dynamodb.Table(SEARCH_CACHE_TABLE) if SEARCH_CACHE_TABLE else None,
+    max_entries=QUERY_EMBEDDING_CACHE_SIZE,
+    ttl_seconds=QUERY_EMBEDDING_TTL_SECONDS
+)
+
+# Search responses keyed on (mode, query, k, filters, index version); new embeddings
+# change the version
+result_cache = ResultCache(
+    table=dynamodb.Table(SEARCH_CACHE_TABLE) if SEARCH_CACHE_TABLE else None,
+    max_entries=RESULT_CACHE_SIZE,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS
+)
+
+# Recent vector-mode responses by query embedding, for paraphrased queries
+semantic_cache = SemanticCache(
+    max_entries=max(1, SEMANTIC_CACHE_SIZE),
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS
+)
+
+# Ranked result lists behind pagination cursors: key -> (retrieval, results, depth)
+ranking_cache = LRUCache(max_entries=RANKING_CACHE_SIZE, ttl_seconds=RANKING_TTL_SECONDS)
 
 # OpenSearch client (optional - only if opensearchpy is available)
 opensearch_client = None
@@ -64,31 +165,99 @@ def lambda_handler(event, context):
         query = body.get('query', '')
         k = body.get('k', 5)  # Number of results
         filters = body.get('filters', {})
+        mode = body.get('mode', SEARCH_MODE)
+        include_context = bool(body.get('include_context', False))  # RAG: precomputed prompt blocks
+        position = None
         
+        if body.get('cursor'):
+            # Next page: query, filters, mode and page size come from the cursor
+            try:
+                position = decode_cursor(body['cursor'])
+            except ValueError:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json'},
+                    'body': json.dumps({'error': 'Invalid cursor'})
+                }
+            query, filters, mode, k = position['q'], position['f'], position['m'], position['k']
+            include_context = bool(position.get('c', False))
+        if 'queries' in body:
+            return batch_search_response(body.get('queries'), k, filters, mode)
         if not query:
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json'},
                 'body': json.dumps({'error': 'Query parameter is required'})
             }
+        if mode not in ('vector', 'hybrid'):
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': "mode must be 'vector' or 'hybrid'"})
+            }
         
-        # Generate query embedding
-        query_embedding = generate_embedding(query)
+        # First pages are served from the result cache when the index hasn't changed
+        result_key = semantic_scope = query_embedding = None
+        if position is None:
+            version = current_index_version()
+            result_key = ResultCache.key(
+                mode, normalize_query(query), k, filters, version, include_context
+            )
+            cached = result_cache.get(result_key)
+            print(f"Result cache {'hit' if cached is not None else 'miss'}: {result_cache.stats()}")
+            if cached is not None:
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json'},
+                    'body': json.dumps({**cached, 'query': query})
+                }
+            
+            # Then by meaning: a paraphrase of a recent query reuses its response
+            if mode == 'vector' and SEMANTIC_CACHE_SIZE > 0:
+                query_embedding = generate_embedding(query)
+                semantic_scope = cache_key(
+                    'sem', k, json.dumps(filters or {}, sort_keys=True), version, include_context
+                )
+                match = semantic_cache.get(query_embedding, semantic_scope)
+                print(
+                    f"Semantic cache {'hit' if match else 'miss'}: hits {semantic_cache.hits}, "
+                    f"misses {semantic_cache.misses}"
+                    + (f", matched {match[1]!r} at {match[2]:.3f}" if match else '')
+                )
+                if match:
+                    # The matched response's cursor pages through the other query's ranking
+                    response_body = {
+                        **match[0], 'query': query, 'matched_query': match[1], 'next_cursor': None
+                    }
+                    result_cache.put(result_key, response_body)
+                    return {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json'},
+                        'body': json.dumps(response_body)
+                    }
         
-        # Search OpenSearch
-        results = search_vectors(query_embedding, k=k, filters=filters)
+        results, retrieval, next_cursor = search_page(
+            query, k, filters, mode, position, query_embedding, include_context
+        )
         
-        # Enrich with metadata
-        enriched_results = enrich_results(results)
+        # Enrich with metadata (this page only)
+        enriched_results = enrich_results(results, include_context=include_context)
+        response_body = {
+            'query': query,
+            'results': enriched_results,
+            'count': len(enriched_results),
+            'retrieval': retrieval,
+            'next_cursor': next_cursor
+        }
+        if result_key:
+            result_cache.put(result_key, response_body)
+        if semantic_scope:
+            semantic_cache.put(query_embedding, semantic_scope, query, response_body)
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({
-                'query': query,
-                'results': enriched_results,
-                'count': len(enriched_results)
-            })
+            'body': json.dumps(response_body)
         }
     
     except Exception as e:
@@ -100,13 +269,169 @@ def lambda_handler(event, context):
         }
 
 
+def batch_search_response(
+    queries: Any,
+    k: int,
+    filters: Dict[str, Any],
+    mode: str
+) -> Dict[str, Any]:
+    """
+    Batch mode ({"queries": [...]}): embed every distinct normalized query (cache
+    first; only the misses go to Bedrock, concurrently), score them all in one
+    matrix-matrix product, and return top-k per query in request order.
+    """
+    valid = isinstance(queries, list) and all(isinstance(q, str) and q for q in queries)
+    if not valid or not queries:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'queries must be a non-empty list of strings'})
+        }
+    if len(queries) > SEARCH_BATCH_MAX_QUERIES:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': f'At most {SEARCH_BATCH_MAX_QUERIES} queries per batch'})
+        }
+    if mode != 'vector':
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': "Batch search supports mode 'vector' only"})
+        }
+    
+    # Cache reads and writes stay on this thread; the pool only makes Bedrock calls
+    normalized = [normalize_query(query) for query in queries]
+    embeddings = {
+        text: query_embedding_cache.get(text, EMBEDDING_VERSION)
+        for text in dict.fromkeys(normalized)
+    }
+    misses = [text for text, embedding in embeddings.items() if embedding is None]
+    if misses:
+        with ThreadPoolExecutor(max_workers=min(EMBED_CONCURRENCY, len(misses))) as pool:
+            for text, embedding in zip(misses, pool.map(invoke_embedding_model, misses)):
+                query_embedding_cache.put(text, EMBEDDING_VERSION, embedding)
+                embeddings[text] = embedding
+    query_embeddings = [embeddings[text] for text in normalized]
+    batch_results = batch_search_vectors(query_embeddings, k=k, filters=filters)
+    
+    responses = []
+    for query, results in zip(queries, batch_results):
+        enriched_results = enrich_results(results)
+        responses.append(
+            {'query': query, 'results': enriched_results, 'count': len(enriched_results)}
+        )
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({
+            'queries': queries,
+            'results': responses,
+            'count': len(responses),
+            'retrieval': 'vector'
+        })
+    }
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Opaque, URL-safe page cursor."""
+    raw = json.dumps(position, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Inverse of encode_cursor; ValueError for anything that isn't one of ours."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError(f"Malformed cursor: {e}")
+    if not isinstance(position, dict) or not {'q', 'f', 'm', 'k', 'o'} <= set(position):
+        raise ValueError("Malformed cursor")
+    return position
+
+
+def search_page(
+    query: str,
+    k: int,
+    filters: Dict[str, Any],
+    mode: str,
+    position: Dict[str, Any] = None,
+    query_embedding: List[float] = None,
+    include_context: bool = False
+) -> Tuple[List[Dict[str, Any]], str, str]:
+    """
+    One page of results plus the cursor for the next. The ranked list is computed
+    SEARCH_RANKING_DEPTH deep (reusing the cached query embedding) and cached per
+    (mode, normalized query, filters, index version), so later pages only slice
+    and enrich. If the index changed since the cursor was issued, the page resumes
+    after the cursor's last (id, score) in the new ranking instead of by offset.
+    """
+    version = get_corpus().version if not opensearch_client else None
+    key = cache_key(
+        'rank', mode, normalize_query(query), json.dumps(filters or {}, sort_keys=True), version
+    )
+    offset = position['o'] if position else 0
+
+    cached = ranking_cache.get(key)
+    if cached is None or (len(cached[1]) == cached[2] and len(cached[1]) < offset + k):
+        depth = max(SEARCH_RANKING_DEPTH, offset + k)
+        if mode == 'hybrid':
+            results, retrieval = hybrid_search(query, k=k, filters=filters, depth=depth)
+        else:
+            # Generate query embedding, then search vectors
+            query_embedding = query_embedding or generate_embedding(query)
+            results, retrieval = search_vectors(query_embedding, k=depth, filters=filters), 'vector'
+        cached = (retrieval, results, depth)
+        ranking_cache.put(key, cached)
+    retrieval, ranking, depth = cached
+
+    start = offset
+    if position and position.get('v') != version:
+        ids = [result['cocktail_id'] for result in ranking]
+        if position.get('id') in ids:
+            start = ids.index(position['id']) + 1
+        else:
+            last_score = position.get('s', float('inf'))
+            below = (i for i, result in enumerate(ranking) if result['score'] < last_score)
+            start = next(below, len(ranking))
+        print(f"Index changed since the cursor was issued; resuming at rank {start}, not {offset}")
+
+    page = ranking[start:start + k]
+    more = start + k < len(ranking) or len(ranking) == depth
+    next_cursor = None
+    if page and more:
+        next_cursor = encode_cursor({
+            'q': query, 'f': filters or {}, 'm': mode, 'k': k, 'o': start + len(page), 'v': version,
+            'id': page[-1]['cocktail_id'], 's': page[-1]['score'], 'c': include_context
+        })
+    return page, retrieval, next_cursor
+
+
 def generate_embedding(text: str) -> List[float]:
     """
-    Generate embedding for search query
+    Generate embedding for search query. The query is normalized (case/whitespace)
+    and looked up in the query-embedding cache first; only misses call Bedrock.
     """
+    normalized = normalize_query(text)
+    cached = query_embedding_cache.get(normalized, EMBEDDING_VERSION)
+    if cached is not None:
+        return cached
+
+    embedding = invoke_embedding_model(normalized)
+    query_embedding_cache.put(normalized, EMBEDDING_VERSION, embedding)
+    return embedding
+
+
+def invoke_embedding_model(normalized: str) -> List[float]:
+    """One Bedrock embedding call for an already-normalized query (no caching)."""
     response = bedrock.invoke_model(
         modelId=BEDROCK_EMBEDDING_MODEL,
-        body=json.dumps({"inputText": text})
+        body=json.dumps({
+            "inputText": normalized,
+            "dimensions": EMBEDDING_DIMENSION,
+            "normalize": EMBEDDING_NORMALIZE
+        })
     )
     
     response_body = json.loads(response['body'].read())
@@ -122,8 +447,9 @@ def search_vectors(
     Search OpenSearch using KNN
     """
     if not opensearch_client:
-        # Default path: real cosine similarity over S3-stored Titan v2 embeddings.
-        return dynamodb_vector_search(query_embedding, k)
+        # Default path: real cosine similarity over S3-stored Titan v2 embeddings
+        # (exact, or IVF-probed once the embed Lambda has trained an ANN artifact).
+        return dynamodb_vector_search(query_embedding, k, filters=filters)
     
     # Build OpenSearch query
     query_body = {
@@ -174,62 +500,288 @@ def search_vectors(
     return results
 
 
-def dynamodb_vector_search(query_embedding: List[float], k: int) -> List[Dict[str, Any]]:
+def batch_search_vectors(
+    query_embeddings: List[List[float]],
+    k: int = 5,
+    filters: Dict[str, Any] = None
+) -> List[List[Dict[str, Any]]]:
     """
-    Real semantic search without OpenSearch: scan embedded items in DynamoDB, load
-    each item's stored Titan v2 embedding from S3, rank by cosine similarity to the
-    query, return the true top-k. No mock scores.
+    Per-query top-k for many embeddings. The default path scores the whole batch
+    with one matrix-matrix product over the corpus cache; OpenSearch (when
+    configured) is queried once per embedding.
     """
+    if opensearch_client:
+        return [
+            search_vectors(query_embedding, k=k, filters=filters)
+            for query_embedding in query_embeddings
+        ]
+    corpus = get_corpus()
+    return [
+        [result_from_item(item, score) for item, score in results]
+        for results in corpus.search_batch(query_embeddings, k, filters=filters)
+    ]
+
+
+def current_index_version() -> str:
+    """
+    Corpus version for cache keys: the warm corpus's version while it is fresh,
+    otherwise one HEAD on the packed index (no corpus load). None with OpenSearch.
+    """
+    if opensearch_client:
+        return None
+    cache = _corpus_cache
+    if cache and cache.is_fresh(INDEX_CACHE_TTL_SECONDS):
+        return cache.version
+    return index_version(s3, EMBEDDINGS_BUCKET)
+
+
+def get_corpus() -> CorpusCache:
+    """
+    Return the warm-container corpus cache, reloading (DynamoDB scan + packed index)
+    only when the staleness window has passed and the index version has changed.
+    """
+    global _corpus_cache
+    now = time.time()
+    cache = _corpus_cache
+    if cache and cache.is_fresh(INDEX_CACHE_TTL_SECONDS, now):
+        return cache
+
+    version = index_version(s3, EMBEDDINGS_BUCKET)
+    if cache and version is not None and version == cache.version:
+        cache.checked_at = now
+        return cache
+
     table = dynamodb.Table(METADATA_TABLE)
-    items = table.scan(FilterExpression='attribute_exists(embedding_id)').get('Items', [])
-
-    scored_items = []
-    for item in items:
-        item_embedding = load_primary_embedding(item.get('embedding_id'))
-        if not item_embedding:
-            continue  # skip items whose embedding can't be loaded — never fake a score
-        score = cosine_similarity(query_embedding, item_embedding)
-        scored_items.append({
-            'cocktail_id': item.get('cocktail_id'),
-            'score': score,
-            'name': item.get('name'),
-            'category': item.get('category'),
-            'description': item.get('enhanced_metadata', {}).get('description', '') if isinstance(item.get('enhanced_metadata'), dict) else ''
-        })
+    items, _ = parallel_scan(
+        table, projection=CORPUS_ATTRIBUTES, filter_expression='attribute_exists(embedding_id)'
+    )
+    vector_index = load_index_segments(
+        s3, EMBEDDINGS_BUCKET, cache_dir=INDEX_CACHE_DIR, version=version
+    )
+    if vector_index is not None and vector_index.embedding_version != EMBEDDING_VERSION:
+        raise ValueError(
+            f"Vector index holds {vector_index.embedding_version} embeddings but search is "
+            f"configured for {EMBEDDING_VERSION}; align EMBEDDING_DIMENSION with the embed "
+            f"Lambda and re-embed"
+        )
+    loaded_version = vector_index.etag if vector_index else None
+    ivf_centroids = None
+    if vector_index:
+        ivf_centroids = load_ivf_centroids(s3, EMBEDDINGS_BUCKET, vector_index.generation)
+    lexical_index = load_lexical_index(s3, EMBEDDINGS_BUCKET)
+
+    # Keep the negative cache only if the corpus version didn't move
+    failed = cache.failed_embedding_ids if cache and cache.version == loaded_version else None
+    _corpus_cache = CorpusCache(
+        loaded_version,
+        items,
+        vector_index,
+        load_item_embeddings,
+        failed_embedding_ids=failed,
+        index_mode=INDEX_MODE,
+        rerank_factor=RERANK_FACTOR,
+        ivf_centroids=ivf_centroids,
+        nprobe=IVF_NPROBE,
+        chunk_fusion=CHUNK_FUSION,
+        chunk_weights=CHUNK_WEIGHTS,
+        lexical_index=lexical_index,
+        fragments=load_fragments(s3, EMBEDDINGS_BUCKET),
+        dimension=EMBEDDING_DIMENSION
+    )
+    if cache is None or cache.version != loaded_version:
+        # Entries for the old version can never be hit again; free them now
+        result_cache.local.clear()
+        ranking_cache.clear()
+        semantic_cache.clear()
+    ivf_lists = len(ivf_centroids) if ivf_centroids is not None else 0
+    print(
+        f"Corpus cache reloaded: {len(items)} items, {len(_corpus_cache.live_rows)} chunk vectors, "
+        f"index version {loaded_version}, mode {INDEX_MODE}, IVF lists {ivf_lists}, "
+        f"lexical docs {len(lexical_index) if lexical_index else 0}, "
+        f"fragments {len(_corpus_cache.fragments)}"
+    )
+    return _corpus_cache
 
-    scored_items.sort(key=lambda x: x['score'], reverse=True)
-    return scored_items[:k]
+
+def result_from_item(item: Dict[str, Any], score: float) -> Dict[str, Any]:
+    """Search-result shape shared by the vector, lexical and hybrid paths."""
+    enhanced_meta = item.get('enhanced_metadata', {})
+    if not isinstance(enhanced_meta, dict):
+        enhanced_meta = {}
+    return {
+        'cocktail_id': item.get('cocktail_id'),
+        'score': score,
+        'name': item.get('name'),
+        'category': item.get('category'),
+        'description': enhanced_meta.get('description', '')
+    }
 
 
-def load_primary_embedding(embedding_id: str) -> List[float]:
+def dynamodb_vector_search(
+    query_embedding: List[float],
+    k: int,
+    filters: Dict[str, Any] = None
+) -> List[Dict[str, Any]]:
     """
-    Load the primary-chunk embedding for an item from S3 (embeddings/<id>.json).
-    Returns None if missing/unreadable so the caller can skip it cleanly.
+    Real semantic search without OpenSearch: take the embedded DynamoDB items and
+    their Titan v2 vectors from the warm corpus cache (packed index, one S3 GET per
+    corpus version), score every chunk against the query in one NumPy
+    matrix-vector product (all rows, or the IVF_NPROBE nearest IVF lists), fuse
+    chunk scores per cocktail (CHUNK_FUSION), and return the top-k. Filters
+    (category, alcoholic, glass, difficulty) are applied first via the corpus
+    bitmaps, so only matching items are scored. Items not yet in the index fall
+    back to their embeddings/<id>.json. No mock scores.
+    """
+    corpus = get_corpus()
+    hits = corpus.search(query_embedding, k, filters=filters)
+    return [result_from_item(item, score) for item, score in hits]
+
+
+def hybrid_search(
+    query: str,
+    k: int,
+    filters: Dict[str, Any] = None,
+    depth: int = None
+) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    BM25 over the prebuilt inverted index fused with vector search by reciprocal rank
+    fusion. Short queries whose terms all appear together in at least k documents
+    (e.g. an exact ingredient) are answered from the lexical index alone, skipping
+    the Bedrock embedding call. Returns up to depth (default k) results and
+    retrieval, which is 'lexical', 'hybrid' or 'vector' (no lexical index available).
+    """
+    depth = max(depth or k, k)
+    corpus = get_corpus()
+    lexical = corpus.lexical_index
+    if lexical is None:
+        return search_vectors(generate_embedding(query), k=depth, filters=filters), 'vector'
+
+    candidates = max(HYBRID_CANDIDATES, depth)
+
+    def matching(hits):
+        return [
+            (cocktail_id, score) for cocktail_id, score in hits
+            if cocktail_id in corpus.items_by_id
+            and matches_filters(corpus.items_by_id[cocktail_id], filters)
+        ]
+
+    if len(tokenize(query)) <= LEXICAL_SHORTCUT_MAX_TERMS:
+        exact_hits = matching(lexical.search(query, candidates, require_all=True))
+        if exact_hits and len(exact_hits) >= k:
+            return [
+                result_from_item(corpus.items_by_id[cocktail_id], score)
+                for cocktail_id, score in exact_hits[:depth]
+            ], 'lexical'
+
+    lexical_hits = matching(lexical.search(query, candidates))
+
+    vector_hits = search_vectors(generate_embedding(query), k=candidates, filters=filters)
+    vector_by_id = {hit['cocktail_id']: hit for hit in vector_hits}
+    fused = reciprocal_rank_fusion(
+        [
+            [hit['cocktail_id'] for hit in vector_hits],
+            [cocktail_id for cocktail_id, _ in lexical_hits]
+        ],
+        depth
+    )
+
+    results = []
+    for cocktail_id, score in fused:
+        if cocktail_id in corpus.items_by_id:
+            results.append(result_from_item(corpus.items_by_id[cocktail_id], score))
+        else:
+            results.append({**vector_by_id[cocktail_id], 'score': score})
+    return results, 'hybrid'
+
+
+def load_item_embeddings(embedding_id: str) -> List[Tuple[str, List[float]]]:
+    """
+    Load every chunk embedding for an item from S3 (embeddings/<id>.json) as
+    (chunk_id, embedding) pairs. Returns None if missing/unreadable so the caller
+    can skip it cleanly.
     """
     if not embedding_id:
         return None
     try:
         obj = s3.get_object(Bucket=EMBEDDINGS_BUCKET, Key=f"embeddings/{embedding_id}.json")
         data = json.loads(obj['Body'].read())
-        return data['chunks'][0]['embedding']
+        return [(chunk['chunk_id'], chunk['embedding']) for chunk in data['chunks']]
     except Exception as e:
         print(f"Could not load embedding {embedding_id}: {e}")
         return None
 
 
-def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
-    """Cosine similarity between two equal-length vectors (pure stdlib, no numpy)."""
-    dot = sum(a * b for a, b in zip(vec1, vec2))
-    mag1 = math.sqrt(sum(a * a for a in vec1))
-    mag2 = math.sqrt(sum(b * b for b in vec2))
-    if mag1 == 0 or mag2 == 0:
-        return 0.0
-    return dot / (mag1 * mag2)
+def enrich_results(
+    results: List[Dict[str, Any]],
+    include_context: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Enrich search results with full metadata. Cocktails with a precomputed response
+    fragment are a lookup plus relevance_score (and, with include_context, the
+    ready-to-prompt RAG block). Otherwise items the warm corpus cache already
+    scanned are reused as-is; only the rest are fetched, in one BatchGetItem round
+    trip (plus retries of unprocessed keys) instead of a get_item per result.
+    Result order is preserved; ids with no item are dropped.
+    """
+    fragments = _corpus_cache.fragments if _corpus_cache is not None else {}
+    cached = _corpus_cache.items_by_id if _corpus_cache is not None else {}
+    missing = [
+        result['cocktail_id'] for result in results
+        if result['cocktail_id'] not in fragments and result['cocktail_id'] not in cached
+    ]
+    fetched = batch_get_items(missing) if missing else {}
+
+    enriched = []
+    for result in results:
+        fragment = fragments.get(result['cocktail_id'])
+        if fragment is not None:
+            enriched.append({**fragment['result'], 'relevance_score': float(result['score'])})
+            if include_context:
+                enriched[-1]['context'] = fragment['context']
+            continue
+        item = cached.get(result['cocktail_id']) or fetched.get(result['cocktail_id'])
+        if item is not None:
+            enriched.append(enriched_result(item, result))
+    return enriched
 
 
-def enrich_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def batch_get_items(cocktail_ids: List[str]) -> Dict[str, Dict[str, Any]]:
     """
-    Enrich search results with full metadata from DynamoDB
+    Fetch metadata items by id with BatchGetItem (100 keys per request), projecting
+    only the attributes enrichment needs and retrying UnprocessedKeys with backoff.
+    """
+    unique_ids = list(dict.fromkeys(cocktail_ids))
+    items = {}
+    for start in range(0, len(unique_ids), BATCH_GET_MAX_KEYS):
+        keys = unique_ids[start:start + BATCH_GET_MAX_KEYS]
+        request = {
+            METADATA_TABLE: {
+                'Keys': [{'cocktail_id': cocktail_id} for cocktail_id in keys],
+                'ProjectionExpression': ENRICH_PROJECTION,
+                'ExpressionAttributeNames': {'#name': 'name'}  # reserved word
+            }
+        }
+        for attempt in range(BATCH_GET_MAX_RETRIES + 1):
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(METADATA_TABLE, []):
+                items[item['cocktail_id']] = item
+            request = response.get('UnprocessedKeys') or {}
+            if not request:
+                break
+            time.sleep(min(0.05 * (2 ** attempt), 1.0))
+        if request:
+            unprocessed = len(request.get(METADATA_TABLE, {}).get('Keys', []))
+            print(
+                f"BatchGetItem left {unprocessed} keys unprocessed after "
+                f"{BATCH_GET_MAX_RETRIES} retries"
+            )
+    return items
+
+
+def enriched_result(item: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Full result shape for one search hit and its metadata item (keep in sync with
+    the embed Lambda's fragment_builder)
     """
     from decimal import Decimal
     
@@ -243,34 +795,22 @@ def enrich_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             return [convert_decimal(item) for item in obj]
         return obj
     
-    table = dynamodb.Table(METADATA_TABLE)
-    
-    enriched = []
-    for result in results:
-        # Get full metadata
-        response = table.get_item(Key={'cocktail_id': result['cocktail_id']})
-        
-        if 'Item' in response:
-            item = response['Item']
-            enhanced_meta = item.get('enhanced_metadata', {})
-            if isinstance(enhanced_meta, dict):
-                enhanced_meta = convert_decimal(enhanced_meta)
-            
-            enriched.append({
-                'cocktail_id': result['cocktail_id'],
-                'name': item.get('name'),
-                'category': item.get('category'),
-                'alcoholic': item.get('alcoholic'),
-                'glass': item.get('glass'),
-                'image_url': item.get('image_url'),
-                'description': enhanced_meta.get('description', '') if isinstance(enhanced_meta, dict) else '',
-                'flavor_profile': enhanced_meta.get('flavor_profile', []) if isinstance(enhanced_meta, dict) else [],
-                'occasions': enhanced_meta.get('occasions', []) if isinstance(enhanced_meta, dict) else [],
-                'difficulty': enhanced_meta.get('difficulty', '') if isinstance(enhanced_meta, dict) else '',
-                'prep_time_minutes': enhanced_meta.get('prep_time_minutes') if isinstance(enhanced_meta, dict) else None,
-                'ingredients': convert_decimal(item.get('ingredients', [])),
-                'instructions': item.get('instructions', ''),
-                'relevance_score': float(result['score'])
-            })
+    enhanced_meta = item.get('enhanced_metadata', {})
+    enhanced_meta = convert_decimal(enhanced_meta) if isinstance(enhanced_meta, dict) else {}
     
-    return enriched
+    return {
+        'cocktail_id': result['cocktail_id'],
+        'name': item.get('name'),
+        'category': item.get('category'),
+        'alcoholic': item.get('alcoholic'),
+        'glass': item.get('glass'),
+        'image_url': item.get('image_url'),
+        'description': enhanced_meta.get('description', ''),
+        'flavor_profile': enhanced_meta.get('flavor_profile', []),
+        'occasions': enhanced_meta.get('occasions', []),
+        'difficulty': enhanced_meta.get('difficulty', ''),
+        'prep_time_minutes': enhanced_meta.get('prep_time_minutes'),
+        'ingredients': convert_decimal(item.get('ingredients', [])),
+        'instructions': item.get('instructions', ''),
+        'relevance_score': float(result['score'])
+    }
@@ -0,0 +1,120 @@
+"""
+lexical_index.py — BM25 over the prebuilt inverted index, and rank fusion
+
+Loads index/lexical.json.gz (written by lambdas/embed/lexical_builder.py) into
+per-term NumPy posting arrays. A query touches only its own terms' postings, so
+keyword scoring takes microseconds and needs no embedding call.
+
+Keep tokenize() in sync with the writer.
+"""
+
+import gzip
+import json
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+LEXICAL_KEY = 'index/lexical.json.gz'
+LEXICAL_FORMAT_VERSION = 1
+
+STOPWORDS = frozenset(
+    'a an and are as at be but by for from has have in into is it its of on or that the '
+    'this to was were will with your you oz ml cl tsp tbsp cup cups part parts'.split()
+)
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens, stopwords dropped, trailing plural 's' stripped."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall((text or '').lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    BM25 scorer over the inverted index: postings[term] = (doc indices, term freqs),
+    with idf and per-document length normalization precomputed at load.
+    """
+
+    def __init__(self, data: Dict[str, Any], k1: float = 1.2, b: float = 0.75):
+        self.doc_ids = data['doc_ids']
+        self.generation = data.get('generation', 0)
+        self.k1 = k1
+        n_docs = len(self.doc_ids)
+        doc_lengths = np.asarray(data['doc_lengths'], dtype=np.float32)
+        avgdl = data.get('avgdl') or 1.0
+        # Denominator term k1 * (1 - b + b * dl / avgdl), per document
+        self.length_norm = k1 * (1 - b + b * doc_lengths / avgdl)
+        self.postings = {}
+        self.idf = {}
+        for term, (docs, tfs) in data['postings'].items():
+            self.postings[term] = (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            df = len(docs)
+            self.idf[term] = float(np.log(1 + (n_docs - df + 0.5) / (df + 0.5)))
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def scores(self, terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 score of every document for the given query terms (0 = no match), and
+        how many distinct query terms each document contains.
+        """
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        matched_terms = np.zeros(len(self.doc_ids), dtype=np.int32)
+        for term in set(terms):
+            if term not in self.postings:
+                continue
+            docs, tfs = self.postings[term]
+            scores[docs] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + self.length_norm[docs])
+            matched_terms[docs] += 1
+        return scores, matched_terms
+
+    def search(self, query: str, n: int, require_all: bool = False) -> List[Tuple[str, float]]:
+        """
+        Top-n (cocktail_id, bm25 score) for a query; only documents that match, or with
+        require_all only documents containing every query term.
+        """
+        terms = tokenize(query)
+        scores, matched_terms = self.scores(terms)
+        if require_all:
+            matched = np.flatnonzero(matched_terms == len(set(terms))) if terms else np.empty(0, dtype=np.intp)
+        else:
+            matched = np.flatnonzero(scores > 0)
+        if not len(matched):
+            return []
+        order = np.argsort(-scores[matched], kind='stable')[:n]
+        return [(self.doc_ids[i], float(scores[i])) for i in matched[order]]
+
+
+def load_lexical_index(s3, bucket: str) -> Optional[LexicalIndex]:
+    """Fetch the lexical index; None if missing/unreadable (hybrid degrades to vector)."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=LEXICAL_KEY)
+        raw = obj['Body'].read()
+        data = json.loads(gzip.decompress(raw) if raw[:2] == b'\x1f\x8b' else raw)
+        if data.get('format_version') != LEXICAL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported lexical index format version {data.get('format_version')}")
+        return LexicalIndex(data)
+    except Exception as e:
+        print(f"Lexical index unavailable, hybrid search will use vectors only: {e}")
+        return None
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int, rrf_k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse ranked id lists: score(d) = sum over lists of 1 / (rrf_k + rank(d)).
+    Returns the top-k (id, fused score), best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda pair: pair[1], reverse=True)[:k]
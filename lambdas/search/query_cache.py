@@ -0,0 +1,250 @@
+"""
+query_cache.py — Caches in front of the search Lambda's expensive steps
+
+Two tiers: a per-container LRU (module-level instances survive warm invocations) and
+an optional shared DynamoDB table (SEARCH_CACHE_TABLE) with a TTL attribute, so
+containers share each other's work. The shared tier is best-effort — any error there
+is logged and treated as a miss, never as a failed search. The semantic cache
+(near-duplicate queries by embedding similarity) is per-container only.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, List, Tuple
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used for keys and for embedding."""
+    return ' '.join(text.lower().split())
+
+
+def cache_key(namespace: str, *parts: Any) -> str:
+    """Stable key for a namespace ('emb', ...) and its parts."""
+    digest = hashlib.sha256('\n'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f"{namespace}#{digest}"
+
+
+class LRUCache:
+    """
+    Bounded in-process LRU with a per-entry TTL. Tracks hits/misses for logging.
+    Safe to share between threads (OrderedDict reordering is not atomic).
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        with self.lock:
+            self.entries[key] = (time.time() + (ttl_seconds or self.ttl_seconds), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class EmbeddingCache:
+    """
+    Query-embedding cache keyed on (embedding version, normalized query text). Hits
+    skip the Bedrock embedding call entirely. Shared-tier vectors are stored as raw float32
+    bytes (a DynamoDB Binary attribute), not as a list of Decimals.
+    """
+
+    def __init__(self, table=None, max_entries: int = 1024, ttl_seconds: float = 86400):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(max_entries, ttl_seconds)
+        self.shared_hits = 0
+
+    def get(self, normalized_query: str, model_id: str) -> Optional[List[float]]:
+        key = cache_key('emb', model_id, normalized_query)
+        embedding = self.local.get(key)
+        if embedding is not None or self.table is None:
+            return embedding
+
+        try:
+            item = self.table.get_item(Key={'cache_key': key}).get('Item')
+        except Exception as e:
+            print(f"Shared embedding cache read failed: {e}")
+            return None
+        if not item or float(item.get('expires_at', 0)) < time.time():
+            return None
+
+        raw = item['embedding']
+        embedding = np.frombuffer(getattr(raw, 'value', raw), dtype='<f4').tolist()
+        self.local.put(key, embedding)
+        self.shared_hits += 1
+        return embedding
+
+    def put(self, normalized_query: str, model_id: str, embedding: List[float]) -> None:
+        key = cache_key('emb', model_id, normalized_query)
+        self.local.put(key, embedding)
+        if self.table is None:
+            return
+        try:
+            self.table.put_item(Item={
+                'cache_key': key,
+                'embedding': np.asarray(embedding, dtype='<f4').tobytes(),
+                'model_id': model_id,
+                'expires_at': int(time.time() + self.ttl_seconds)
+            })
+        except Exception as e:
+            print(f"Shared embedding cache write failed: {e}")
+
+
+class ResultCache:
+    """
+    Final search responses keyed on (mode, normalized query, k, filters, index
+    version). The index version is the packed index's ETag, which the embed Lambda
+    changes on every write, so new embeddings invalidate old entries without any
+    explicit purge; stale shared-tier rows just age out via TTL. Shared-tier
+    payloads are gzipped JSON (a Binary attribute) to stay well under the item limit.
+    """
+
+    def __init__(self, table=None, max_entries: int = 512, ttl_seconds: float = 300):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(max_entries, ttl_seconds)
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(
+        mode: str,
+        normalized_query: str,
+        k: int,
+        filters: Any,
+        version: Optional[str],
+        include_context: bool = False
+    ) -> str:
+        return cache_key(
+            'res', mode, normalized_query, k, json.dumps(filters or {}, sort_keys=True), version, include_context
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        if self.table is not None:
+            try:
+                item = self.table.get_item(Key={'cache_key': key}).get('Item')
+            except Exception as e:
+                print(f"Shared result cache read failed: {e}")
+                item = None
+            if item and float(item.get('expires_at', 0)) >= time.time():
+                raw = item['payload']
+                value = json.loads(gzip.decompress(getattr(raw, 'value', raw)))
+                self.local.put(key, value)
+                self.shared_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        self.local.put(key, value)
+        if self.table is None:
+            return
+        try:
+            self.table.put_item(Item={
+                'cache_key': key,
+                'payload': gzip.compress(json.dumps(value, separators=(',', ':')).encode('utf-8')),
+                'expires_at': int(time.time() + self.ttl_seconds)
+            })
+        except Exception as e:
+            print(f"Shared result cache write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters since the container started, for the per-request log line."""
+        hits = self.local.hits + self.shared_hits
+        lookups = hits + self.misses
+        return {
+            'hits': hits,
+            'local_hits': self.local.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': round(hits / lookups, 3) if lookups else None
+        }
+
+
+class SemanticCache:
+    """
+    Responses for recent queries, found by query-embedding similarity rather than by
+    key, so paraphrases ("refreshing summer drink" / "something refreshing for
+    summer") share an entry. Holds a small ring buffer of unit-normalized query
+    vectors; a lookup is one matrix-vector product over it. Entries only match
+    within the same scope (k, filters, index version) and expire after the TTL.
+    """
+
+    def __init__(self, max_entries: int = 256, threshold: float = 0.95, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.vectors = None
+        self.entries = [None] * max_entries  # (scope, expires_at, query, value)
+        self.next_slot = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding: List[float], scope: str) -> Optional[Tuple[Any, str, float]]:
+        """(value, original query, cosine similarity) of the closest live entry in scope above the threshold."""
+        if self.vectors is None or len(embedding) != self.vectors.shape[1]:
+            self.misses += 1
+            return None
+        similarities = self.vectors @ self._normalize(embedding)
+        now = time.time()
+        for slot in np.argsort(-similarities):
+            if similarities[slot] < self.threshold:
+                break
+            entry = self.entries[slot]
+            if entry is not None and entry[0] == scope and entry[1] >= now:
+                self.hits += 1
+                return entry[3], entry[2], float(similarities[slot])
+        self.misses += 1
+        return None
+
+    def put(self, embedding: List[float], scope: str, query: str, value: Any) -> None:
+        vector = self._normalize(embedding)
+        if self.vectors is None or self.vectors.shape[1] != len(vector):
+            # Empty slots are zero vectors: similarity 0, never above the threshold
+            self.vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            self.entries = [None] * self.max_entries
+        slot = self.next_slot
+        self.vectors[slot] = vector
+        self.entries[slot] = (scope, time.time() + self.ttl_seconds, query, value)
+        self.next_slot = (slot + 1) % self.max_entries
+
+    def clear(self) -> None:
+        self.vectors = None
+        self.entries = [None] * self.max_entries
+        self.next_slot = 0
@@ -0,0 +1,29 @@
+"""
+response_fragments.py — Reader for the precomputed per-cocktail response fragments
+
+Loads index/fragments.json.gz (written by lambdas/embed/fragment_builder.py) once
+per corpus version. Each cocktail's `result` is the enriched search-result dict,
+already JSON-native, and `context` is its RAG prompt block body, so enrichment
+is a dict lookup instead of a Decimal walk and re-format per request.
+"""
+
+import gzip
+import json
+from typing import Dict, Any
+
+FRAGMENTS_KEY = 'index/fragments.json.gz'
+FRAGMENTS_FORMAT_VERSION = 1
+
+
+def load_fragments(s3, bucket: str) -> Dict[str, Dict[str, Any]]:
+    """{cocktail_id: {result, context}}; empty if missing/unreadable (enrichment builds dicts itself)."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=FRAGMENTS_KEY)
+        raw = obj['Body'].read()
+        data = json.loads(gzip.decompress(raw) if raw[:2] == b'\x1f\x8b' else raw)
+        if data.get('format_version') != FRAGMENTS_FORMAT_VERSION:
+            raise ValueError(f"Unsupported fragments format version {data.get('format_version')}")
+        return data['fragments']
+    except Exception as e:
+        print(f"Response fragments unavailable, enriching from items: {e}")
+        return {}
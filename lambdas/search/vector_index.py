@@ -0,0 +1,862 @@
+"""
+vector_index.py — Reader for the packed vector index artifact
+
+Loads index/vectors.bin (written by lambdas/embed/index_builder.py) in one S3 GET:
+a JSON id/offset table followed by a contiguous little-endian float32 matrix and
+(format v3) its int8 codes. Keep the layout in sync with the writer. With a cache
+directory (/tmp in the Lambda), the artifact is streamed to disk and memory-mapped
+instead, so only pages a query touches are resident; later cold starts in the same
+execution environment reuse the file after an MD5 check against the S3 ETag.
+
+The index holds every chunk embedding (name_desc, recipe, flavor) with a
+chunk-to-cocktail mapping. Rows are stored unit-normalized (older artifacts are
+normalized once at load), so cosine similarity for all chunks is a single
+matrix-vector product; chunk scores are then fused per cocktail (max or weighted
+mean) and top-k uses partial selection.
+
+Between compactions the embed Lambda appends delta segments (same layout) listed in
+index/manifest.json. load_index_segments reloads them whenever the manifest's ETag
+(the corpus version) changes and keeps every segment separate: each delta's
+tombstones only clear rows in a live-row mask, so the base stays memory-mapped.
+In int8 mode the first pass scans the artifact's per-dimension scalar-quantized
+codes and only the best candidates are rescored exactly from the float32 rows.
+When an IVF artifact (index/ivf.npz) matches the index generation, queries probe
+only the nprobe nearest inverted lists.
+"""
+
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+import numpy as np
+
+INDEX_KEY = 'index/vectors.bin'
+INDEX_MAGIC = b'MVIX'
+INDEX_FORMAT_VERSION = 3  # v3: int8 section; v2: one row per chunk (v1 held only the primary chunk)
+READABLE_FORMAT_VERSIONS = (1, 2, 3)
+IVF_KEY = 'index/ivf.npz'
+MANIFEST_KEY = 'index/manifest.json'
+DOWNLOAD_CHUNK_BYTES = 1 << 20
+# Manifest re-reads when a compaction swaps the base or deletes a delta mid-load
+SEGMENT_LOAD_ATTEMPTS = 3
+# Attributes that get per-value bitmaps for pre-filtering (difficulty lives in enhanced_metadata)
+FILTER_ATTRIBUTES = ('category', 'alcoholic', 'glass', 'difficulty')
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Unit-normalize each row (float32). All-zero rows stay zero and score 0."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first. argpartition selects the k in O(n);
+    only those k are sorted.
+    """
+    k = min(int(k), len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class QuantizedMatrix:
+    """
+    Per-dimension int8 scalar quantization of a normalized float32 matrix:
+    x[:, d] ~= offset[d] + scale[d] * code[:, d], codes in [-127, 127]. A dot product
+    with a query becomes codes @ (scale * q) + offset . q, so the scan reads one byte
+    per dimension instead of four. Codes normally come precomputed in the artifact
+    (possibly a view over its memory map); from_matrix quantizes at load for rows
+    that have none.
+    """
+
+    BLOCK_ROWS = 256  # float32 block temporaries stay cache-sized (1 MB at 1024 dims)
+
+    def __init__(self, codes: np.ndarray, offset: np.ndarray, scale: np.ndarray):
+        self.codes = codes
+        self.offset = offset
+        self.scale = scale
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray) -> 'QuantizedMatrix':
+        """Quantize in memory (keep in sync with quantize_int8 in the embed index_builder)."""
+        dimension = matrix.shape[1]
+        if not len(matrix):
+            return cls(
+                np.zeros((0, dimension), dtype=np.int8),
+                np.zeros(dimension, dtype=np.float32),
+                np.ones(dimension, dtype=np.float32)
+            )
+        lo = matrix.min(axis=0)
+        hi = matrix.max(axis=0)
+        offset = ((hi + lo) / 2).astype(np.float32)
+        scale = ((hi - lo) / 254).astype(np.float32)
+        scale[scale == 0] = 1.0
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        for start in range(0, len(matrix), cls.BLOCK_ROWS):
+            block = (matrix[start:start + cls.BLOCK_ROWS] - offset) / scale
+            codes[start:start + cls.BLOCK_ROWS] = np.clip(np.rint(block), -127, 127)
+        return cls(codes, offset, scale)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.offset.nbytes + self.scale.nbytes
+
+    def scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Approximate dot products of every row (or just `rows`) with a normalized query
+        (dim,) or queries (dim, n).
+        """
+        codes = self.codes if rows is None else self.codes[rows]
+        weighted = (queries.T * self.scale).T.astype(np.float32)
+        base = (self.offset @ queries).astype(np.float32)
+        out = np.empty((len(codes),) + queries.shape[1:], dtype=np.float32)
+        for start in range(0, len(codes), self.BLOCK_ROWS):
+            block = codes[start:start + self.BLOCK_ROWS].astype(np.float32)
+            out[start:start + self.BLOCK_ROWS] = block @ weighted + base
+        return out
+
+
+def embedding_version(model_id: Optional[str], dimension: int) -> str:
+    """Tag for an embedding space (keep in sync with lambdas/embed/index_builder.py)."""
+    return f"{model_id}#{dimension}"
+
+
+class VectorIndex:
+    """
+    View of one packed segment: header fields (entries map each row to its chunk and
+    cocktail) plus a unit-normalized (count x dimension) float32 matrix of chunk rows.
+    The matrix may be a read-only view over a memory-mapped file.
+    """
+
+    def __init__(
+        self,
+        header: Dict[str, Any],
+        vectors: np.ndarray,
+        etag: Optional[str] = None,
+        quantized: Optional[QuantizedMatrix] = None
+    ):
+        self.etag = etag
+        self.generation = header.get('generation', 0)
+        self.model_id = header.get('model_id')
+        self.dimension = header['dimension']
+        self.embedding_version = (
+            header.get('embedding_version') or embedding_version(self.model_id, self.dimension)
+        )
+        self.entries = header['entries']
+        # Delta segments: cocktails whose rows in earlier segments are superseded
+        self.tombstones = header.get('tombstones', [])
+        # Pre-normalized artifacts are used as-is (no copy, so a memory map stays a memory map)
+        self.vectors = vectors if header.get('normalized') else normalize_rows(vectors)
+        # Precomputed int8 codes (format v3); None for older artifacts
+        self.quantized = quantized
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def parse_index(data, etag: Optional[str] = None) -> VectorIndex:
+    """
+    Parse the raw artifact (bytes, or an mmap for a zero-copy view) into a VectorIndex.
+    """
+    if data[:4] != INDEX_MAGIC:
+        raise ValueError("Not a packed vector index (bad magic)")
+    (header_len,) = struct.unpack_from('<I', data, 4)
+    header_end = 8 + header_len
+    header = json.loads(data[8:header_end].decode('utf-8'))
+    if header.get('format_version') not in READABLE_FORMAT_VERSIONS:
+        raise ValueError(f"Unsupported index format version {header.get('format_version')}")
+
+    matrix_start = header_end + (-header_end % 4)
+    count, dimension = header['count'], header['dimension']
+    int8_start = matrix_start + count * dimension * 4
+    int8_bytes = dimension * 8 + count * dimension if header.get('quantization') == 'int8' else 0
+    if len(data) - int8_start != int8_bytes:
+        raise ValueError("Vector index matrix size does not match its header")
+    matrix = np.frombuffer(data, dtype='<f4', count=count * dimension, offset=matrix_start)
+
+    quantized = None
+    if int8_bytes:
+        offset = np.frombuffer(data, dtype='<f4', count=dimension, offset=int8_start)
+        scale = np.frombuffer(data, dtype='<f4', count=dimension, offset=int8_start + dimension * 4)
+        codes = np.frombuffer(
+            data, dtype=np.int8, count=count * dimension, offset=int8_start + dimension * 8
+        )
+        quantized = QuantizedMatrix(codes.reshape(count, dimension), offset, scale)
+    return VectorIndex(header, matrix.reshape(count, dimension), etag=etag, quantized=quantized)
+
+
+def _file_md5(path: str) -> str:
+    """MD5 of a file, read in chunks (the S3 ETag of a single-part upload)."""
+    digest = hashlib.md5(usedforsecurity=False)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _precondition_failed(error: Exception) -> bool:
+    """True when a conditional GET was refused (412) because the object has changed."""
+    return getattr(error, 'response', {}).get('Error', {}).get('Code') == 'PreconditionFailed'
+
+
+def _get_index(s3, bucket: str, if_match: Optional[str] = None) -> Dict[str, Any]:
+    """GET the packed index, If-Match `if_match` when given."""
+    conditions = {'IfMatch': if_match} if if_match else {}
+    return s3.get_object(Bucket=bucket, Key=INDEX_KEY, **conditions)
+
+
+def _download_index(s3, bucket: str, path: str, if_match: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Stream the artifact to `path` (via a .part file and an atomic rename, so a
+    concurrent reader never sees half a file) and record its ETag and MD5 beside it.
+    """
+    obj = _get_index(s3, bucket, if_match)
+    digest = hashlib.md5(usedforsecurity=False)
+    partial = f"{path}.part"
+    with open(partial, 'wb') as f:
+        for chunk in iter(lambda: obj['Body'].read(DOWNLOAD_CHUNK_BYTES), b''):
+            digest.update(chunk)
+            f.write(chunk)
+
+    etag = obj.get('ETag')
+    md5 = digest.hexdigest()
+    # Multipart ETags ('...-N') are not content MD5s; only single-part ones can be checked
+    if etag and '-' not in etag and etag.strip('"') != md5:
+        os.remove(partial)
+        raise ValueError(f"Downloaded index MD5 {md5} does not match ETag {etag}")
+    os.replace(partial, path)
+    meta = {'etag': etag, 'md5': md5, 'bytes': os.path.getsize(path)}
+    with open(f"{path}.json", 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def open_cached_index(
+    s3,
+    bucket: str,
+    cache_dir: str,
+    etag: Optional[str] = None,
+    conditional: bool = False
+) -> VectorIndex:
+    """
+    Memory-map the index from cache_dir, downloading it first unless the file on disk
+    is for the current ETag and still passes its MD5 check. With conditional, the
+    download is If-Match etag.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, 'vectors.bin')
+    meta = None
+    try:
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    if meta and etag and meta.get('etag') == etag and _file_md5(path) == meta.get('md5'):
+        source = 'reused'
+    else:
+        meta = _download_index(s3, bucket, path, if_match=etag if conditional else None)
+        source = 'downloaded'
+
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    index = parse_index(mapped, etag=meta['etag'])
+    print(f"Vector index memory-mapped from {path} ({source}, {meta['bytes']} bytes)")
+    return index
+
+
+def load_vector_index(
+    s3,
+    bucket: str,
+    cache_dir: Optional[str] = None,
+    etag: Optional[str] = None,
+    conditional: bool = False
+) -> Optional[VectorIndex]:
+    """
+    Load the packed index: memory-mapped from cache_dir when given (etag = current
+    version, to reuse a file from an earlier cold start), otherwise read with a
+    single GET. Returns None if it is missing or unreadable so the caller can fall
+    back to per-item embedding reads. With conditional, the base is read only if its
+    ETag is still etag; a 412 is raised for the caller to re-read the manifest.
+    """
+    if cache_dir:
+        try:
+            return open_cached_index(s3, bucket, cache_dir, etag, conditional=conditional)
+        except Exception as e:
+            if conditional and _precondition_failed(e):
+                raise
+            print(f"Memory-mapped index unavailable, reading into memory: {e}")
+    try:
+        obj = _get_index(s3, bucket, etag if conditional else None)
+        return parse_index(obj['Body'].read(), etag=obj.get('ETag'))
+    except Exception as e:
+        if conditional and _precondition_failed(e):
+            raise
+        print(f"Packed vector index unavailable, using per-item embeddings: {e}")
+        return None
+
+
+def load_manifest(s3, bucket: str) -> Optional[Dict[str, Any]]:
+    """The segment manifest, or None for indexes written before it existed."""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=MANIFEST_KEY)
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(obj['Body'].read())
+
+
+class SegmentedIndex:
+    """
+    The live index as loaded: the base and the manifest's deltas (in seq order) kept
+    as separate segments, so the base stays memory-mapped. Tombstones are resolved
+    into a per-segment live-row mask instead of copying the surviving rows out.
+    """
+
+    def __init__(self, segments: List[VectorIndex], etag: Optional[str] = None):
+        first = segments[0]
+        for segment in segments[1:]:
+            if segment.embedding_version != first.embedding_version:
+                raise ValueError(
+                    f"Index segments mix {first.embedding_version} and "
+                    f"{segment.embedding_version} embeddings"
+                )
+        self.segments = segments
+        self.etag = etag
+        self.generation = first.generation
+        self.model_id = first.model_id
+        self.dimension = first.dimension
+        self.embedding_version = first.embedding_version
+
+        # A row is dead if any later segment tombstones its cocktail
+        self.live = [np.ones(len(segment.vectors), dtype=bool) for segment in segments]
+        dead_after = set()
+        for position in range(len(segments) - 1, -1, -1):
+            if dead_after:
+                rows = [
+                    entry['row'] for entry in segments[position].entries
+                    if entry['cocktail_id'] in dead_after
+                ]
+                self.live[position][rows] = False
+            dead_after |= set(segments[position].tombstones)
+
+    def __len__(self) -> int:
+        return int(sum(live.sum() for live in self.live))
+
+
+def load_index_segments(
+    s3,
+    bucket: str,
+    cache_dir: Optional[str] = None,
+    version: Optional[str] = None
+) -> Optional[SegmentedIndex]:
+    """
+    Load the live index: the base (memory-mapped when cache_dir is given) plus the
+    manifest's delta segments. Indexes without a manifest load as a single segment.
+    The base is read If-Match the manifest's base ETag, so a compaction that swaps the
+    base (412) or deletes a listed delta mid-load triggers a re-read of the manifest
+    rather than mixing segments of two generations.
+    """
+    for attempt in range(SEGMENT_LOAD_ATTEMPTS):
+        manifest = load_manifest(s3, bucket)
+        if manifest is None:
+            index = load_vector_index(s3, bucket, cache_dir=cache_dir, etag=version)
+            return SegmentedIndex([index], etag=index.etag) if index is not None else None
+        base_etag = manifest['base'].get('etag')
+        try:
+            base = load_vector_index(
+                s3, bucket, cache_dir=cache_dir, etag=base_etag, conditional=bool(base_etag)
+            )
+            deltas = []
+            for delta in manifest['deltas']:
+                obj = s3.get_object(Bucket=bucket, Key=delta['key'])
+                deltas.append(parse_index(obj['Body'].read(), etag=delta.get('etag')))
+        except Exception as e:
+            stale = isinstance(e, s3.exceptions.NoSuchKey) or _precondition_failed(e)
+            if not stale or attempt == SEGMENT_LOAD_ATTEMPTS - 1:
+                raise
+            version = index_version(s3, bucket)
+            continue
+        segments = ([base] if base is not None else []) + deltas
+        if not segments:
+            return None
+        index = SegmentedIndex(segments, etag=version)
+        if deltas:
+            print(f"Loaded the base index with {len(deltas)} deltas ({len(index)} live rows)")
+        return index
+
+
+def index_version(s3, bucket: str) -> Optional[str]:
+    """
+    Cheap version marker for the corpus: the segment manifest's ETag (one HEAD
+    request), or the packed index's for indexes without a manifest. The embed Lambda
+    rewrites the manifest whenever it embeds something, so the ETag changes exactly
+    when the searchable corpus does. None if there is no index yet.
+    """
+    for key in (MANIFEST_KEY, INDEX_KEY):
+        try:
+            return s3.head_object(Bucket=bucket, Key=key).get('ETag')
+        except Exception:
+            continue
+    return None
+
+
+def load_ivf_centroids(s3, bucket: str, generation: int) -> Optional[np.ndarray]:
+    """
+    Fetch IVF centroids if they were trained on this index generation. A stale or
+    missing artifact returns None and search stays exact (brute force).
+    """
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=IVF_KEY)
+        with np.load(io.BytesIO(obj['Body'].read()), allow_pickle=False) as data:
+            trained_on = int(data['generation'][0])
+            if trained_on != generation:
+                print(f"IVF artifact is for generation {trained_on}, not {generation}; ignoring")
+                return None
+            return normalize_rows(data['centroids'])
+    except Exception as e:
+        print(f"IVF artifact unavailable, using exact scan: {e}")
+        return None
+
+
+def attribute_value(item: Dict[str, Any], attribute: str) -> str:
+    """Normalized (stripped, lowercase) filterable attribute of a metadata item."""
+    if attribute == 'difficulty':
+        metadata = item.get('enhanced_metadata', {})
+        value = metadata.get('difficulty') if isinstance(metadata, dict) else None
+    else:
+        value = item.get(attribute)
+    return str(value).strip().lower() if value is not None else ''
+
+
+def matches_filters(item: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> bool:
+    """Per-item filter check, for candidates that come from outside the bitmaps."""
+    for attribute, wanted in (filters or {}).items():
+        if attribute not in FILTER_ATTRIBUTES:
+            continue
+        wanted_values = wanted if isinstance(wanted, list) else [wanted]
+        allowed = {str(value).strip().lower() for value in wanted_values}
+        if attribute_value(item, attribute) not in allowed:
+            return False
+    return True
+
+
+class CorpusCache:
+    """
+    Warm-container snapshot of the searchable corpus, kept at module level in the
+    handler: the scanned DynamoDB items, the index segments scored in place (plus one
+    in-memory segment for items only the loader can supply), the row -> item mapping
+    used to fuse chunk scores per cocktail, and the filter bitmaps, IVF lists, int8
+    codes, BM25 index and response fragments that share its version check. See
+    search() for how the options change scoring.
+    """
+
+    def __init__(
+        self,
+        version: Optional[str],
+        items: List[Dict[str, Any]],
+        vector_index: Optional[SegmentedIndex],
+        loader: Callable[[str], Optional[List[Tuple[str, List[float]]]]],
+        failed_embedding_ids: Optional[set] = None,
+        index_mode: str = 'float32',
+        rerank_factor: int = 4,
+        ivf_centroids: Optional[np.ndarray] = None,
+        nprobe: int = 8,
+        chunk_fusion: str = 'max',
+        chunk_weights: Optional[Dict[str, float]] = None,
+        lexical_index=None,
+        fragments: Optional[Dict[str, Dict[str, Any]]] = None,
+        dimension: Optional[int] = None
+    ):
+        if index_mode not in ('float32', 'int8'):
+            raise ValueError(f"Unknown index mode {index_mode!r} (expected 'float32' or 'int8')")
+        if chunk_fusion not in ('max', 'weighted'):
+            raise ValueError(f"Unknown chunk fusion {chunk_fusion!r} (expected max or weighted)")
+        self.version = version
+        self.items = items
+        self.items_by_id = {item.get('cocktail_id'): item for item in items}
+        self.lexical_index = lexical_index
+        self.fragments = fragments or {}
+        self.index_mode = index_mode
+        self.rerank_factor = max(1, int(rerank_factor))
+        self.chunk_fusion = chunk_fusion
+        self.chunk_weights = chunk_weights or {}
+        self.failed_embedding_ids = set(failed_embedding_ids or ())
+        self.checked_at = time.time()
+        self.dimension = dimension
+        self._build_matrix(vector_index, loader)
+        self.quantized = self._build_quantized() if index_mode == 'int8' else None
+        self.nprobe = max(1, int(nprobe))
+        self.centroids, self.inverted_lists = self._build_inverted_lists(ivf_centroids)
+        self.bitmaps = self._build_bitmaps()
+
+    def is_fresh(self, ttl_seconds: float, now: Optional[float] = None) -> bool:
+        """True while inside the staleness window — no version check needed."""
+        return ((now or time.time()) - self.checked_at) < ttl_seconds
+
+    def _load_chunks(self, embedding_id: str, loader):
+        """
+        Chunk vectors for an item that isn't in the packed index, via the loader (at
+        most once per corpus version). Returns None for known-missing embeddings.
+        """
+        if not embedding_id or embedding_id in self.failed_embedding_ids:
+            return None
+
+        chunks = loader(embedding_id)
+        if not chunks:
+            self.failed_embedding_ids.add(embedding_id)
+            return None
+        return chunks
+
+    def _build_matrix(self, vector_index, loader) -> None:
+        """
+        Lay out the scoring rows: every index segment as-is (no copy, so a memory-mapped
+        base stays mapped), then one in-memory segment for items only the loader can
+        supply. row_item maps each row to its item in row_items, or -1 for rows that are
+        tombstoned or belong to no scanned item; those are never scored as results.
+        """
+        segments = vector_index.segments if vector_index is not None else []
+        dimension = vector_index.dimension if vector_index is not None else self.dimension
+        item_of_embedding = {}
+        for item in self.items:
+            item_of_embedding.setdefault(item.get('embedding_id'), item)
+
+        row_items, position_of, row_item, row_weights = [], {}, [], []
+        for segment, live in zip(segments, vector_index.live if vector_index is not None else []):
+            segment_items = np.full(len(segment.vectors), -1, dtype=np.int32)
+            segment_weights = np.zeros(len(segment.vectors), dtype=np.float32)
+            for entry in segment.entries:
+                item = item_of_embedding.get(entry['embedding_id'])
+                if item is None or not live[entry['row']]:
+                    continue
+                if entry['embedding_id'] not in position_of:
+                    position_of[entry['embedding_id']] = len(row_items)
+                    row_items.append(item)
+                segment_items[entry['row']] = position_of[entry['embedding_id']]
+                chunk_id = entry.get('chunk_id', 'name_desc')
+                segment_weights[entry['row']] = self.chunk_weights.get(chunk_id, 1.0)
+            row_item.append(segment_items)
+            row_weights.append(segment_weights)
+
+        vectors, loaded_items, loaded_weights = [], [], []
+        for item in self.items:
+            if item.get('embedding_id') in position_of:
+                continue
+            chunks = self._load_chunks(item.get('embedding_id'), loader)
+            if not chunks:
+                continue  # skip items whose embedding can't be loaded — never fake a score
+            dimension = dimension or len(chunks[0][1])
+            usable = [(chunk_id, vector) for chunk_id, vector in chunks if len(vector) == dimension]
+            if len(usable) != len(chunks):
+                print(f"Skipping chunks of {item.get('embedding_id')}: dimension != {dimension}")
+            for chunk_id, vector in usable:
+                vectors.append(vector)
+                loaded_items.append(len(row_items))
+                loaded_weights.append(self.chunk_weights.get(chunk_id, 1.0))
+            if usable:
+                row_items.append(item)
+
+        self.segment_vectors = [segment.vectors for segment in segments]
+        self.segment_codes = [segment.quantized for segment in segments]
+        self.index_segments = len(segments)
+        if vectors:
+            self.segment_vectors.append(normalize_rows(np.asarray(vectors, dtype=np.float32)))
+            self.segment_codes.append(None)
+            row_item.append(np.asarray(loaded_items, dtype=np.int32))
+            row_weights.append(np.asarray(loaded_weights, dtype=np.float32))
+        sizes = [len(vectors) for vectors in self.segment_vectors]
+        self.segment_starts = np.cumsum([0] + sizes[:-1]).astype(np.intp)
+        self.dimension = dimension
+
+        self.row_items = row_items
+        self.row_item = np.concatenate(row_item) if row_item else np.zeros(0, dtype=np.int32)
+        self.row_weights = (
+            np.concatenate(row_weights) if row_weights else np.zeros(0, dtype=np.float32)
+        )
+        self.live_rows = np.flatnonzero(self.row_item >= 0)
+        self.dead = None if len(self.live_rows) == len(self.row_item) else self.row_item < 0
+        # Items are numbered by first row, so their rows are contiguous exactly when the
+        # live item numbers never decrease; then full scans fuse with one reduceat
+        live_items = self.row_item[self.live_rows]
+        if not len(live_items):
+            self.item_starts = self.live_rows
+        elif np.all(live_items[1:] >= live_items[:-1]):
+            self.item_starts = self.live_rows[np.r_[True, live_items[1:] != live_items[:-1]]]
+        else:
+            self.item_starts = None
+        self.chunks_per_item = max(1, -(-len(self.live_rows) // max(1, len(row_items))))
+        # Live rows grouped by item: item i owns item_rows[item_row_starts[i]:item_row_starts[i+1]]
+        order = np.argsort(live_items, kind='stable')
+        self.item_rows = self.live_rows[order]
+        self.item_row_starts = np.searchsorted(live_items[order], np.arange(len(row_items) + 1))
+
+    def _gather(
+        self,
+        score_segment: Callable[[int, Optional[np.ndarray]], np.ndarray],
+        rows: Optional[np.ndarray],
+        tail=()
+    ) -> np.ndarray:
+        """
+        Run score_segment(segment, local_rows) per segment and lay the results out in
+        row order (rows=None: every row, local_rows=None).
+        """
+        if rows is None:
+            parts = [score_segment(segment, None) for segment in range(len(self.segment_vectors))]
+            return parts[0] if len(parts) == 1 else np.concatenate(parts)
+        out = np.empty((len(rows),) + tuple(tail), dtype=np.float32)
+        segment_of = np.searchsorted(self.segment_starts, rows, side='right') - 1
+        for segment in np.unique(segment_of):
+            picked = np.flatnonzero(segment_of == segment)
+            out[picked] = score_segment(segment, rows[picked] - self.segment_starts[segment])
+        return out
+
+    def _exact_scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Float32 dot products of every row (or `rows`) with a query (dim,) or queries (dim, n)."""
+        def score_segment(segment, local_rows):
+            vectors = self.segment_vectors[segment]
+            return (vectors if local_rows is None else vectors[local_rows]) @ queries
+        return self._gather(score_segment, rows, queries.shape[1:])
+
+    def _approximate_scores(
+        self,
+        queries: np.ndarray,
+        rows: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """First-pass int8 scores, shaped like _exact_scores."""
+        def score_segment(segment, local_rows):
+            return self.quantized[segment].scores(queries, local_rows)
+        return self._gather(score_segment, rows, queries.shape[1:])
+
+    def _build_quantized(self) -> List[QuantizedMatrix]:
+        """
+        int8 codes per segment: the artifact's own (scanned off the memory map, so the
+        float32 rows are only read to rescore shortlists), or quantized here for the
+        loader's rows and for artifacts written before codes were stored.
+        """
+        quantized = []
+        for position, (codes, vectors) in enumerate(zip(self.segment_codes, self.segment_vectors)):
+            if codes is None:
+                if position < self.index_segments:
+                    print(f"Segment {position} has no int8 codes, quantizing {len(vectors)} rows")
+                codes = QuantizedMatrix.from_matrix(vectors)
+            quantized.append(codes)
+        return quantized
+
+    def _build_bitmaps(self) -> Dict[str, Dict[str, np.ndarray]]:
+        """bitmaps[attribute][value] = packed bitset over row_items with that value."""
+        bitmaps = {}
+        for attribute in FILTER_ATTRIBUTES:
+            positions = {}
+            for position, item in enumerate(self.row_items):
+                positions.setdefault(attribute_value(item, attribute), []).append(position)
+            bitmaps[attribute] = {}
+            for value, members in positions.items():
+                mask = np.zeros(len(self.row_items), dtype=bool)
+                mask[members] = True
+                bitmaps[attribute][value] = np.packbits(mask)
+        return bitmaps
+
+    def filter_rows(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Live chunk rows of items matching every filter (a value or list of values per
+        attribute; values OR together, attributes AND together). None = unfiltered.
+        """
+        combined = None
+        for attribute, wanted in (filters or {}).items():
+            if attribute not in self.bitmaps:
+                print(f"Ignoring unsupported filter {attribute!r}")
+                continue
+            attribute_bits = np.zeros((len(self.row_items) + 7) // 8, dtype=np.uint8)
+            for value in (wanted if isinstance(wanted, list) else [wanted]):
+                bits = self.bitmaps[attribute].get(str(value).strip().lower())
+                if bits is not None:
+                    attribute_bits |= bits
+            combined = attribute_bits if combined is None else combined & attribute_bits
+        if combined is None:
+            return None
+        item_mask = np.unpackbits(combined, count=len(self.row_items)).astype(bool)
+        return self.live_rows[item_mask[self.row_item[self.live_rows]]]
+
+    def _build_inverted_lists(self, centroids: Optional[np.ndarray]):
+        """Assign every live row to its nearest centroid; one row-index array per list."""
+        if centroids is None or not len(self.live_rows) or centroids.shape[1] != self.dimension:
+            return None, None
+        # int8 mode assigns from the codes so building the lists doesn't page in every float32 row
+        score = self._approximate_scores if self.quantized is not None else self._exact_scores
+        assignments = np.empty(len(self.live_rows), dtype=np.int32)
+        for start in range(0, len(self.live_rows), QuantizedMatrix.BLOCK_ROWS):
+            block = self.live_rows[start:start + QuantizedMatrix.BLOCK_ROWS]
+            assignments[start:start + len(block)] = np.argmax(score(centroids.T, block), axis=1)
+        order = np.argsort(assignments, kind='stable')
+        boundaries = np.searchsorted(assignments[order], np.arange(1, len(centroids)))
+        return centroids, np.split(self.live_rows[order], boundaries)
+
+    def _probe(self, query: np.ndarray, min_candidates: int) -> Optional[np.ndarray]:
+        """
+        Row indices in the nprobe lists closest to the query, probing further lists
+        if those hold fewer than min_candidates rows (None = whole corpus).
+        """
+        if self.inverted_lists is None or self.nprobe >= len(self.centroids):
+            return None
+        probed, count = [], 0
+        for i in top_k_indices(self.centroids @ query, len(self.centroids)):
+            if len(probed) >= self.nprobe and count >= min_candidates:
+                break
+            probed.append(self.inverted_lists[i])
+            count += len(self.inverted_lists[i])
+        return np.concatenate(probed)
+
+    def _expand_items(self, rows: np.ndarray) -> np.ndarray:
+        """Every live row of each item that has a row in `rows`, in row order."""
+        items = np.unique(self.row_item[rows])
+        starts = self.item_row_starts[items]
+        counts = self.item_row_starts[items + 1] - starts
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.sort(self.item_rows[np.repeat(starts, counts) + within])
+
+    def _fuse(self, rows: Optional[np.ndarray], scores: np.ndarray) -> np.ndarray:
+        """
+        Per-item scores from chunk-row scores (rows=None means scores covers every row
+        in order, dead rows included). Items with no scored chunk get -inf.
+        """
+        n_items = len(self.row_items)
+        # reduceat needs contiguous items; weighted fusion must also skip dead rows
+        skips_dead = self.dead is not None and self.chunk_fusion != 'max'
+        needs_rows = self.item_starts is None or skips_dead
+        if rows is None and needs_rows:
+            rows, scores = self.live_rows, scores[self.live_rows]
+        if self.chunk_fusion == 'max':
+            if rows is None:
+                if self.dead is not None:
+                    scores[self.dead] = -np.inf
+                return np.maximum.reduceat(scores, self.item_starts)
+            fused = np.full(n_items, -np.inf, dtype=np.float32)
+            np.maximum.at(fused, self.row_item[rows], scores)
+            return fused
+
+        item_of_row = self.row_item if rows is None else self.row_item[rows]
+        weights = self.row_weights if rows is None else self.row_weights[rows]
+        numerator = np.bincount(item_of_row, weights=weights * scores, minlength=n_items)
+        denominator = np.bincount(item_of_row, weights=weights, minlength=n_items)
+        fused = np.full(n_items, -np.inf)
+        np.divide(numerator, denominator, out=fused, where=denominator > 0)
+        return fused
+
+    def search(
+        self,
+        query_embedding: List[float],
+        k: int,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Cosine top-k cocktails. Candidate chunk rows are the whole corpus, or the probed
+        IVF lists when an IVF is loaded, narrowed by the filter bitmaps before any
+        scoring (a small filtered subset is scanned exactly instead of probed).
+        float32 mode scores candidates with one matrix-vector product per segment;
+        int8 mode scans the quantized codes first and rescores a shortlist exactly in
+        float32. Chunk scores are fused per cocktail (its best chunk, or the
+        chunk_weights-weighted mean), then partial selection picks the top-k. For the
+        weighted mean, a probe or shortlist only nominates cocktails: all of their
+        chunk rows are rescored, so the mean never runs over a subset of chunks.
+        Returns (item, score) pairs; scores are exact cosine similarities (fused).
+        """
+        if not self.row_items:
+            return []
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+        if query.shape[0] != self.dimension:
+            raise ValueError(
+                f"Query embedding dimension {query.shape[0]} does not match "
+                f"index dimension {self.dimension}"
+            )
+
+        min_rows = int(k) * self.chunks_per_item
+        allowed = self.filter_rows(filters)
+        if allowed is not None and not len(allowed):
+            return []
+        if allowed is None:
+            candidates = self._probe(query, min_rows)
+            partial = candidates is not None
+        elif (
+            self.inverted_lists is not None
+            and len(allowed) * min(self.nprobe, len(self.centroids)) > len(self.live_rows)
+        ):
+            # Large filtered subset: probe as usual, keep allowed rows, rescan exactly if
+            # too few survive
+            probed = self._probe(query, min_rows)
+            if probed is None:
+                candidates = allowed
+            else:
+                candidates = np.intersect1d(probed, allowed, assume_unique=True)
+            partial = probed is not None
+            if len(candidates) < min_rows:
+                candidates, partial = allowed, False
+        else:
+            candidates, partial = allowed, False
+        if self.quantized is not None:
+            approximate = self._approximate_scores(query, candidates)
+            shortlist_rows = min_rows * self.rerank_factor
+            if candidates is None and self.dead is not None:
+                # Scan dead rows too (no gather copy of the codes) but never shortlist them
+                approximate[self.dead] = -np.inf
+                shortlist_rows = min(shortlist_rows, len(self.live_rows))
+            shortlist = top_k_indices(approximate, shortlist_rows)
+            candidates = shortlist if candidates is None else candidates[shortlist]
+            partial = True
+        if partial and self.chunk_fusion == 'weighted':
+            candidates = self._expand_items(candidates)
+
+        scores = self._exact_scores(query, candidates)
+        fused = self._fuse(candidates, scores)
+        return [
+            (self.row_items[i], float(fused[i]))
+            for i in top_k_indices(fused, k)
+            if np.isfinite(fused[i])
+        ]
+
+    def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        k: int,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """
+        Top-k cocktails for many queries at once: every (filtered) chunk row is scored
+        against every query in a single matrix-matrix product per segment, then fused
+        and selected per query. Always exact float32 (no IVF probe or int8 pass), since
+        one GEMM over all rows beats per-query candidate sets at batch sizes.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        queries = normalize_rows(queries)
+        if not self.row_items or not len(queries):
+            return [[] for _ in range(len(queries))]
+        if queries.shape[1] != self.dimension:
+            raise ValueError(
+                f"Query embedding dimension {queries.shape[1]} does not match "
+                f"index dimension {self.dimension}"
+            )
+
+        candidates = self.filter_rows(filters)
+        if candidates is not None and not len(candidates):
+            return [[] for _ in range(len(queries))]
+        scores = self._exact_scores(queries.T, candidates)  # (rows, queries)
+
+        results = []
+        for column in range(len(queries)):
+            fused = self._fuse(candidates, np.array(scores[:, column]))
+            results.append([
+                (self.row_items[i], float(fused[i]))
+                for i in top_k_indices(fused, k)
+                if np.isfinite(fused[i])
+            ])
+        return results
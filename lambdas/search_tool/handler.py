@@ -10,8 +10,11 @@ import os
 from typing import Dict, Any, List
 from decimal import Decimal
 
+from dynamo_scan import parallel_scan
+
 dynamodb = boto3.resource('dynamodb')
 METADATA_TABLE = os.environ.get('METADATA_TABLE', 'mocktailverse-metadata')
+KEYWORD_SCAN_ATTRIBUTES = ['cocktail_id', 'name', 'category', 'enhanced_metadata', 'alcoholic', 'glass']
 
 
 def lambda_handler(event, context):
@@ -60,9 +63,8 @@ def search_cocktails(query: str, limit: int = 5) -> List[Dict[str, Any]]:
     """
     table = dynamodb.Table(METADATA_TABLE)
     
-    # Scan with filter (simple keyword search)
-    response = table.scan(Limit=limit * 3)
-    items = response.get('Items', [])
+    # Full scan (every page, parallel segments) of just the fields matched and returned
+    items, _ = parallel_scan(table, projection=KEYWORD_SCAN_ATTRIBUTES)
     
     # Filter by query keywords
     query_lower = query.lower()
@@ -0,0 +1,143 @@
+"""
+benchmark_ingest.py — Local throughput benchmark for the ingest Lambda's TheCocktailDB fetch
+Runs a stand-in TheCocktailDB on localhost (fixed per-request latency, occasional
+429s) and times the old one-requests.get-per-drink loop against
+lambdas/ingest/cocktail_fetcher.py, counting the TCP connections each opens.
+
+NOTE: Local stand-in over plain HTTP, so there is no TLS handshake to save here;
+against the real API every avoided connection also saves a handshake round trip.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import importlib.util
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+
+N_DRINKS = int(os.environ.get('BENCH_DRINKS', '100'))
+LATENCY_MS = float(os.environ.get('BENCH_LATENCY_MS', '40'))
+THROTTLE_RATE = float(os.environ.get('BENCH_THROTTLE_RATE', '0.03'))  # share of requests answered 429
+SEED = 7
+
+# Load cocktail_fetcher.py straight from the Lambda directory
+module_path = os.path.join(os.path.dirname(__file__), '../lambdas/ingest/cocktail_fetcher.py')
+spec = importlib.util.spec_from_file_location('cocktail_fetcher', os.path.realpath(module_path))
+cocktail_fetcher = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(cocktail_fetcher)
+
+
+def drink(drink_id: int):
+    return {
+        'idDrink': str(drink_id), 'strDrink': f'Drink {drink_id}', 'strCategory': 'Mocktail',
+        'strAlcoholic': 'Non alcoholic', 'strGlass': 'Highball glass', 'strInstructions': 'Stir.',
+        'strIngredient1': 'Mint', 'strMeasure1': '4 leaves', 'strDrinkThumb': None
+    }
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """filter.php / lookup.php / random.php with LATENCY_MS of service time."""
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+    connections = 0
+    lock = threading.Lock()
+    rng = random.Random(SEED)
+
+    def setup(self):
+        super().setup()
+        with StandIn.lock:
+            StandIn.connections += 1
+
+    def do_GET(self):
+        time.sleep(LATENCY_MS / 1000)
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        with StandIn.lock:
+            throttled = StandIn.rng.random() < THROTTLE_RATE
+        if throttled:
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        endpoint = url.path.rsplit('/', 1)[-1]
+        if endpoint == 'filter.php':
+            body = {'drinks': [{'idDrink': str(i), 'strDrink': f'Drink {i}'} for i in range(N_DRINKS)]}
+        elif endpoint == 'lookup.php':
+            body = {'drinks': [drink(int(params['i'][0]))]}
+        else:
+            body = {'drinks': [drink(StandIn.rng.randrange(N_DRINKS))]}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def sequential(base_url: str, ids):
+    """The previous fetch loop: one requests.get (and connection) per drink, no retries."""
+    drinks = []
+    for drink_id in ids:
+        response = requests.get(f"{base_url}/lookup.php?i={drink_id}")
+        if response.status_code == 200:
+            drinks.append(response.json()['drinks'][0])
+    return drinks
+
+
+def run(name, fetch):
+    StandIn.connections = 0
+    t0 = time.perf_counter()
+    drinks = fetch()
+    elapsed = time.perf_counter() - t0
+    return name, {
+        'drinks': len(drinks),
+        'seconds': round(elapsed, 3),
+        'drinks_per_s': round(len(drinks) / elapsed, 1),
+        'connections': StandIn.connections
+    }
+
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base_url = f"http://127.0.0.1:{server.server_address[1]}/api/json/v1/1"
+ids = [str(i) for i in range(N_DRINKS)]
+print(f"Stand-in: {N_DRINKS} drinks, {LATENCY_MS}ms per request, {THROTTLE_RATE:.0%} answered 429\n")
+
+results = {
+    'drinks': N_DRINKS, 'latency_ms': LATENCY_MS, 'throttle_rate': THROTTLE_RATE,
+    'defaults': {
+        'max_workers': cocktail_fetcher.DEFAULT_MAX_WORKERS,
+        'rate_per_second': cocktail_fetcher.DEFAULT_RATE_PER_SECOND
+    },
+    'runs': {}
+}
+runs = [
+    run('sequential', lambda: sequential(base_url, ids)),
+    run('pooled_w1_uncapped', lambda: cocktail_fetcher.CocktailDBClient(
+        base_url, max_workers=1, rate_per_second=0, backoff_seconds=0.05).lookup_many(ids)),
+    run('pooled_w8_rate10', lambda: cocktail_fetcher.CocktailDBClient(
+        base_url, max_workers=8, rate_per_second=10, backoff_seconds=0.05).lookup_many(ids)),
+    # What the ingest Lambda runs with FETCH_CONCURRENCY / COCKTAILDB_RATE_PER_SECOND unset
+    run('pooled_defaults', lambda: cocktail_fetcher.CocktailDBClient(
+        base_url, backoff_seconds=0.05).lookup_many(ids)),
+    run('pooled_w8_uncapped', lambda: cocktail_fetcher.CocktailDBClient(
+        base_url, max_workers=8, rate_per_second=0, backoff_seconds=0.05).lookup_many(ids)),
+]
+for name, stats in runs:
+    results['runs'][name] = stats
+    print(f"  {name:<20} " + '  '.join(f"{key}={value}" for key, value in stats.items()))
+server.shutdown()
+
+results['note'] = 'local stand-in over HTTP — sequential drops 429s (it never retried); pooled runs retry them'
+out = os.path.join(os.path.dirname(__file__), 'benchmark_ingest_results.json')
+with open(out, 'w') as f:
+    json.dump(results, f, indent=2)
+print(f"\nSaved → scripts/benchmark_ingest_results.json")
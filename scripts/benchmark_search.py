@@ -0,0 +1,178 @@
+"""
+benchmark_search.py — Local recall/latency benchmark for the search Lambda's vector index
+Scores a synthetic clustered corpus with lambdas/search/vector_index.py and compares
+each index mode against the exact float32 path, plus batch-scoring throughput and
+the latency and size of reduced embedding dimensions (EMBEDDING_DIMENSION 256/512
+vs the full 1024).
+
+NOTE: Synthetic vectors, not Titan output. Recall numbers show how much a mode
+loses relative to exact search on this data; re-run on a real index export before
+changing defaults. No recall is reported for reduced dimensions: Titan v2 produces
+256/512-d vectors natively, and truncated synthetic vectors say nothing about how
+well those rank. Measure that on a corpus re-embedded at each size.
+"""
+
+import mmap
+import tracemalloc
+import time
+import json
+import statistics
+import os
+import sys
+import tempfile
+import importlib.util
+
+import numpy as np
+
+CORPUS_SIZE = int(os.environ.get('BENCH_CORPUS_SIZE', '5000'))
+DIMENSION = int(os.environ.get('BENCH_DIMENSION', '1024'))
+N_QUERIES = int(os.environ.get('BENCH_QUERIES', '200'))
+K = 10
+SEED = 7
+
+# Load vector_index.py straight from the Lambda directory
+module_path = os.path.join(os.path.dirname(__file__), '../lambdas/search/vector_index.py')
+spec = importlib.util.spec_from_file_location('vector_index', os.path.realpath(module_path))
+vector_index = importlib.util.module_from_spec(spec)
+sys.modules['vector_index'] = vector_index
+spec.loader.exec_module(vector_index)
+
+# Packing and IVF training live on the embed side
+builder_path = os.path.join(os.path.dirname(__file__), '../lambdas/embed/index_builder.py')
+spec = importlib.util.spec_from_file_location('index_builder', os.path.realpath(builder_path))
+index_builder = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(index_builder)
+
+
+def synthetic_corpus(n: int, dim: int, n_clusters: int = 50):
+    """Clustered Gaussian vectors — closer to real embedding geometry than uniform noise."""
+    rng = np.random.default_rng(SEED)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    corpus = centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    query_labels = rng.integers(0, n_clusters, size=N_QUERIES)
+    queries = centers[query_labels] + 0.6 * rng.normal(size=(N_QUERIES, dim)).astype(np.float32)
+    return corpus, queries
+
+
+def build_cache(corpus: np.ndarray, **kwargs):
+    """CorpusCache over fake items and a packed index artifact (float32 rows + int8 codes)."""
+    items = [{'cocktail_id': f'C{i}', 'embedding_id': f'E{i}'} for i in range(len(corpus))]
+    entries = [{'cocktail_id': f'C{i}', 'embedding_id': f'E{i}', 'chunk_id': 'name_desc'} for i in range(len(corpus))]
+    packed = vector_index.parse_index(index_builder.pack_index(entries, corpus, 'bench', 1, corpus.shape[1]))
+    return vector_index.CorpusCache('bench', items, vector_index.SegmentedIndex([packed]), lambda _: None, **kwargs)
+
+
+def run_mode(cache, queries, exact_ids=None):
+    """Latency percentiles, result ids, and recall@K against exact_ids."""
+    latencies, result_ids = [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        results = cache.search(query, K)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        result_ids.append([item['cocktail_id'] for item, _ in results])
+
+    latencies.sort()
+    stats = {
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(latencies[int(0.95 * len(latencies)) - 1], 3),
+    }
+    if exact_ids is not None:
+        recall = [len(set(got) & set(want)) / K for got, want in zip(result_ids, exact_ids)]
+        stats[f'recall_at_{K}'] = round(statistics.mean(recall), 4)
+    return stats, result_ids
+
+
+corpus, queries = synthetic_corpus(CORPUS_SIZE, DIMENSION)
+print(f"Corpus: {CORPUS_SIZE} x {DIMENSION}, {N_QUERIES} queries, k={K}\n")
+
+results = {'corpus_size': CORPUS_SIZE, 'dimension': DIMENSION, 'queries': N_QUERIES, 'k': K, 'modes': {}}
+
+exact_cache = build_cache(corpus)
+exact_stats, exact_ids = run_mode(exact_cache, queries)
+exact_stats['index_bytes'] = sum(vectors.nbytes for vectors in exact_cache.segment_vectors)
+results['modes']['float32'] = exact_stats
+
+for rerank_factor in (1, 4, 10):
+    cache = build_cache(corpus, index_mode='int8', rerank_factor=rerank_factor)
+    stats, _ = run_mode(cache, queries, exact_ids)
+    stats['scan_bytes'] = sum(quantized.nbytes for quantized in cache.quantized)
+    results['modes'][f'int8_rerank{rerank_factor}'] = stats
+
+t0 = time.perf_counter()
+centroids = vector_index.normalize_rows(index_builder.train_ivf(corpus))
+results['ivf_train_s'] = round(time.perf_counter() - t0, 2)
+results['ivf_lists'] = len(centroids)
+for nprobe in (1, 4, 8, 16):
+    cache = build_cache(corpus, ivf_centroids=centroids, nprobe=nprobe)
+    stats, _ = run_mode(cache, queries, exact_ids)
+    results['modes'][f'ivf_nprobe{nprobe}'] = stats
+
+# Batch scoring: one matrix-matrix product per batch vs one matrix-vector product per query
+results['batch'] = {}
+for batch_size in (1, 8, 32):
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries) - batch_size + 1, batch_size)]
+    t0 = time.perf_counter()
+    for batch in batches:
+        exact_cache.search_batch(batch, K)
+    elapsed = time.perf_counter() - t0
+    results['batch'][f'batch{batch_size}'] = {
+        'queries_per_s': round(len(batches) * batch_size / elapsed, 1),
+        'ms_per_batch': round(elapsed * 1000 / len(batches), 3)
+    }
+
+# Reduced dimensions: scan latency and index size only (see the note above on recall)
+results['dimensions'] = {}
+for dim in (DIMENSION, 512, 256):
+    if dim > DIMENSION:
+        continue
+    cache = build_cache(np.ascontiguousarray(corpus[:, :dim]))
+    stats, _ = run_mode(cache, queries[:, :dim])
+    stats['index_bytes'] = sum(vectors.nbytes for vectors in cache.segment_vectors)
+    results['dimensions'][f'dim{dim}'] = stats
+
+# Memory: a memory-mapped base plus one delta (every 100th cocktail re-embedded), as the
+# search Lambda loads them. heap_bytes is what a corpus cache keeps allocated (numpy
+# allocations traced by tracemalloc), peak_heap_bytes the high-water mark while building
+# it and answering the queries; pages of the mapped artifact are file-backed, not heap.
+entries = [{'cocktail_id': f'C{i}', 'embedding_id': f'E{i}', 'chunk_id': 'name_desc'} for i in range(CORPUS_SIZE)]
+changed = list(range(0, CORPUS_SIZE, 100))
+delta = vector_index.parse_index(index_builder.pack_index(
+    [entries[i] for i in changed], corpus[changed], 'bench', 1, DIMENSION,
+    extra={'segment': 'delta', 'seq': 1, 'tombstones': [f'C{i}' for i in changed]}
+))
+with tempfile.NamedTemporaryFile(suffix='.bin', delete=False) as f:
+    f.write(index_builder.pack_index(entries, corpus, 'bench', 1, DIMENSION))
+with open(f.name, 'rb') as mapped_file:
+    mapped = mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+segments = vector_index.SegmentedIndex([vector_index.parse_index(mapped), delta])
+items = [{'cocktail_id': f'C{i}', 'embedding_id': f'E{i}'} for i in range(CORPUS_SIZE)]
+results['memory'] = {'base_file_bytes': os.path.getsize(f.name), 'delta_rows': len(changed)}
+for mode in ('float32', 'int8'):
+    tracemalloc.start()
+    cache = vector_index.CorpusCache('bench', items, segments, lambda _: None, index_mode=mode)
+    stats, _ = run_mode(cache, queries, exact_ids)
+    stats['heap_bytes'], stats['peak_heap_bytes'] = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results['memory'][f'mapped_{mode}'] = stats
+    del cache
+os.remove(f.name)
+
+for mode, stats in results['modes'].items():
+    print(f"  {mode:<16} " + '  '.join(f"{key}={value}" for key, value in stats.items()))
+for mode, stats in results['batch'].items():
+    print(f"  {mode:<16} " + '  '.join(f"{key}={value}" for key, value in stats.items()))
+for mode, stats in results['dimensions'].items():
+    print(f"  {mode:<16} " + '  '.join(f"{key}={value}" for key, value in stats.items()))
+for mode, stats in results['memory'].items():
+    if isinstance(stats, dict):
+        print(f"  {mode:<16} " + '  '.join(f"{key}={value}" for key, value in stats.items()))
+
+results['note'] = (
+    'local synthetic benchmark — recall is relative to exact float32 search; '
+    'reduced dimensions report latency and size only'
+)
+out = os.path.join(os.path.dirname(__file__), 'benchmark_search_results.json')
+with open(out, 'w') as f:
+    json.dump(results, f, indent=2)
+print(f"\nSaved → scripts/benchmark_search_results.json")
@@ -0,0 +1,72 @@
+"""
+Embedding executor: which Bedrock failures are retried, and that retries recover the text.
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+from botocore.exceptions import (
+    ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError
+)
+
+LAMBDAS = os.path.join(os.path.dirname(__file__), '..', 'lambdas')
+
+
+def load_module(name: str, path: str):
+    """Load a Lambda module straight from its directory (each Lambda is deployed on its own)."""
+    spec = importlib.util.spec_from_file_location(name, os.path.realpath(os.path.join(LAMBDAS, path)))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+embedding_executor = load_module('embedding_executor', 'embed/embedding_executor.py')
+
+ENDPOINT = 'https://bedrock-runtime.us-west-2.amazonaws.com'
+
+
+def client_error(code: str, status: int) -> ClientError:
+    return ClientError(
+        {'Error': {'Code': code, 'Message': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}, 'InvokeModel'
+    )
+
+
+@pytest.mark.parametrize('error', [
+    EndpointConnectionError(endpoint_url=ENDPOINT),
+    ConnectTimeoutError(endpoint_url=ENDPOINT),
+    ConnectionClosedError(endpoint_url=ENDPOINT),
+    ReadTimeoutError(endpoint_url=ENDPOINT),
+    client_error('ThrottlingException', 429),
+    client_error('ServiceUnavailableException', 503),
+    client_error('InternalFailure', 500),
+])
+def test_transient_errors(error):
+    assert embedding_executor.is_transient(error)
+
+
+@pytest.mark.parametrize('error', [
+    client_error('ValidationException', 400),
+    client_error('AccessDeniedException', 403),
+    ValueError('bad response body'),
+])
+def test_permanent_errors(error):
+    assert not embedding_executor.is_transient(error)
+
+
+def test_network_errors_are_retried():
+    failures = {'a': [ReadTimeoutError(endpoint_url=ENDPOINT), ConnectionClosedError(endpoint_url=ENDPOINT)]}
+
+    def embed(text):
+        if failures.get(text):
+            raise failures[text].pop(0)
+        return [float(len(text))]
+
+    limiter = embedding_executor.AdaptiveRateLimiter(rate=1000, burst=10)
+    executor = embedding_executor.EmbeddingExecutor(embed, limiter, max_workers=2, backoff_base_seconds=0)
+    assert executor.embed_all(['a', 'bb']) == [[1.0], [2.0]]
+    assert executor.errors == {}
+    assert executor.stats['retries'] == 2
+    assert executor.stats['throttles'] == 0
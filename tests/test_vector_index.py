@@ -0,0 +1,93 @@
+"""
+Search-side vector index: approximate modes must still return exact fused scores.
+"""
+
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+
+LAMBDAS = os.path.join(os.path.dirname(__file__), '..', 'lambdas')
+
+
+def load_module(name: str, path: str):
+    """Load a Lambda module straight from its directory (each Lambda is deployed on its own)."""
+    spec = importlib.util.spec_from_file_location(name, os.path.realpath(os.path.join(LAMBDAS, path)))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+vector_index = load_module('vector_index', 'search/vector_index.py')
+index_builder = load_module('index_builder', 'embed/index_builder.py')
+
+CHUNKS = ('name_desc', 'recipe', 'flavor')
+WEIGHTS = {'name_desc': 2.0, 'recipe': 1.0, 'flavor': 0.5}
+K = 10
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    """Clustered chunk vectors: 400 cocktails x 3 chunks, each chunk near a different center."""
+    rng = np.random.default_rng(3)
+    centers = rng.normal(size=(20, 32))
+    labels = rng.integers(0, len(centers), size=(400, len(CHUNKS)))
+    vectors = (centers[labels] + 0.5 * rng.normal(size=labels.shape + (32,))).reshape(-1, 32)
+    entries = [
+        {'cocktail_id': f'C{i}', 'embedding_id': f'E{i}', 'chunk_id': chunk}
+        for i in range(400) for chunk in CHUNKS
+    ]
+    packed = vector_index.parse_index(index_builder.pack_index(entries, vectors, 'test', 1, 32))
+    items = [{'cocktail_id': f'C{i}', 'embedding_id': f'E{i}'} for i in range(400)]
+    queries = centers[rng.integers(0, len(centers), size=25)] + 0.5 * rng.normal(size=(25, 32))
+    return vector_index.SegmentedIndex([packed]), items, vector_index.normalize_rows(vectors), queries
+
+
+def exact_weighted(rows: np.ndarray, query: np.ndarray) -> dict:
+    """Brute-force weighted-mean fused score of every cocktail."""
+    scores = (rows @ vector_index.normalize_rows(query)).reshape(-1, len(CHUNKS))
+    weights = np.array([WEIGHTS[chunk] for chunk in CHUNKS])
+    return {f'C{i}': float(value) for i, value in enumerate(scores @ weights / weights.sum())}
+
+
+@pytest.mark.parametrize('options, min_overlap', [
+    ({'index_mode': 'int8'}, 0.9),
+    ({'index_mode': 'int8', 'rerank_factor': 1}, 0.0),  # tiny shortlist: only scores are checked
+    ({'ivf': True, 'nprobe': 2}, 0.9),
+    ({'ivf': True, 'nprobe': 2, 'index_mode': 'int8'}, 0.9),
+])
+def test_weighted_fusion_scores_are_exact(corpus, options, min_overlap):
+    segments, items, rows, queries = corpus
+    options = dict(options)
+    if options.pop('ivf', False):
+        options['ivf_centroids'] = vector_index.normalize_rows(index_builder.train_ivf(rows, nlist=16))
+    cache = vector_index.CorpusCache(
+        'v', items, segments, lambda _: None, chunk_fusion='weighted', chunk_weights=WEIGHTS, **options
+    )
+    exact_cache = vector_index.CorpusCache(
+        'v', items, segments, lambda _: None, chunk_fusion='weighted', chunk_weights=WEIGHTS
+    )
+    overlap = []
+    for query in queries:
+        truth = exact_weighted(rows, query)
+        results = cache.search(query, K)
+        assert len(results) == K
+        for item, score in results:
+            assert score == pytest.approx(truth[item['cocktail_id']], abs=1e-5)
+        exact_ids = {item['cocktail_id'] for item, _ in exact_cache.search(query, K)}
+        overlap.append(len(exact_ids & {item['cocktail_id'] for item, _ in results}) / K)
+    assert np.mean(overlap) >= min_overlap
+
+
+def test_exact_scan_matches_brute_force(corpus):
+    segments, items, rows, queries = corpus
+    cache = vector_index.CorpusCache(
+        'v', items, segments, lambda _: None, chunk_fusion='weighted', chunk_weights=WEIGHTS
+    )
+    for query in queries[:5]:
+        truth = exact_weighted(rows, query)
+        expected = sorted(truth, key=truth.get, reverse=True)[:K]
+        assert [item['cocktail_id'] for item, _ in cache.search(query, K)] == expected